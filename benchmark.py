@@ -0,0 +1,511 @@
+""" Module with benchmarks of the run time of different parts of the record
+    linkage software, to be run from the command line as:
+
+      python benchmark.py <benchmark name> [<size>]
+
+    Without a benchmark name the list of available benchmarks is printed.
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import os
+import random
+import sys
+import tempfile
+import time
+
+import blocking
+import comparison
+import loadDataset
+
+# Data set used to generate synthetic data for the benchmarks
+#
+sample_file_name = 'assignment-data/data_wrangling_rl1.csv'
+
+sample_attr_list = [1, 2, 3, 4, 6, 7, 8, 9, 10, 11, 12]
+
+# Second data set of the default linkage configuration (see recordLinkage)
+#
+sample_file_name2 = 'assignment-data/data_wrangling_rl2.csv'
+
+# -----------------------------------------------------------------------------
+
+def _time_funct(funct, *args):
+  """Run the given function with the given arguments and return a tuple with
+     the run time in seconds and the function result.
+  """
+
+  start_time = time.time()
+  result = funct(*args)
+
+  return time.time() - start_time, result
+
+# -----------------------------------------------------------------------------
+
+def write_synthetic_data_set(file_name, num_rec):
+  """Write a synthetic data set with the given number of records into a CSV
+     file, by sampling records from the sample data set and giving them new
+     unique record identifiers.
+  """
+
+  with open(sample_file_name) as in_f:
+    header_line = in_f.readline()
+    sample_line_list = [line.split(',', 1)[1] for line in in_f]
+
+  rand = random.Random(42)
+
+  with open(file_name, 'w') as out_f:
+    out_f.write(header_line)
+
+    for rec_num in range(num_rec):
+      out_f.write('s%d,%s' % (rec_num, rand.choice(sample_line_list)))
+
+# -----------------------------------------------------------------------------
+
+def bench_parallel_loading(num_rec=5000000):
+  """Compare the run time of load_data_set() with load_data_set_parallel()
+     for increasing numbers of worker processes on a synthetic data set.
+  """
+
+  tmp_f = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+  tmp_f.close()
+
+  try:
+    print('Write synthetic data set with %d records' % (num_rec))
+    write_synthetic_data_set(tmp_f.name, num_rec)
+
+    load_time, rec_dict = _time_funct(loadDataset.load_data_set, tmp_f.name,
+                                      0, sample_attr_list, True)
+    print('  load_data_set():                       %7.2f sec' % (load_time))
+
+    num_workers = 1
+    while (num_workers <= (os.cpu_count() or 1)):
+      par_load_time, par_rec_dict = _time_funct( \
+                        loadDataset.load_data_set_parallel, tmp_f.name, 0,
+                        sample_attr_list, True, num_workers)
+      assert par_rec_dict == rec_dict
+
+      print('  load_data_set_parallel(), %2d workers: %7.2f sec (speed-up ' \
+            '%.2f)' % (num_workers, par_load_time, load_time / par_load_time))
+
+      del par_rec_dict
+      num_workers *= 2
+
+  finally:
+    os.remove(tmp_f.name)
+
+# -----------------------------------------------------------------------------
+
+def _soundex_loop(attr_val):
+  """Soundex encoding as originally done inside blocking.phoneticBlocking(),
+     used as reference for blocking.soundex().
+  """
+
+  if (attr_val == ''):
+    return 'z000'
+
+  attr_val = attr_val.lower()
+
+  sndx_val = attr_val[0]  # Keep first letter
+
+  for c in attr_val[1:]:  # Loop over all other letters
+
+    if (c in 'aehiouwy'):  # Not inlcuded into Soundex code
+      pass
+    elif (c in 'bfpv'):
+      if (sndx_val[-1] != '1'):  # Don't add duplicates of digits
+        sndx_val += '1'
+    elif (c in 'cgjkqsxz'):
+      if (sndx_val[-1] != '2'):  # Don't add duplicates of digits
+        sndx_val += '2'
+    elif (c in 'dt'):
+      if (sndx_val[-1] != '3'):  # Don't add duplicates of digits
+        sndx_val += '3'
+    elif (c in 'l'):
+      if (sndx_val[-1] != '4'):  # Don't add duplicates of digits
+        sndx_val += '4'
+    elif (c in 'mn'):
+      if (sndx_val[-1] != '5'):  # Don't add duplicates of digits
+        sndx_val += '5'
+    elif (c in 'r'):
+      if (sndx_val[-1] != '6'):  # Don't add duplicates of digits
+        sndx_val += '6'
+
+  if (len(sndx_val) < 4):
+    sndx_val += '000'  # Ensure enough digits
+
+  return sndx_val[:4]  # Maximum length is 4
+
+# -----------------------------------------------------------------------------
+
+def bench_soundex(num_names=1000000):
+  """Compare the run time of the original Soundex encoding loop with
+     blocking.soundex() on names sampled from the sample data set.
+  """
+
+  rec_dict = loadDataset.load_data_set(sample_file_name, 0, [1, 3], True)
+
+  name_list = [rec_values[attr] for rec_values in rec_dict.values() \
+                                for attr in [1, 3]]
+
+  rand = random.Random(42)
+  name_list = [rand.choice(name_list) for i in range(num_names)]
+
+  print('Soundex encoding of %d names (%d distinct)' % \
+        (num_names, len(set(name_list))))
+
+  loop_time, loop_code_list = _time_funct(lambda: [_soundex_loop(name) for \
+                                                   name in name_list])
+  print('  Original loop:              %6.2f sec' % (loop_time))
+
+  blocking.soundex.cache_clear()
+  sndx_time, sndx_code_list = _time_funct(lambda: [blocking.soundex(name) \
+                                                   for name in name_list])
+  print('  blocking.soundex():         %6.2f sec (speed-up %.2f)' % \
+        (sndx_time, loop_time / sndx_time))
+  assert sndx_code_list == loop_code_list
+
+  soundex_no_cache = blocking.soundex.__wrapped__
+  table_time, table_code_list = _time_funct(lambda: [soundex_no_cache(name) \
+                                                     for name in name_list])
+  print('  Without cache:              %6.2f sec (speed-up %.2f)' % \
+        (table_time, loop_time / table_time))
+  assert table_code_list == loop_code_list
+
+# -----------------------------------------------------------------------------
+
+def bench_parallel_comparison(num_blocks=1000):
+  """Compare the run time of comparison.compareBlocks() with
+     comparison.compareBlocksParallel() for increasing numbers of worker
+     processes, on the given number of Soundex surname blocks of the sample
+     data set.
+  """
+
+  rec_dict = loadDataset.load_data_set(sample_file_name, 0, sample_attr_list,
+                                       True)
+
+  block_dict = blocking.phoneticBlocking(rec_dict, [3])
+  block_dict = dict(list(block_dict.items())[:num_blocks])
+
+  attr_comp_list = [(comparison.jaro_winkler_comp, 1, 1),
+                    (comparison.jaro_winkler_comp, 3, 3),
+                    (comparison.bag_dist_sim_comp, 7, 7),
+                    (comparison.edit_dist_sim_comp, 8, 8)]
+
+  print('Compare %d record pairs' % \
+        (blocking._numBlockPairs(block_dict, block_dict)))
+
+  comp_time, sim_vec_dict = _time_funct(comparison.compareBlocks, block_dict,
+                                        block_dict, rec_dict, rec_dict,
+                                        attr_comp_list)
+  print('  compareBlocks():                       %7.2f sec' % (comp_time))
+
+  num_workers = 1
+  while (num_workers <= (os.cpu_count() or 1)):
+    par_comp_time, par_sim_vec_dict = _time_funct( \
+                      comparison.compareBlocksParallel, block_dict, block_dict,
+                      rec_dict, rec_dict, attr_comp_list, num_workers)
+    assert par_sim_vec_dict == sim_vec_dict
+
+    print('  compareBlocksParallel(), %2d workers:  %7.2f sec (speed-up ' \
+          '%.2f)' % (num_workers, par_comp_time, comp_time / par_comp_time))
+
+    num_workers *= 2
+
+# -----------------------------------------------------------------------------
+
+def _compare_blocks_per_pair(blockA_dict, blockB_dict, recA_dict, recB_dict,
+                             attr_comp_list):
+  """Compare the record pairs of the given blocks one pair at a time with
+     comparison.compareRecord(), as originally done by
+     comparison.compareBlocks(), used as reference for it.
+  """
+
+  sim_vec_dict = {}
+
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+    if (block_bkv in blockB_dict):
+      rec_idB_list = blockB_dict[block_bkv]
+
+      for rec_idA in rec_idA_list:
+        recA = recA_dict[rec_idA]
+        for rec_idB in rec_idB_list:
+          sim_vec_dict[(rec_idA, rec_idB)] = comparison.compareRecord(recA,
+                                               recB_dict[rec_idB],
+                                               attr_comp_list)
+
+  return sim_vec_dict
+
+def bench_default_comparison(num_repeats=3):
+  """Compare the run time of comparison.compareBlocks() with comparing one
+     record pair at a time, on the blocks of the default linkage
+     configuration (Soundex blocking on last name, street address and
+     suburb), for each comparison function on its own and for the default
+     list of comparison functions. The fastest of the given number of runs
+     is reported, and a speed-up below 1.0 is a regression.
+  """
+
+  recA_dict = loadDataset.load_data_set(sample_file_name, 0, sample_attr_list,
+                                        True)
+  recB_dict = loadDataset.load_data_set(sample_file_name2, 0,
+                                        sample_attr_list, True)
+
+  blockA_dict = blocking.phoneticBlocking(recA_dict, [3, 7, 8])
+  blockB_dict = blocking.phoneticBlocking(recB_dict, [3, 7, 8])
+
+  print('Compare %d record pairs' % \
+        (blocking._numBlockPairs(blockA_dict, blockB_dict)))
+
+  comp_attr_list = [1, 2, 3, 7, 8, 10]
+
+  default_funct_list = [comparison.bag_dist_sim_comp,
+                        comparison.jaro_winkler_comp,
+                        comparison.jaro_winkler_comp,
+                        comparison.bag_dist_sim_comp,
+                        comparison.bag_dist_sim_comp,
+                        comparison.bag_dist_sim_comp]
+
+  comp_config_list = [(comp_funct.__name__, [comp_funct] * \
+                       len(comp_attr_list)) for comp_funct in \
+                      [comparison.exact_comp, comparison.jaccard_comp,
+                       comparison.dice_comp, comparison.jaro_winkler_comp,
+                       comparison.bag_dist_sim_comp,
+                       comparison.edit_dist_sim_comp]]
+  comp_config_list.append(('default', default_funct_list))
+
+  for (config_name, funct_list) in comp_config_list:
+    attr_comp_list = [(comp_funct, attr, attr) for (comp_funct, attr) in \
+                      zip(funct_list, comp_attr_list)]
+
+    ref_time_list = []
+    comp_time_list = []
+
+    for repeat_num in range(num_repeats):
+      ref_time, ref_sim_vec_dict = _time_funct(_compare_blocks_per_pair,
+                                               blockA_dict, blockB_dict,
+                                               recA_dict, recB_dict,
+                                               attr_comp_list)
+      comp_time, sim_vec_dict = _time_funct(comparison.compareBlocks,
+                                            blockA_dict, blockB_dict,
+                                            recA_dict, recB_dict,
+                                            attr_comp_list)
+      assert sim_vec_dict == ref_sim_vec_dict
+
+      ref_time_list.append(ref_time)
+      comp_time_list.append(comp_time)
+
+    print('  %-18s per pair: %6.3f sec, compareBlocks(): %6.3f sec ' \
+          '(speed-up %.2f)' % (config_name, min(ref_time_list),
+          min(comp_time_list), min(ref_time_list) / min(comp_time_list)))
+
+# -----------------------------------------------------------------------------
+
+def _edit_dist_sim_dp(val1, val2):
+  """Edit distance similarity as originally calculated by
+     comparison.edit_dist_sim_comp(), with the full edit matrix, used as
+     reference for the bit-parallel edit distance.
+  """
+
+  if (len(val1) == 0) or (len(val2) == 0):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  edit_dist = comparison._edit_dist_dp(val1, val2)
+
+  return 1.0 - float(edit_dist) / float(max(len(val1), len(val2)))
+
+def bench_edit_distance(num_pairs=100000):
+  """Compare the run times of the edit matrix and the bit-parallel edit
+     distance on pairs of addresses sampled from the sample data set (their
+     equivalence on random values is tested in test_comparison.py).
+  """
+
+  rand = random.Random(42)
+
+  rec_dict = loadDataset.load_data_set(sample_file_name, 0, [7], True)
+
+  addr_list = [rec_values[7] for rec_values in rec_dict.values()]
+
+  addr_list1 = [rand.choice(addr_list) for i in range(num_pairs)]
+  addr_list2 = [rand.choice(addr_list) for i in range(num_pairs)]
+
+  print('Edit distance similarity of %d address pairs' % (num_pairs))
+
+  dp_time, dp_sim_list = _time_funct(lambda: [_edit_dist_sim_dp(val1, val2) \
+                              for (val1, val2) in zip(addr_list1, addr_list2)])
+  print('  Edit matrix:                      %6.2f sec' % (dp_time))
+
+  bit_time, bit_sim_list = _time_funct(lambda: \
+                              [comparison.edit_dist_sim_comp(val1, val2) \
+                               for (val1, val2) in zip(addr_list1, addr_list2)])
+  print('  edit_dist_sim_comp():             %6.2f sec (speed-up %.2f)' % \
+        (bit_time, dp_time / bit_time))
+  assert bit_sim_list == dp_sim_list
+
+  batch_time, batch_sim_array = _time_funct( \
+                              comparison.edit_dist_sim_comp_batch, addr_list1,
+                              addr_list2)
+  print('  edit_dist_sim_comp_batch():       %6.2f sec (speed-up %.2f)' % \
+        (batch_time, dp_time / batch_time))
+  assert batch_sim_array.tolist() == dp_sim_list
+
+# -----------------------------------------------------------------------------
+
+def _jaro_comp_slicing(val1, val2):
+  """Jaro similarity as originally calculated by comparison.jaro_comp(),
+     marking assigned characters by rebuilding strings, used as reference for
+     comparison.jaro_comp().
+  """
+
+  if (val1 == '') or (val2 == ''):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  len1 = len(val1)
+  len2 = len(val2)
+
+  halflen = int(max(len1, len2) / 2) - 1
+
+  assingment1 = ''  # Characters assigned in val1
+  assingment2 = ''  # Characters assigned in val2
+
+  workstr1 = val1
+  workstr2 = val2
+
+  common1 = 0
+  common2 = 0
+
+  for i in range(len1):
+    start = max(0, i - halflen)
+    end   = min(i + halflen + 1, len2)
+    index = workstr2.find(val1[i], start, end)
+    if (index > -1):
+      common1 += 1
+      assingment1 = assingment1 + val1[i]
+      workstr2 = workstr2[:index] + comparison.JARO_MARKER_CHAR + \
+                 workstr2[index+1:]
+
+  for i in range(len2):
+    start = max(0, i - halflen)
+    end   = min(i + halflen + 1, len1)
+    index = workstr1.find(val2[i], start, end)
+    if (index > -1):
+      common2 += 1
+      assingment2 = assingment2 + val2[i]
+      workstr1 = workstr1[:index] + comparison.JARO_MARKER_CHAR + \
+                 workstr1[index+1:]
+
+  if (common1 != common2):
+    common1 = float(common1 + common2) / 2.0
+
+  if (common1 == 0):
+    return 0.0
+
+  transposition = 0
+
+  for i in range(len(assingment1)):
+    if (assingment1[i] != assingment2[i]):
+      transposition += 1
+  transposition = transposition / 2.0
+
+  common1 = float(common1)
+
+  return 1./3.*(common1 / float(len1) + common1 / float(len2) + \
+           (common1 - transposition) / common1)
+
+def _jaro_winkler_comp_slicing(val1, val2):
+  """Jaro-Winkler similarity as originally calculated by
+     comparison.jaro_winkler_comp(), comparing prefixes by slicing, used as
+     reference for comparison.jaro_winkler_comp().
+  """
+
+  if (val1 == '') or (val2 == ''):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  jaro_sim = _jaro_comp_slicing(val1, val2)
+  if (jaro_sim == 0):
+    return 0.0
+
+  minlen = min(len(val1), len(val2))
+
+  for i in range(1, minlen + 1):
+    if (val1[:i] != val2[:i]):
+      break
+  i -= 1
+
+  if (i > 4):
+    i = 4
+
+  return jaro_sim + i * 0.1 * (1.0 - jaro_sim)
+
+def bench_jaro(num_pairs=100000):
+  """Compare the run times of the original implementations of the Jaro and
+     Jaro-Winkler similarities with comparison.jaro_comp() and
+     comparison.jaro_winkler_comp() on pairs of names sampled from the sample
+     data set (their equivalence on random values is tested in
+     test_comparison.py).
+  """
+
+  rand = random.Random(42)
+
+  rec_dict = loadDataset.load_data_set(sample_file_name, 0, [1, 3], True)
+
+  name_list = [rec_values[attr] for rec_values in rec_dict.values() \
+                                for attr in [1, 3]]
+
+  name_list1 = [rand.choice(name_list) for i in range(num_pairs)]
+  name_list2 = [rand.choice(name_list) for i in range(num_pairs)]
+
+  print('Jaro and Jaro-Winkler similarity of %d name pairs' % (num_pairs))
+
+  for (comp_name, ref_comp_funct, comp_funct, batch_comp_funct) in \
+      [('jaro_comp', _jaro_comp_slicing, comparison.jaro_comp,
+        comparison.jaro_comp_batch),
+       ('jaro_winkler_comp', _jaro_winkler_comp_slicing,
+        comparison.jaro_winkler_comp, comparison.jaro_winkler_comp_batch)]:
+
+    ref_time, ref_sim_list = _time_funct(lambda: [ref_comp_funct(val1, val2) \
+                              for (val1, val2) in zip(name_list1, name_list2)])
+    print('  Original %s():     %6.2f sec' % (comp_name, ref_time))
+
+    comp_time, sim_list = _time_funct(lambda: [comp_funct(val1, val2) \
+                              for (val1, val2) in zip(name_list1, name_list2)])
+    print('  %s():              %6.2f sec (speed-up %.2f)' % \
+          (comp_name, comp_time, ref_time / comp_time))
+    assert sim_list == ref_sim_list
+
+    batch_time, sim_array = _time_funct(batch_comp_funct, name_list1,
+                                        name_list2)
+    print('  %s_batch():        %6.2f sec (speed-up %.2f)' % \
+          (comp_name, batch_time, ref_time / batch_time))
+    assert sim_array.tolist() == ref_sim_list
+
+# -----------------------------------------------------------------------------
+
+benchmark_dict = {'comparison': bench_parallel_comparison,
+                  'default_comparison': bench_default_comparison,
+                  'edit_dist':  bench_edit_distance,
+                  'jaro':       bench_jaro,
+                  'loading':    bench_parallel_loading,
+                  'soundex':    bench_soundex}
+
+if (__name__ == '__main__'):
+
+  if (len(sys.argv) < 2) or (sys.argv[1] not in benchmark_dict):
+    print('Usage: python benchmark.py <benchmark name> [<size>]')
+    print('  Available benchmarks: %s' % (', '.join(sorted(benchmark_dict))))
+    sys.exit(1)
+
+  if (len(sys.argv) > 2):
+    benchmark_dict[sys.argv[1]](int(sys.argv[2]))
+  else:
+    benchmark_dict[sys.argv[1]]()
+
+# -----------------------------------------------------------------------------
+
+# End of program.
@@ -3,6 +3,68 @@
     as keys and values being sets or lists of record identifiers in that block.
 """
 
+# =============================================================================
+# Import necessary modules
+
+import array
+import bisect
+import collections
+import collections.abc
+import csv
+import functools
+import gzip
+import json
+import math
+import os
+import random
+import zlib
+
+# =============================================================================
+# Phonetic encoding of attribute values
+
+class _SoundexTable(dict):
+  """Translation table for str.translate() that maps letters to their Soundex
+     digits and removes all other characters (including any character that
+     is not in the table).
+  """
+
+  def __missing__(self, key):
+    return None
+
+SOUNDEX_TABLE = _SoundexTable((c, None) for c in range(128))
+for (digit, letters) in [('1', 'bfpv'), ('2', 'cgjkqsxz'), ('3', 'dt'),
+                         ('4', 'l'), ('5', 'mn'), ('6', 'r')]:
+  for c in letters:
+    SOUNDEX_TABLE[ord(c)] = digit
+
+SOUNDEX_CACHE_SIZE = 1<<16  # Maximum number of remembered Soundex codes
+
+@functools.lru_cache(maxsize=SOUNDEX_CACHE_SIZE)
+def soundex(val):
+  """Return the Soundex code of the given attribute value, which is the
+     first letter of the value followed by three digits, or 'z000' for an
+     empty value.
+
+     The codes of the most recently encoded values are remembered, so that
+     frequent values (such as common surnames) are only encoded once.
+  """
+
+  if (val == ''):
+    return 'z000'  # Often used as Soundex code for empty values
+
+  val = val.lower()
+
+  sndx_val = val[0]  # Keep first letter
+
+  for digit in val[1:].translate(SOUNDEX_TABLE):
+    if (sndx_val[-1] != digit):  # Don't add duplicates of digits
+      sndx_val += digit
+
+      if (len(sndx_val) == 4):  # Maximum length is 4
+        return sndx_val
+
+  return (sndx_val + '000')[:4]  # Ensure enough digits
+
 # =============================================================================
 
 def noBlocking(rec_dict):
@@ -26,6 +88,27 @@ def noBlocking(rec_dict):
 
 # -----------------------------------------------------------------------------
 
+def simpleBlockingKey(rec_values, blk_attr_list):
+  """Return the blocking key value of simple blocking for the given record,
+     which is the concatenation of the values of the blocking attributes.
+
+     Parameter Description:
+       rec_values    : List of the values of the record
+       blk_attr_list : List of blocking key attributes to use
+  """
+
+  rec_bkv = ''  # Initialise the blocking key value for this record
+
+  # Process selected blocking attributes
+  #
+  for attr in blk_attr_list:
+    attr_val = rec_values[attr]
+    rec_bkv += attr_val
+
+  return rec_bkv
+
+# -----------------------------------------------------------------------------
+
 def simpleBlocking(rec_dict, blk_attr_list):
   """Build the blocking index data structure (dictionary) to store blocking
      key values (BKV) as keys and the corresponding list of record identifiers.
@@ -64,13 +147,7 @@ def simpleBlocking(rec_dict, blk_attr_list):
 
   for (rec_id, rec_values) in rec_dict.items():
 
-    rec_bkv = ''  # Initialise the blocking key value for this record
-
-    # Process selected blocking attributes
-    #
-    for attr in blk_attr_list:
-      attr_val = rec_values[attr]
-      rec_bkv += attr_val
+    rec_bkv = simpleBlockingKey(rec_values, blk_attr_list)
 
     # Insert the blocking key value and record into blocking dictionary
     #
@@ -93,6 +170,29 @@ def simpleBlocking(rec_dict, blk_attr_list):
 
 # -----------------------------------------------------------------------------
 
+def phoneticBlockingKey(rec_values, blk_attr_list):
+  """Return the blocking key value of phonetic blocking for the given record,
+     which is the concatenation of the Soundex encoded values of the blocking
+     attributes.
+
+     Parameter Description:
+       rec_values    : List of the values of the record
+       blk_attr_list : List of blocking key attributes to use
+  """
+
+  rec_bkv = ''  # Initialise the blocking key value for this record
+
+  # Process selected blocking attributes
+  #
+  for attr in blk_attr_list:
+    attr_val = rec_values[attr]
+
+    rec_bkv += soundex(attr_val)
+
+  return rec_bkv
+
+# -----------------------------------------------------------------------------
+
 def phoneticBlocking(rec_dict, blk_attr_list):
   """Build the blocking index data structure (dictionary) to store blocking
      key values (BKV) as keys and the corresponding list of record identifiers.
@@ -118,51 +218,7 @@ def phoneticBlocking(rec_dict, blk_attr_list):
 
   for (rec_id, rec_values) in rec_dict.items():
 
-    rec_bkv = ''  # Initialise the blocking key value for this record
-
-    # Process selected blocking attributes
-    #
-    for attr in blk_attr_list:
-      attr_val = rec_values[attr]
-
-      if (attr_val == ''):
-        rec_bkv += 'z000'  # Often used as Soundex code for empty values
-
-      else:  # Convert the value into its Soundex code
-
-        attr_val = attr_val.lower()
-
-        sndx_val = attr_val[0]  # Keep first letter
-
-        for c in attr_val[1:]:  # Loop over all other letters
-
-          if (c in 'aehiouwy'):  # Not inlcuded into Soundex code
-            pass
-          elif (c in 'bfpv'):
-            if (sndx_val[-1] != '1'):  # Don't add duplicates of digits
-              sndx_val += '1'
-          elif (c in 'cgjkqsxz'):
-            if (sndx_val[-1] != '2'):  # Don't add duplicates of digits
-              sndx_val += '2'
-          elif (c in 'dt'):
-            if (sndx_val[-1] != '3'):  # Don't add duplicates of digits
-              sndx_val += '3'
-          elif (c in 'l'):
-            if (sndx_val[-1] != '4'):  # Don't add duplicates of digits
-              sndx_val += '4'
-          elif (c in 'mn'):
-            if (sndx_val[-1] != '5'):  # Don't add duplicates of digits
-              sndx_val += '5'
-          elif (c in 'r'):
-            if (sndx_val[-1] != '6'):  # Don't add duplicates of digits
-              sndx_val += '6'
-
-        if (len(sndx_val) < 4):
-          sndx_val += '000'  # Ensure enough digits
-
-        sndx_val = sndx_val[:4]  # Maximum length is 4
-
-        rec_bkv += sndx_val
+    rec_bkv = phoneticBlockingKey(rec_values, blk_attr_list)
 
     # Insert the blocking key value and record into blocking dictionary
     #
@@ -185,6 +241,85 @@ def phoneticBlocking(rec_dict, blk_attr_list):
 
 # -----------------------------------------------------------------------------
 
+def slkBlockingKey(rec_values, fam_name_attr_ind, giv_name_attr_ind,
+                   dob_attr_ind, gender_attr_ind):
+  """Return the statistical linkage key (SLK-581) of the given record, as
+     used as blocking key value by SLK-581 blocking (see slkBlocking() for a
+     description of the key and the parameters).
+  """
+
+  rec_bkv = ''  # Initialise the blocking key value for this record
+
+  # Get family name value
+  #
+  fam_name = rec_values[fam_name_attr_ind]
+
+  if (fam_name == ''):
+    rec_bkv += '999'
+  else:
+    fam_name = fam_name.replace('-','')  # Remove non letter characters
+    fam_name = fam_name.replace(",",'')
+    fam_name = fam_name.replace('_','')
+
+    if (len(fam_name) >= 5):
+      rec_bkv += (fam_name[1]+fam_name[2]+fam_name[4])
+    elif (len(fam_name) >= 3):
+      rec_bkv += (fam_name[1]+fam_name[2]+'2')
+    elif (len(fam_name) >= 2):
+      rec_bkv += (fam_name[1]+'22')
+
+  # Get given name value
+  #
+  giv_name = rec_values[giv_name_attr_ind]
+
+  if (giv_name == ''):
+    rec_bkv += '99'
+  else:
+    giv_name = giv_name.replace('-','')  # Remove non letter characters
+    giv_name = giv_name.replace(",",'')
+    giv_name = giv_name.replace('_','')
+
+    if (len(giv_name) >= 3):
+      rec_bkv += (giv_name[1]+giv_name[2])
+    elif (len(giv_name) >= 2):
+      rec_bkv += (giv_name[1]+'2')
+
+  # DoB structure we use: dd/mm/yyyy
+
+  # Get date of birth
+  #
+  dob = rec_values[dob_attr_ind]
+
+  dob_list = rec_values[dob_attr_ind].split('/')
+
+  # Add some checks
+  #
+  if (len(dob_list[0]) < 2):
+    dob_list[0] = '0' + dob_list[0]  # Add leading zero for days < 10
+  if (len(dob_list[1]) < 2):
+    dob_list[1] = '0' + dob_list[1]  # Add leading zero for months < 10
+
+  dob = ''.join(dob_list)  # Create: ddmmyyyy
+
+  assert len(dob) == 8, dob
+
+  rec_bkv += dob
+
+  # Get gender
+  #
+  gender = rec_values[gender_attr_ind].lower()
+
+  if (gender == 'm'):
+    rec_bkv += '1'
+  elif (gender == 'f'):
+    rec_bkv += '2'
+  else:
+    rec_bkv += '9'
+
+  return rec_bkv
+
+# -----------------------------------------------------------------------------
+
 def slkBlocking(rec_dict, fam_name_attr_ind, giv_name_attr_ind,
                 dob_attr_ind, gender_attr_ind):
   """Build the blocking index data structure (dictionary) to store blocking
@@ -225,130 +360,1493 @@ def slkBlocking(rec_dict, fam_name_attr_ind, giv_name_attr_ind,
 
   for (rec_id, rec_values) in rec_dict.items():
 
-    rec_bkv = ''  # Initialise the blocking key value for this record
+    rec_bkv = slkBlockingKey(rec_values, fam_name_attr_ind, giv_name_attr_ind,
+                             dob_attr_ind, gender_attr_ind)
 
-    # Get family name value
+    # Insert the blocking key value and record into blocking dictionary
     #
-    fam_name = rec_values[fam_name_attr_ind]
+    if (rec_bkv in block_dict): # Block key value in block index
 
-    if (fam_name == ''):
-      rec_bkv += '999'
-    else:
-      fam_name = fam_name.replace('-','')  # Remove non letter characters
-      fam_name = fam_name.replace(",",'')
-      fam_name = fam_name.replace('_','')
-
-      if (len(fam_name) >= 5):
-        rec_bkv += (fam_name[1]+fam_name[2]+fam_name[4])
-      elif (len(fam_name) >= 3):
-        rec_bkv += (fam_name[1]+fam_name[2]+'2')
-      elif (len(fam_name) >= 2):
-        rec_bkv += (fam_name[1]+'22')
-
-    # Get given name value
+      # Only need to add the record
+      #
+      rec_id_list = block_dict[rec_bkv]
+      rec_id_list.append(rec_id)
+
+    else: # Block key value not in block index
+
+      # Create a new block and add the record identifier
+      #
+      rec_id_list = [rec_id]
+
+    block_dict[rec_bkv] = rec_id_list  # Store the new block
+
+  return block_dict
+
+# -----------------------------------------------------------------------------
+
+def sortedNeighbourhoodBlocking(recA_dict, recB_dict, sort_attr_list,
+                                window_size):
+  """Build the blocking index data structures (dictionaries) of both datasets
+     with the sorted neighbourhood approach: the records of both datasets are
+     sorted together by a sorting key and a window of the given size is moved
+     over the sorted records, so that records from dataset A are paired with
+     all records from dataset B that are within the same window.
+
+     The sorting key simply concatenates attribute values (as done in
+     simpleBlocking), so records with similar but not the same values (for
+     example because of a typo at the end of a value) are sorted close to
+     each other and can still become candidate pairs.
+
+     Parameter Description:
+       recA_dict      : Dictionary that holds the record identifiers as keys
+                        and corresponding list of record values of dataset A
+       recB_dict      : Dictionary that holds the record identifiers as keys
+                        and corresponding list of record values of dataset B
+       sort_attr_list : List of attributes to use for the sorting key
+       window_size    : Number of (sorted) records in the sliding window
+
+     Records with the same sorting key are always paired with each other,
+     however many of them there are, so the candidate pairs include all pairs
+     found by simpleBlocking with the same attributes. The window is only
+     used to pair records with different sorting keys.
+
+     This method returns a tuple with the two block dictionaries of dataset A
+     and B. There is one block for each record from dataset A (with the
+     record identifier as its key) that contains this record in dataset A and
+     all records of dataset B within a window with it or with the same
+     sorting key, so each candidate pair only occurs once. Building the
+     blocks takes O(n log(n)) time for sorting plus O(n w) for the candidate
+     pairs (plus the pairs within runs of equal sorting keys).
+  """
+
+  assert window_size >= 2, window_size
+
+  # Generate the sorting key of each record, marking the dataset (A is 0 and
+  # B is 1) so records with the same key are always sorted the same way
+  #
+  sort_list = []
+
+  # Records of dataset B for each sorting key, so records with the same key
+  # are paired even if there are more of them than fit into a window
+  #
+  skv_rec_idB_dict = {}
+
+  for (dataset_num, rec_dict) in [(0, recA_dict), (1, recB_dict)]:
+    for (rec_id, rec_values) in rec_dict.items():
+
+      rec_skv = ''  # Initialise the sorting key value for this record
+
+      for attr in sort_attr_list:
+        rec_skv += rec_values[attr]
+
+      sort_list.append((rec_skv, dataset_num, rec_id))
+
+      if (dataset_num == 1):
+        if (rec_skv in skv_rec_idB_dict):
+          skv_rec_idB_dict[rec_skv].append(rec_id)
+        else:
+          skv_rec_idB_dict[rec_skv] = [rec_id]
+
+  sort_list.sort()
+
+  rec_idB_list_dict = {}
+
+  num_sorted = len(sort_list)
+
+  for (pos, (rec_skv, dataset_num, rec_id)) in enumerate(sort_list):
+
+    if (dataset_num != 0):  # Blocks are built around records of dataset A
+      continue
+
+    # All records of dataset B with the same sorting key, and all records of
+    # dataset B with a different key in a window with this record
     #
-    giv_name = rec_values[giv_name_attr_ind]
+    rec_idB_list = list(skv_rec_idB_dict.get(rec_skv, []))
 
-    if (giv_name == ''):
-      rec_bkv += '99'
-    else:
-      giv_name = giv_name.replace('-','')  # Remove non letter characters
-      giv_name = giv_name.replace(",",'')
-      giv_name = giv_name.replace('_','')
+    for other_pos in range(max(0, pos - window_size + 1),
+                           min(num_sorted, pos + window_size)):
+      (other_skv, other_dataset_num, other_rec_id) = sort_list[other_pos]
+      if ((other_dataset_num == 1) and (other_skv != rec_skv)):
+        rec_idB_list.append(other_rec_id)
 
-      if (len(giv_name) >= 3):
-        rec_bkv += (giv_name[1]+giv_name[2])
-      elif (len(giv_name) >= 2):
-        rec_bkv += (giv_name[1]+'2')
+    rec_idB_list_dict[rec_id] = rec_idB_list
+
+  return _pairBlocks(rec_idB_list_dict)
+
+# -----------------------------------------------------------------------------
 
-    # DoB structure we use: dd/mm/yyyy
+def canopyBlocking(recA_dict, recB_dict, blk_attr_list, loose_thres,
+                   tight_thres, q=3):
+  """Build the blocking index data structures (dictionaries) of both datasets
+     with canopy clustering, as described in the Data Matching book, using
+     the Jaccard similarity of the q-gram sets of the concatenated values of
+     the blocking attributes.
+
+     Records are taken in turn as centre of a new canopy (unless they have
+     been removed). All remaining records with a similarity of at least the
+     loose threshold to the centre are put into its canopy, and those with a
+     similarity of at least the tight threshold (and the centre) are removed
+     so they cannot be in any later canopy.
+
+     Similar records are found with an inverted index from q-grams to
+     records, where only the rarest q-grams of each record (its prefix) are
+     indexed. Two q-gram sets can only have a Jaccard similarity of at least
+     the loose threshold if their prefixes share a q-gram, so each centre only
+     needs to be compared with the records found in the index.
 
-    # Get date of birth
+     Parameter Description:
+       recA_dict     : Dictionary that holds the record identifiers as keys
+                       and corresponding list of record values of dataset A
+       recB_dict     : Dictionary that holds the record identifiers as keys
+                       and corresponding list of record values of dataset B
+       blk_attr_list : List of blocking key attributes to use
+       loose_thres   : Loose similarity threshold for joining a canopy
+       tight_thres   : Tight similarity threshold (at least the loose
+                       threshold) for removing records
+       q             : Length of the q-grams
+
+     This method returns a tuple with the two block dictionaries of dataset A
+     and B, with the canopy numbers as blocking keys.
+  """
+
+  assert 0.0 < loose_thres <= tight_thres <= 1.0, (loose_thres, tight_thres)
+
+  # Generate the q-gram set of each record
+  #
+  rec_list =    []  # Tuples (dataset number, record identifier)
+  q_gram_list = []  # Q-gram set of each record
+
+  for (dataset_num, rec_dict) in [(0, recA_dict), (1, recB_dict)]:
+    for (rec_id, rec_values) in rec_dict.items():
+
+      rec_bkv = ''
+      for attr in blk_attr_list:
+        rec_bkv += rec_values[attr]
+
+      rec_list.append((dataset_num, rec_id))
+      q_gram_list.append(frozenset([rec_bkv[i:i+q] for i in \
+                                    range(len(rec_bkv) - (q-1))]))
+
+  # Count how many records contain each q-gram, to order q-grams from rare to
+  # frequent
+  #
+  q_gram_freq_dict = {}
+  for q_gram_set in q_gram_list:
+    for q_gram in q_gram_set:
+      q_gram_freq_dict[q_gram] = q_gram_freq_dict.get(q_gram, 0) + 1
+
+  # Build the inverted index on the prefix q-grams of each record, where each
+  # q-gram points to tuples (record number, position of q-gram in prefix)
+  #
+  prefix_list =   []
+  q_gram_index =  {}
+  set_size_list = [len(q_gram_set) for q_gram_set in q_gram_list]
+
+  for (rec_num, q_gram_set) in enumerate(q_gram_list):
+    q_gram_set_len = set_size_list[rec_num]
+
+    # Subtract a small value to prevent rounding errors, such as 0.4*15 being
+    # slightly larger than 6
     #
-    dob = rec_values[dob_attr_ind]
+    min_common = int(math.ceil(loose_thres * q_gram_set_len - 1e-9))
+    prefix_len = q_gram_set_len - min_common + 1
 
-    dob_list = rec_values[dob_attr_ind].split('/')
+    prefix = sorted(q_gram_set, key=lambda q_gram: \
+                    (q_gram_freq_dict[q_gram], q_gram))[:prefix_len]
+    prefix_list.append(prefix)
 
-    # Add some checks
+    for (pos, q_gram) in enumerate(prefix):
+      if (q_gram in q_gram_index):
+        q_gram_index[q_gram].append((rec_num, pos))
+      else:
+        q_gram_index[q_gram] = [(rec_num, pos)]
+
+  # For each record either REMOVED, or the number of the last centre it was
+  # checked for
+  #
+  REMOVED = -1
+  rec_mark_list = [-2] * len(rec_list)
+
+  blockA_dict = {}
+  blockB_dict = {}
+
+  canopy_num = 0
+
+  for centre_num in range(len(rec_list)):
+
+    if (rec_mark_list[centre_num] == REMOVED):
+      continue
+
+    rec_mark_list[centre_num] = REMOVED
+
+    centre_q_gram_set = q_gram_list[centre_num]
+    centre_size =       set_size_list[centre_num]
+
+    if (centre_size == 0):  # Value too short for any q-gram
+      continue
+
+    # Records with fewer or more q-grams cannot be similar enough
     #
-    if (len(dob_list[0]) < 2):
-      dob_list[0] = '0' + dob_list[0]  # Add leading zero for days < 10
-    if (len(dob_list[1]) < 2):
-      dob_list[1] = '0' + dob_list[1]  # Add leading zero for months < 10
+    min_size = loose_thres * centre_size - 1e-9
+    max_size = centre_size / loose_thres + 1e-9
+
+    canopy_list = [centre_num]
+
+    for (centre_pos, q_gram) in enumerate(prefix_list[centre_num]):
+      posting_list = q_gram_index[q_gram]
+      num_removed =  0
+
+      for (rec_num, pos) in posting_list:
+
+        rec_mark = rec_mark_list[rec_num]
+
+        if (rec_mark == centre_num):
+          continue
+        if (rec_mark == REMOVED):
+          num_removed += 1
+          continue
+        rec_mark_list[rec_num] = centre_num
+
+        size = set_size_list[rec_num]
+
+        if (size < min_size) or (size > max_size):
+          continue
+
+        # This is the first (rarest) q-gram the two records have in common,
+        # so at most the q-grams after it can also be common
+        #
+        max_common = min(centre_size - centre_pos, size - pos)
+        if (max_common < loose_thres / (1.0 + loose_thres) * \
+                         (centre_size + size) - 1e-9):
+          continue
+
+        common = len(centre_q_gram_set & q_gram_list[rec_num])
+        jacc_sim = float(common) / (centre_size + size - common)
+
+        if (jacc_sim >= loose_thres):
+          canopy_list.append(rec_num)
+
+          if (jacc_sim >= tight_thres):
+            rec_mark_list[rec_num] = REMOVED
+
+      # Remove records that have been removed from the index once they make
+      # up a large part of a list, so they are not checked again and again
+      #
+      if (2 * num_removed > len(posting_list)):
+        q_gram_index[q_gram] = [(rec_num, pos) for (rec_num, pos) in \
+                                posting_list if \
+                                rec_mark_list[rec_num] != REMOVED]
+
+    rec_idA_list = [rec_list[rec_num][1] for rec_num in canopy_list \
+                    if rec_list[rec_num][0] == 0]
+    rec_idB_list = [rec_list[rec_num][1] for rec_num in canopy_list \
+                    if rec_list[rec_num][0] == 1]
+
+    # Only canopies with records from both datasets give candidate pairs
+    #
+    if (len(rec_idA_list) > 0) and (len(rec_idB_list) > 0):
+      blockA_dict[canopy_num] = rec_idA_list
+      blockB_dict[canopy_num] = rec_idB_list
+      canopy_num += 1
+
+  return blockA_dict, blockB_dict
+
+# -----------------------------------------------------------------------------
+
+MINHASH_PRIME = (1<<31) - 1  # Prime for the MinHash hash functions
+
+def minHashLSHBlocking(rec_dict, blk_attr_list, num_bands, num_rows, q=2,
+                       seed=42):
+  """Build the blocking index data structure (dictionary) to store blocking
+     key values (BKV) as keys and the corresponding list of record identifiers.
+
+     A blocking is implemented with locality sensitive hashing (LSH) based on
+     MinHash signatures of the q-gram sets of the concatenated values of the
+     blocking attributes. Each signature is split into bands of rows, and
+     records with the same values in a band are put into the same block.
+
+     Two records with a Jaccard similarity s of their q-gram sets share at
+     least one block with probability 1 - (1 - s^num_rows)^num_bands (see
+     lshCandidateProbability), which rises steeply around the similarity
+     (1 / num_bands)^(1 / num_rows). Use lshBandParameters to select the
+     number of bands and rows for a target similarity threshold.
+
+     Parameter Description:
+       rec_dict      : Dictionary that holds the record identifiers as keys
+                       and corresponding list of record values
+       blk_attr_list : List of blocking key attributes to use
+       num_bands     : Number of bands (each record is in one block per band)
+       num_rows      : Number of MinHash values (rows) in each band
+       q             : Length of the q-grams
+       seed          : Seed for the random hash functions, which must be the
+                       same for both datasets
+
+     This method returns a dictionary with blocking key values as its keys and
+     list of record identifiers as its values (one list for each block).
+     Records without any q-gram (values shorter than q) are not blocked.
+  """
+
+  num_perm = num_bands * num_rows  # Number of MinHash functions
+
+  # Generate the random hash functions (a*x + b) mod p, and the coefficients
+  # used to hash the values of a band into one blocking key value
+  #
+  rand_gen = random.Random(seed)
+
+  hash_a_list = [rand_gen.randrange(1, MINHASH_PRIME) for _ in range(num_perm)]
+  hash_b_list = [rand_gen.randrange(0, MINHASH_PRIME) for _ in range(num_perm)]
+  band_coeff_list = [rand_gen.randrange(1, 1<<62) | 1 for _ in range(num_perm)]
+
+  # Hash the q-grams of all records into one list, with the start position
+  # of each record's q-grams
+  #
+  rec_id_list = []
+  q_gram_hash_list = []
+  start_list = []
+
+  for (rec_id, rec_values) in rec_dict.items():
+
+    rec_bkv = ''
+    for attr in blk_attr_list:
+      rec_bkv += rec_values[attr]
+
+    q_gram_set = set([rec_bkv[i:i+q] for i in range(len(rec_bkv) - (q-1))])
+
+    if (len(q_gram_set) == 0):  # Value too short for any q-gram
+      continue
+
+    rec_id_list.append(rec_id)
+    start_list.append(len(q_gram_hash_list))
+
+    for q_gram in q_gram_set:
+      q_gram_hash_list.append(zlib.crc32(q_gram.encode('utf-8')) % \
+                              MINHASH_PRIME)
+
+  start_list.append(len(q_gram_hash_list))
+
+  # Calculate the blocking key hash of each band of each record (the same
+  # with or without numpy)
+  #
+  try:
+    import numpy
+    band_hash_list_list = _minHashBandsNumpy(numpy, q_gram_hash_list,
+                                             start_list, hash_a_list,
+                                             hash_b_list, band_coeff_list,
+                                             num_bands, num_rows)
+  except ImportError:
+    band_hash_list_list = _minHashBands(q_gram_hash_list, start_list,
+                                        hash_a_list, hash_b_list,
+                                        band_coeff_list, num_bands, num_rows)
+
+  # Insert records into their blocks
+  #
+  block_dict = {}
+
+  for (band_num, band_hash_list) in enumerate(band_hash_list_list):
+    for (rec_num, band_hash) in enumerate(band_hash_list):
+      rec_bkv = '%d_%x' % (band_num, band_hash)
+
+      if (rec_bkv in block_dict):
+        block_dict[rec_bkv].append(rec_id_list[rec_num])
+      else:
+        block_dict[rec_bkv] = [rec_id_list[rec_num]]
+
+  return block_dict
+
+def _minHashBands(q_gram_hash_list, start_list, hash_a_list, hash_b_list,
+                  band_coeff_list, num_bands, num_rows):
+  """Return a list with one list per band of the band hashes of all records,
+     where the MinHash signature of each record is calculated from its
+     q-gram hashes (q_gram_hash_list[start_list[i]:start_list[i+1]] for the
+     i-th record), and the rows of a band are hashed into one value
+     (multiplication and addition modulo 2^64).
+  """
+
+  hash_ab_list = list(zip(hash_a_list, hash_b_list))
+
+  band_hash_list_list = [[] for band_num in range(num_bands)]
+
+  for rec_num in range(len(start_list) - 1):
+    rec_hash_list = q_gram_hash_list[start_list[rec_num]:
+                                     start_list[rec_num+1]]
+
+    signature = [min([(hash_a * q_gram_hash + hash_b) % MINHASH_PRIME for \
+                      q_gram_hash in rec_hash_list]) for \
+                 (hash_a, hash_b) in hash_ab_list]
+
+    for band_num in range(num_bands):
+      band_start = band_num * num_rows
+      band_hash = sum([sig_val * band_coeff for (sig_val, band_coeff) in \
+                       zip(signature[band_start:band_start+num_rows],
+                           band_coeff_list[band_start:band_start+num_rows])])
+      band_hash_list_list[band_num].append(band_hash & 0xFFFFFFFFFFFFFFFF)
+
+  return band_hash_list_list
+
+def _minHashBandsNumpy(numpy, q_gram_hash_list, start_list, hash_a_list,
+                       hash_b_list, band_coeff_list, num_bands, num_rows):
+  """Return the same band hashes as _minHashBands(), calculated with numpy.
+  """
+
+  num_perm = num_bands * num_rows
+  num_rec = len(start_list) - 1
+
+  hash_a = numpy.array(hash_a_list, dtype=numpy.uint64)
+  hash_b = numpy.array(hash_b_list, dtype=numpy.uint64)
+  band_coeff = numpy.array(band_coeff_list, dtype=numpy.uint64)
+
+  q_gram_hashes = numpy.array(q_gram_hash_list, dtype=numpy.uint64)
+  starts = numpy.array(start_list, dtype=numpy.int64)
+
+  signatures = numpy.zeros((num_rec, num_perm), dtype=numpy.uint64)
+
+  # Calculate the MinHash signatures in chunks of records to limit the size
+  # of the temporary array of all hash values
+  #
+  chunk_size = max(1, (1<<22) // (num_perm * 16))
+
+  for chunk_start in range(0, num_rec, chunk_size):
+    chunk_end = min(chunk_start + chunk_size, num_rec)
+
+    chunk_hashes = q_gram_hashes[starts[chunk_start]:starts[chunk_end]]
+
+    hash_values = (numpy.outer(hash_a, chunk_hashes) + hash_b[:,None]) % \
+                  MINHASH_PRIME
+
+    signatures[chunk_start:chunk_end] = numpy.minimum.reduceat(hash_values,
+                   starts[chunk_start:chunk_end] - starts[chunk_start],
+                   axis=1).T
+
+  # Hash the rows of each band into one value (multiplication and addition
+  # wrap around modulo 2^64)
+  #
+  band_hash_list_list = []
+
+  for band_num in range(num_bands):
+    band_slice = slice(band_num * num_rows, (band_num + 1) * num_rows)
+
+    band_hashes = (signatures[:, band_slice] * band_coeff[band_slice]).sum(
+                                                  axis=1, dtype=numpy.uint64)
+    band_hash_list_list.append(band_hashes.tolist())
+
+  return band_hash_list_list
+
+# -----------------------------------------------------------------------------
+
+def lshCandidateProbability(jacc_sim, num_bands, num_rows):
+  """Return the probability that two records with the given Jaccard
+     similarity share a block with MinHash LSH blocking.
+  """
+
+  return 1.0 - (1.0 - jacc_sim ** num_rows) ** num_bands
+
+# -----------------------------------------------------------------------------
+
+def lshBandParameters(jacc_thres, max_num_perm=128):
+  """Select the number of bands and rows for MinHash LSH blocking, such that
+     the similarity where the candidate probability rises steeply, which is
+     (1 / num_bands)^(1 / num_rows), is as close as possible to the given
+     Jaccard similarity threshold, using at most the given number of MinHash
+     functions (num_bands * num_rows).
+
+     Returns a tuple (number of bands, number of rows).
+  """
+
+  assert 0.0 < jacc_thres < 1.0, jacc_thres
+
+  best_param = None
+
+  for num_rows in range(1, max_num_perm + 1):
+    for num_bands in range(1, max_num_perm // num_rows + 1):
+      diff = abs((1.0 / num_bands) ** (1.0 / num_rows) - jacc_thres)
+
+      # Prefer more hash functions (steeper curve) for equal differences
+      #
+      param_key = (round(diff, 3), -num_bands * num_rows)
 
-    dob = ''.join(dob_list)  # Create: ddmmyyyy
+      if (best_param is None) or (param_key < best_param[0]):
+        best_param = (param_key, num_bands, num_rows)
 
-    assert len(dob) == 8, dob
+  return best_param[1], best_param[2]
 
-    rec_bkv += dob
+# =============================================================================
+# Incremental blocking index that can be saved and loaded
+
+# Functions to calculate the blocking key value of a record, with the names
+# used for them in saved blocking indexes
+#
+BLOCKING_KEY_FUNCT_DICT = {'simple':   simpleBlockingKey,
+                           'phonetic': phoneticBlockingKey,
+                           'slk':      slkBlockingKey}
+
+BLOCKING_INDEX_VERSION = 1  # Increase if the file format changes
+
+class BlockingIndex:
+  """A blocking index of the records of one dataset that can be updated by
+     inserting and removing records, and saved to and loaded from a file.
+     This allows new records (for example daily deltas of a dataset) to be
+     linked without blocking the full datasets again.
+
+     Parameter Description:
+       key_funct_name : Name of the blocking key function to use, one of
+                        'simple' (see simpleBlocking), 'phonetic' (see
+                        phoneticBlocking) or 'slk' (see slkBlocking)
+       key_args       : List of the further arguments of the blocking key
+                        function after the record values (for example the
+                        list of blocking attributes)
+
+     The block_dict attribute contains the same blocks that the
+     corresponding blocking function would generate for all inserted
+     records (and can be given to comparison.compareBlocks()). Insertions
+     and removals return block dictionaries with only the inserted or
+     removed records, so that only new candidate pairs need to be compared:
+
+       indexA = BlockingIndex.load('blocksA.json')
+       indexB = BlockingIndex.load('blocksB.json')
+       new_blockB_dict = indexB.insertRecords(deltaB_dict)
+       sim_vec_dict = comparison.compareBlocks(indexA.block_dict,
+                                               new_blockB_dict, ...)
+       indexB.save('blocksB.json')
+  """
+
+  def __init__(self, key_funct_name, key_args):
+
+    assert key_funct_name in BLOCKING_KEY_FUNCT_DICT, key_funct_name
+
+    self.key_funct_name = key_funct_name
+    self.key_args =       list(key_args)
+    self.key_funct =      BLOCKING_KEY_FUNCT_DICT[key_funct_name]
+
+    self.block_dict =   {}  # Blocking key values as keys, lists of record
+                            # identifiers as values
+    self.rec_bkv_dict = {}  # Record identifiers as keys, blocking key
+                            # values as values
+
+  def __len__(self):
+    return len(self.rec_bkv_dict)
+
+  def __contains__(self, rec_id):
+    return rec_id in self.rec_bkv_dict
+
+  def insertRecords(self, rec_dict):
+    """Insert the records of the given dictionary into the index (a record
+       that is already in the index is first removed, so its blocking key
+       value is updated), and return a block dictionary with only the
+       inserted records.
+    """
+
+    key_funct = self.key_funct
+    key_args =  self.key_args
+
+    block_dict =   self.block_dict
+    rec_bkv_dict = self.rec_bkv_dict
 
-    # Get gender
+    changed_rec_id_list = [rec_id for rec_id in rec_dict if \
+                           rec_id in rec_bkv_dict]
+    if (len(changed_rec_id_list) > 0):
+      self.removeRecords(changed_rec_id_list)
+
+    new_block_dict = {}
+
+    for (rec_id, rec_values) in rec_dict.items():
+      rec_bkv = key_funct(rec_values, *key_args)
+
+      rec_bkv_dict[rec_id] = rec_bkv
+
+      if (rec_bkv in block_dict):
+        block_dict[rec_bkv].append(rec_id)
+      else:
+        block_dict[rec_bkv] = [rec_id]
+
+      if (rec_bkv in new_block_dict):
+        new_block_dict[rec_bkv].append(rec_id)
+      else:
+        new_block_dict[rec_bkv] = [rec_id]
+
+    return new_block_dict
+
+  def removeRecords(self, rec_id_list):
+    """Remove the records with the given identifiers from the index (unknown
+       identifiers are ignored), and return a block dictionary with only the
+       removed records. Blocks that become empty are removed.
+    """
+
+    block_dict =   self.block_dict
+    rec_bkv_dict = self.rec_bkv_dict
+
+    removed_block_dict = {}
+
+    for rec_id in rec_id_list:
+      rec_bkv = rec_bkv_dict.pop(rec_id, None)
+
+      if (rec_bkv is None):
+        continue
+
+      if (rec_bkv in removed_block_dict):
+        removed_block_dict[rec_bkv].add(rec_id)
+      else:
+        removed_block_dict[rec_bkv] = set([rec_id])
+
+    # Rebuild each touched block only once
+    #
+    for (rec_bkv, removed_rec_id_set) in removed_block_dict.items():
+      rec_id_list = [rec_id for rec_id in block_dict[rec_bkv] if \
+                     rec_id not in removed_rec_id_set]
+
+      if (len(rec_id_list) > 0):
+        block_dict[rec_bkv] = rec_id_list
+      else:
+        del block_dict[rec_bkv]
+
+    return dict((rec_bkv, sorted(removed_rec_id_set)) for \
+                (rec_bkv, removed_rec_id_set) in removed_block_dict.items())
+
+  def save(self, file_name):
+    """Save the index into a JSON file (compressed if the file name ends
+       with 'gz').
+    """
+
+    index_dict = {'version':        BLOCKING_INDEX_VERSION,
+                  'key_funct_name': self.key_funct_name,
+                  'key_args':       self.key_args,
+                  'block_dict':     self.block_dict}
+
+    # Write a temporary file first, so an interrupted save does not destroy
+    # the previously saved index
     #
-    gender = rec_values[gender_attr_ind].lower()
+    tmp_file_name = file_name + '.tmp%d' % (os.getpid())
 
-    if (gender == 'm'):
-      rec_bkv += '1'
-    elif (gender == 'f'):
-      rec_bkv += '2'
+    if (file_name.endswith('gz')):
+      out_f = gzip.open(tmp_file_name, 'wt')
     else:
-      rec_bkv += '9'
+      out_f = open(tmp_file_name, 'w')
 
-    # Insert the blocking key value and record into blocking dictionary
+    json.dump(index_dict, out_f)
+    out_f.close()
+
+    os.replace(tmp_file_name, file_name)
+
+  @classmethod
+  def load(cls, file_name):
+    """Load an index saved with save() from the given file.
+    """
+
+    if (file_name.endswith('gz')):
+      in_f = gzip.open(file_name, 'rt')
+    else:
+      in_f = open(file_name)
+
+    index_dict = json.load(in_f)
+    in_f.close()
+
+    if (index_dict.get('version') != BLOCKING_INDEX_VERSION):
+      raise ValueError('Unsupported blocking index file: %s' % (file_name))
+
+    blocking_index = cls(index_dict['key_funct_name'], index_dict['key_args'])
+
+    blocking_index.block_dict = index_dict['block_dict']
+
+    rec_bkv_dict = blocking_index.rec_bkv_dict
+    for (rec_bkv, rec_id_list) in blocking_index.block_dict.items():
+      for rec_id in rec_id_list:
+        rec_bkv_dict[rec_id] = rec_bkv
+
+    return blocking_index
+
+# =============================================================================
+# Blocking of two datasets on many combinations of blocking attributes
+
+class BlockingKeyCache:
+  """Blocking of two datasets for many different lists of blocking
+     attributes (such as when all combinations of attributes are tried),
+     where the key component of each attribute (its value, or its Soundex
+     code) is only calculated once for each record.
+
+     Parameter Description:
+       recA_dict       : Dictionary of records from dataset A
+       recB_dict       : Dictionary of records from dataset B
+       phonetic        : If True the Soundex codes of attribute values are
+                         used (as in phoneticBlocking), otherwise the values
+                         themselves (as in simpleBlocking)
+       max_cached_keys : Maximum number of attribute combinations for which
+                         the combined key codes are kept
+
+     The key components of each attribute are converted into integer codes
+     (the same value has the same code in both datasets). The codes of a
+     combination of attributes are calculated with numpy from the codes of
+     the combination without its last attribute (which are cached as well),
+     by numbering the distinct pairs of codes. Only blocks that contain
+     records from both datasets are generated.
+
+     The candidate pairs are the same as with simpleBlocking or
+     phoneticBlocking, except that the blocking keys are integer codes and
+     that values are not concatenated (so for example 'ab' and 'c' are not
+     in the same block as 'a' and 'bc'). If numpy is not installed the
+     blocking functions are simply called for each list of attributes.
+  """
+
+  def __init__(self, recA_dict, recB_dict, phonetic=False,
+               max_cached_keys=256):
+
+    try:
+      import numpy
+      self.numpy = numpy
+    except ImportError:
+      self.numpy = None
+
+    self.recA_dict = recA_dict
+    self.recB_dict = recB_dict
+
+    self.phonetic =        phonetic
+    self.max_cached_keys = max_cached_keys
+
+    self.rec_idA_list = list(recA_dict.keys())
+    self.rec_idB_list = list(recB_dict.keys())
+    self.numA_rec =     len(self.rec_idA_list)
+
+    # Attributes (or tuples of attributes) as keys, arrays with the codes of
+    # the records of both datasets (first A then B) as values
     #
-    if (rec_bkv in block_dict): # Block key value in block index
+    self.attr_code_dict = {}
+    self.comb_code_dict = collections.OrderedDict()
 
-      # Only need to add the record
+  def _attrCodes(self, attr):
+    """Return the code array of the records of both datasets for a single
+       attribute.
+    """
+
+    if (attr in self.attr_code_dict):
+      return self.attr_code_dict[attr]
+
+    value_code_dict = {}
+
+    code_array = array.array('q')
+
+    for (rec_dict, rec_id_list) in [(self.recA_dict, self.rec_idA_list),
+                                    (self.recB_dict, self.rec_idB_list)]:
+      for rec_id in rec_id_list:
+        attr_val = rec_dict[rec_id][attr]
+        if (self.phonetic == True):
+          attr_val = soundex(attr_val)
+
+        code = value_code_dict.get(attr_val)
+        if (code is None):
+          code = len(value_code_dict)
+          value_code_dict[attr_val] = code
+        code_array.append(code)
+
+    codes = self.numpy.frombuffer(code_array, dtype=self.numpy.int64)
+    self.attr_code_dict[attr] = codes
+
+    return codes
+
+  def _combCodes(self, attr_tuple):
+    """Return the code array of the records of both datasets for a tuple of
+       attributes.
+    """
+
+    if (len(attr_tuple) == 1):
+      return self._attrCodes(attr_tuple[0])
+
+    comb_code_dict = self.comb_code_dict
+
+    if (attr_tuple in comb_code_dict):
+      comb_code_dict.move_to_end(attr_tuple)
+      return comb_code_dict[attr_tuple]
+
+    prefix_codes = self._combCodes(attr_tuple[:-1])
+    attr_codes =   self._attrCodes(attr_tuple[-1])
+
+    # Codes are smaller than the number of records, so the pair codes fit
+    # into 64-bit integers
+    #
+    pair_codes = prefix_codes * (len(attr_codes) + 1) + attr_codes
+    codes = self.numpy.unique(pair_codes, return_inverse=True)[1]
+
+    comb_code_dict[attr_tuple] = codes
+    if (len(comb_code_dict) > self.max_cached_keys):
+      comb_code_dict.popitem(last=False)  # Remove least recently used
+
+    return codes
+
+  def blocks(self, blk_attr_list):
+    """Return a tuple with the block dictionaries of dataset A and B for the
+       given list of blocking attributes.
+    """
+
+    if (self.numpy is None):
+      if (self.phonetic == True):
+        block_funct = phoneticBlocking
+      else:
+        block_funct = simpleBlocking
+      return block_funct(self.recA_dict, blk_attr_list), \
+             block_funct(self.recB_dict, blk_attr_list)
+
+    if (len(blk_attr_list) == 0):  # All records are in the same block
+      return {0: list(self.rec_idA_list)}, {0: list(self.rec_idB_list)}
+
+    numpy = self.numpy
+
+    codes = self._combCodes(tuple(blk_attr_list))
+    codesA = codes[:self.numA_rec]
+    codesB = codes[self.numA_rec:]
+
+    common_codes = numpy.intersect1d(codesA, codesB)
+
+    block_dict_list = []
+    for (rec_codes, rec_id_list) in [(codesA, self.rec_idA_list),
+                                     (codesB, self.rec_idB_list)]:
+
+      # Positions of the records in blocks with candidate pairs, sorted by
+      # their codes
       #
-      rec_id_list = block_dict[rec_bkv]
-      rec_id_list.append(rec_id)
+      rec_pos = numpy.nonzero(numpy.isin(rec_codes, common_codes))[0]
+      rec_pos = rec_pos[numpy.argsort(rec_codes[rec_pos], kind='stable')]
 
-    else: # Block key value not in block index
+      block_codes = rec_codes[rec_pos]
+      block_starts = numpy.flatnonzero(block_codes[1:] != \
+                                       block_codes[:-1]) + 1
 
-      # Create a new block and add the record identifier
+      rec_pos_list = rec_pos.tolist()
+      start_list = [0] + block_starts.tolist() + [len(rec_pos_list)]
+
+      block_dict = {}
+      for (code, start, end) in zip(block_codes[start_list[:-1]].tolist(),
+                                    start_list[:-1], start_list[1:]):
+        block_dict[code] = [rec_id_list[pos] for pos in \
+                            rec_pos_list[start:end]]
+
+      block_dict_list.append(block_dict)
+
+    return block_dict_list[0], block_dict_list[1]
+
+# =============================================================================
+# Post-processing of generated blocks
+
+def _pairBlocks(rec_idB_list_dict):
+  """Convert a dictionary with record identifiers from dataset A as keys and
+     lists of record identifiers from dataset B as values into two block
+     dictionaries, with one block for each record from dataset A (using its
+     identifier as blocking key), so each candidate pair occurs only once.
+  """
+
+  blockA_dict = {}
+  blockB_dict = {}
+
+  for (rec_idA, rec_idB_list) in rec_idB_list_dict.items():
+    if (len(rec_idB_list) > 0):
+      blockA_dict[rec_idA] = [rec_idA]
+      blockB_dict[rec_idA] = rec_idB_list
+
+  return blockA_dict, blockB_dict
+
+# -----------------------------------------------------------------------------
+
+def _numBlockPairs(blockA_dict, blockB_dict):
+  """Return the number of record pairs in the blocks of the two given block
+     dictionaries (pairs in several blocks are counted once for each block).
+  """
+
+  num_pairs = 0
+
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+    if (block_bkv in blockB_dict):
+      num_pairs += len(rec_idA_list) * len(blockB_dict[block_bkv])
+
+  return num_pairs
+
+# -----------------------------------------------------------------------------
+
+def limitBlockSizes(blockA_dict, blockB_dict, max_block_pairs=None,
+                    max_block_size=None, method='drop', recA_dict=None,
+                    recB_dict=None, split_attr_list=None):
+  """Find oversized blocks, which would result in too many record pairs to be
+     compared (such as the block of the most common value of an attribute),
+     and either remove them or split them into smaller blocks.
+
+     Parameter Description:
+       blockA_dict     : Dictionary of blocks from dataset A
+       blockB_dict     : Dictionary of blocks from dataset B
+       max_block_pairs : Maximum number of record pairs in a block (or None)
+       max_block_size  : Maximum number of records from either dataset in a
+                         block (or None)
+       method          : 'drop' to remove oversized blocks (their blocking
+                         key values are treated as stop values), or 'split'
+                         to split them by the values of further attributes
+       recA_dict       : Dictionary of records from dataset A (for 'split')
+       recB_dict       : Dictionary of records from dataset B (for 'split')
+       split_attr_list : List of attributes whose values are appended to the
+                         blocking key values of oversized blocks (for 'split')
+
+     This method returns a tuple with the two new block dictionaries and a
+     dictionary with statistics: the number of oversized blocks, the number
+     of record pairs before and after, and the number of saved comparisons.
+     Split blocks that are still oversized are kept, with tuple keys made of
+     the blocking key value of the oversized block and a tuple of the values
+     of the split attributes.
+  """
+
+  assert method in ['drop', 'split'], method
+
+  if (method == 'split'):
+    assert (recA_dict is not None) and (recB_dict is not None) and \
+           (split_attr_list is not None)
+
+  def _isOversized(sizeA, sizeB):
+    if (max_block_pairs is not None) and (sizeA * sizeB > max_block_pairs):
+      return True
+    if (max_block_size is not None) and (max(sizeA, sizeB) > max_block_size):
+      return True
+    return False
+
+  def _splitBlock(block_bkv, rec_id_list, rec_dict):
+    split_block_dict = {}
+    for rec_id in rec_id_list:
+      rec_values = rec_dict[rec_id]
+
+      # A tuple key cannot be equal to the key of another (original or
+      # split) block, whatever characters the values contain
       #
-      rec_id_list = [rec_id]
+      split_bkv = (block_bkv, tuple([rec_values[attr] for attr in \
+                                     split_attr_list]))
 
-    block_dict[rec_bkv] = rec_id_list  # Store the new block
+      if (split_bkv in split_block_dict):
+        split_block_dict[split_bkv].append(rec_id)
+      else:
+        split_block_dict[split_bkv] = [rec_id]
+
+    return split_block_dict
+
+  new_blockA_dict = {}
+  new_blockB_dict = {}
+
+  num_oversized = 0
+
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+
+    if (block_bkv not in blockB_dict):  # Block without candidate pairs
+      continue
+
+    rec_idB_list = blockB_dict[block_bkv]
+
+    if (not _isOversized(len(rec_idA_list), len(rec_idB_list))):
+      new_blockA_dict[block_bkv] = rec_idA_list
+      new_blockB_dict[block_bkv] = rec_idB_list
+      continue
+
+    num_oversized += 1
+
+    if (method == 'split'):
+      new_blockA_dict.update(_splitBlock(block_bkv, rec_idA_list, recA_dict))
+      new_blockB_dict.update(_splitBlock(block_bkv, rec_idB_list, recB_dict))
+
+  num_pairs_before = _numBlockPairs(blockA_dict, blockB_dict)
+  num_pairs_after =  _numBlockPairs(new_blockA_dict, new_blockB_dict)
+
+  stats_dict = {'num_oversized_blocks': num_oversized,
+                'num_pairs_before':     num_pairs_before,
+                'num_pairs_after':      num_pairs_after,
+                'num_pairs_saved':      num_pairs_before - num_pairs_after}
+
+  return new_blockA_dict, new_blockB_dict, stats_dict
+
+# -----------------------------------------------------------------------------
+
+def metaBlocking(blockA_dict, blockB_dict, weight_scheme='cbs',
+                 max_block_pairs=None):
+  """Prune the candidate record pairs of the given blocks with meta-blocking:
+     each candidate pair is weighted by the blocks it occurs in, and only
+     pairs with at least the average weight of all pairs are kept (weighted
+     edge pruning). This works best with blocking methods that put each
+     record into several blocks (such as MinHash LSH blocking).
+
+     Parameter Description:
+       blockA_dict     : Dictionary of blocks from dataset A
+       blockB_dict     : Dictionary of blocks from dataset B
+       weight_scheme   : How pairs are weighted, one of:
+                         'cbs'     - number of common blocks
+                         'arcs'    - sum over common blocks of one divided by
+                                     the number of pairs in the block (pairs
+                                     in small blocks are more likely matches)
+                         'jaccard' - number of common blocks divided by the
+                                     number of blocks of either record
+       max_block_pairs : Blocks with more record pairs are removed before
+                         the weighting (block purging), or None
+
+     This method returns a tuple with the two new block dictionaries (with
+     one block for each record from dataset A) and a dictionary with the
+     number of record pairs before and after, and the number of saved
+     comparisons.
+  """
+
+  assert weight_scheme in ['cbs', 'arcs', 'jaccard'], weight_scheme
+
+  num_pairs_before = _numBlockPairs(blockA_dict, blockB_dict)
+
+  pair_weight_dict = {}  # Record identifier pairs as keys, weights as values
+
+  num_blocksA_dict = {}  # Number of blocks with candidate pairs of each
+  num_blocksB_dict = {}  # record
+
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+
+    if (block_bkv not in blockB_dict):
+      continue
+
+    rec_idB_list = blockB_dict[block_bkv]
+    num_block_pairs = len(rec_idA_list) * len(rec_idB_list)
+
+    if (max_block_pairs is not None) and (num_block_pairs > max_block_pairs):
+      continue
+
+    if (weight_scheme == 'arcs'):
+      block_weight = 1.0 / num_block_pairs
+    else:
+      block_weight = 1.0
+
+    for rec_idA in rec_idA_list:
+      num_blocksA_dict[rec_idA] = num_blocksA_dict.get(rec_idA, 0) + 1
+    for rec_idB in rec_idB_list:
+      num_blocksB_dict[rec_idB] = num_blocksB_dict.get(rec_idB, 0) + 1
+
+    for rec_idA in rec_idA_list:
+      for rec_idB in rec_idB_list:
+        rec_id_pair = (rec_idA, rec_idB)
+        pair_weight_dict[rec_id_pair] = \
+                       pair_weight_dict.get(rec_id_pair, 0.0) + block_weight
+
+  if (weight_scheme == 'jaccard'):
+    for ((rec_idA, rec_idB), num_common) in list(pair_weight_dict.items()):
+      pair_weight_dict[(rec_idA, rec_idB)] = num_common / \
+        (num_blocksA_dict[rec_idA] + num_blocksB_dict[rec_idB] - num_common)
+
+  if (len(pair_weight_dict) > 0):
+    avr_weight = sum(pair_weight_dict.values()) / len(pair_weight_dict)
+  else:
+    avr_weight = 0.0
+
+  rec_idB_list_dict = {}
+
+  for ((rec_idA, rec_idB), weight) in pair_weight_dict.items():
+    if (weight >= avr_weight):
+      if (rec_idA in rec_idB_list_dict):
+        rec_idB_list_dict[rec_idA].append(rec_idB)
+      else:
+        rec_idB_list_dict[rec_idA] = [rec_idB]
+
+  new_blockA_dict, new_blockB_dict = _pairBlocks(rec_idB_list_dict)
+
+  num_pairs_after = _numBlockPairs(new_blockA_dict, new_blockB_dict)
+
+  stats_dict = {'num_pairs_before': num_pairs_before,
+                'num_pairs_after':  num_pairs_after,
+                'num_pairs_saved':  num_pairs_before - num_pairs_after}
+
+  return new_blockA_dict, new_blockB_dict, stats_dict
+
+# -----------------------------------------------------------------------------
+
+class CandidatePairBlocks(collections.abc.Mapping):
+  """Block dictionary of one dataset (A or B) for a set of unique candidate
+     record pairs, with one block for each record from dataset A that is in
+     a pair (using its identifier as blocking key), as returned by _pairBlocks().
+
+     The pairs are stored as a sorted array of 8-byte integer codes (the row
+     of the record from dataset A times the number of records in dataset B
+     plus the row of the record from dataset B), together with the position
+     of the first pair of each record from dataset A. The list of record
+     identifiers of a block is only built when the block is accessed, so
+     iterating over the blocks (as compareBlocks() does) never needs more
+     than one block as Python lists.
+
+     Parameter Description:
+       pair_codes   : Sorted array of the unique pair codes (a numpy array
+                      or an array.array of type 'Q')
+       row_starts   : Array with the position of the first pair code of each
+                      record from dataset A in pair_codes (and the number of
+                      pair codes as its last element)
+       rec_idA_list : List of the record identifiers of dataset A (in the
+                      order of their rows)
+       rec_idB_list : List of the record identifiers of dataset B
+       rowA_dict    : Dictionary with the rows of the records from dataset A
+       dataset      : 'A' or 'B', the dataset of the records in the blocks
+  """
+
+  def __init__(self, pair_codes, row_starts, rec_idA_list, rec_idB_list,
+               rowA_dict, dataset):
+
+    assert dataset in ['A', 'B'], dataset
+
+    self.pair_codes =   pair_codes
+    self.row_starts =   row_starts
+    self.rec_idA_list = rec_idA_list
+    self.rec_idB_list = rec_idB_list
+    self.rowA_dict =    rowA_dict
+    self.dataset =      dataset
+
+    self.num_rowsB =  max(len(rec_idB_list), 1)
+    self.num_blocks = sum(1 for rowA in range(len(rec_idA_list)) if \
+                          row_starts[rowA+1] > row_starts[rowA])
+
+  def __len__(self):
+    return self.num_blocks
+
+  def __iter__(self):
+    row_starts = self.row_starts
+
+    for (rowA, rec_idA) in enumerate(self.rec_idA_list):
+      if (row_starts[rowA+1] > row_starts[rowA]):
+        yield rec_idA
+
+  def __contains__(self, rec_idA):
+    rowA = self.rowA_dict.get(rec_idA)
+
+    return (rowA is not None) and \
+           (self.row_starts[rowA+1] > self.row_starts[rowA])
+
+  def __getitem__(self, rec_idA):
+    if (rec_idA not in self):
+      raise KeyError(rec_idA)
+
+    if (self.dataset == 'A'):
+      return [rec_idA]
+
+    rowA = self.rowA_dict[rec_idA]
+    block_codes = self.pair_codes[self.row_starts[rowA]:
+                                  self.row_starts[rowA+1]]
+    num_rowsB = self.num_rowsB
+    rec_idB_list = self.rec_idB_list
+
+    return [rec_idB_list[int(pair_code) % num_rowsB] for pair_code in \
+            block_codes]
+
+def multiPassBlocking(recA_dict, recB_dict, block_pair_list):
+  """Combine the blocks generated in several blocking passes (for example
+     Soundex encoded surnames in one pass and postcode plus first name in
+     another) into the union of their candidate record pairs, where each
+     pair is kept only once even if it occurs in blocks of several passes.
+
+     Parameter Description:
+       recA_dict       : Dictionary of records from dataset A
+       recB_dict       : Dictionary of records from dataset B
+       block_pair_list : List of tuples (blockA_dict, blockB_dict), one for
+                         each blocking pass
+
+     Each candidate pair is stored as a single integer code (the position of
+     the record from dataset A times the number of records in dataset B plus
+     the position of the record from dataset B) in an array of 8-byte
+     integers, which are then sorted and duplicates removed (using numpy if
+     it is available). The unique pairs are kept in this array (see
+     CandidatePairBlocks), which keeps the memory needed affordable even for
+     tens of millions of candidate pairs.
+
+     This method returns a tuple with the two new block dictionaries (with
+     one block for each record from dataset A, see CandidatePairBlocks) and
+     a dictionary with the number of passes, the number of record pairs of
+     all passes and after removing duplicates, and the number of saved
+     comparisons.
+  """
+
+  rec_idA_list = list(recA_dict.keys())
+  rec_idB_list = list(recB_dict.keys())
+
+  rowA_dict = dict((rec_id, row) for (row, rec_id) in enumerate(rec_idA_list))
+  rowB_dict = dict((rec_id, row) for (row, rec_id) in enumerate(rec_idB_list))
+
+  num_rowsB = max(len(rec_idB_list), 1)
+
+  pair_code_array = array.array('Q')
+
+  num_pairs_before = 0
+
+  for (blockA_dict, blockB_dict) in block_pair_list:
+    num_pairs_before += _numBlockPairs(blockA_dict, blockB_dict)
+
+    for (block_bkv, block_rec_idA_list) in blockA_dict.items():
+
+      if (block_bkv not in blockB_dict):
+        continue
+
+      block_rowB_list = [rowB_dict[rec_idB] for rec_idB in \
+                         blockB_dict[block_bkv]]
+
+      for rec_idA in block_rec_idA_list:
+        code_base = rowA_dict[rec_idA] * num_rowsB
+        pair_code_array.extend([code_base + rowB for rowB in block_rowB_list])
+
+  # Sort the pair codes and remove duplicates, then find the first pair of
+  # each record from dataset A (pairs of the same record are next to each
+  # other in the sorted codes)
+  #
+  try:
+    import numpy
+
+    pair_codes = numpy.unique(numpy.frombuffer(pair_code_array,
+                                               dtype=numpy.uint64))
+    del pair_code_array
+
+    row_starts = array.array('q', numpy.searchsorted(pair_codes,
+                             numpy.arange(len(rec_idA_list) + 1,
+                                          dtype=numpy.uint64) * \
+                             numpy.uint64(num_rowsB)).tolist())
+
+  except ImportError:
+    pair_codes = array.array('Q', sorted(set(pair_code_array)))
+    del pair_code_array
+
+    row_starts = array.array('q', [bisect.bisect_left(pair_codes,
+                                                      rowA * num_rowsB) for \
+                                   rowA in range(len(rec_idA_list) + 1)])
+
+  new_blockA_dict = CandidatePairBlocks(pair_codes, row_starts, rec_idA_list,
+                                        rec_idB_list, rowA_dict, 'A')
+  new_blockB_dict = CandidatePairBlocks(pair_codes, row_starts, rec_idA_list,
+                                        rec_idB_list, rowA_dict, 'B')
+
+  num_pairs_after = len(pair_codes)
+
+  stats_dict = {'num_passes':       len(block_pair_list),
+                'num_pairs_before': num_pairs_before,
+                'num_pairs_after':  num_pairs_after,
+                'num_pairs_saved':  num_pairs_before - num_pairs_after}
+
+  return new_blockA_dict, new_blockB_dict, stats_dict
+
+# -----------------------------------------------------------------------------
+
+def writeBlockingKeys(rec_chunk_iter, file_name, block_funct, *block_args):
+  """Apply the given blocking function to each chunk of records (for example
+     as generated by loadDataset.iter_data_set_chunks()) and write the
+     blocking key values and record identifiers into a CSV file, with one
+     line per record (and blocking key value). Only one chunk of records
+     is kept in memory at any time.
+
+     Parameter Description:
+       rec_chunk_iter : Iterator over dictionaries of records
+       file_name      : Name of the CSV file to write (a CSV.GZ file will be
+                        compressed)
+       block_funct    : The blocking function to apply, such as
+                        simpleBlocking or phoneticBlocking
+       block_args     : The remaining arguments of the blocking function
+                        (after the dictionary of records)
+
+     This method returns the number of lines written.
+  """
+
+  if (file_name.endswith('gz')):
+    out_f = gzip.open(file_name, 'wt', newline='')
+  else:
+    out_f = open(file_name, 'w', newline='')
+
+  csv_writer = csv.writer(out_f)
+
+  num_lines = 0
+
+  for rec_dict in rec_chunk_iter:
+    block_dict = block_funct(rec_dict, *block_args)
+
+    for (block_bkv, rec_id_list) in block_dict.items():
+      for rec_id in rec_id_list:
+        csv_writer.writerow([block_bkv, rec_id])
+      num_lines += len(rec_id_list)
+
+  out_f.close()
+
+  return num_lines
+
+# -----------------------------------------------------------------------------
+
+def loadBlockingKeys(file_name):
+  """Load a file of blocking key values and record identifiers as written by
+     writeBlockingKeys() into a block dictionary.
+  """
+
+  if (file_name.endswith('gz')):
+    in_f = gzip.open(file_name, 'rt', newline='')
+  else:
+    in_f = open(file_name, newline='')
+
+  block_dict = {}
+
+  for (block_bkv, rec_id) in csv.reader(in_f):
+    if (block_bkv in block_dict):
+      block_dict[block_bkv].append(rec_id)
+    else:
+      block_dict[block_bkv] = [rec_id]
+
+  in_f.close()
 
   return block_dict
 
 # -----------------------------------------------------------------------------
 
-# Extra task: Implement canopy clustering based blocking as described in
-# the Data Matching book
+def _blockSizeHistogram(block_size_list):
+  """Return a dictionary with the number of blocks of each size range, where
+     the ranges are powers of two (the keys are the smallest size in each
+     range, so key 4 counts blocks with 4 to 7 records).
+  """
+
+  size_hist_dict = {}
+
+  for block_size in block_size_list:
+    if (block_size > 0):
+      range_start = 1 << (block_size.bit_length() - 1)
+    else:
+      range_start = 0
+    size_hist_dict[range_start] = size_hist_dict.get(range_start, 0) + 1
+
+  return size_hist_dict
 
 # -----------------------------------------------------------------------------
 
-def printBlockStatistics(blockA_dict, blockB_dict):
-  """Calculate and print some basic statistics about the generated blocks
+def blockStatistics(blockA_dict, blockB_dict, true_match_set=None):
+  """Calculate statistics about the generated blocks, including the number of
+     candidate record pairs and (if true matches are given) the pairs
+     completeness and quality of the blocking, without generating the
+     candidate record pairs. This is fast enough to check or rank blocking
+     configurations before any records are compared.
+
+     Parameter Description:
+       blockA_dict    : Dictionary of blocks from dataset A
+       blockB_dict    : Dictionary of blocks from dataset B
+       true_match_set : Set of true matches (record identifier pairs), or
+                        None
+
+     This method returns a dictionary with the following statistics:
+       num_blocksA, num_blocksB : Number of blocks of each dataset
+       num_common_blocks        : Number of blocks in both datasets
+       num_candidate_pairs      : Number of record pairs to compare (a pair
+                                  that occurs in several blocks is counted
+                                  once for each of them)
+       max_block_pairs          : Number of record pairs in the largest block
+       min_block_sizeA, avr_block_sizeA, max_block_sizeA (and for B) :
+                                  Minimum, average and maximum block sizes
+       block_size_histA, block_size_histB :
+                                  Number of blocks for each size range (see
+                                  _blockSizeHistogram)
+       num_true_matches_block   : Number of true matches that are candidate
+                                  pairs (only if true matches are given)
+       pc, pq                   : Pairs completeness and pairs quality (only
+                                  if true matches are given)
   """
 
-  # print('Statistics of the generated blocks:')
+  stats_dict = {'num_blocksA': len(blockA_dict),
+                'num_blocksB': len(blockB_dict)}
+
+  for (block_dict, dataset) in [(blockA_dict, 'A'), (blockB_dict, 'B')]:
+    block_size_list = [len(rec_id_list) for rec_id_list in \
+                       block_dict.values()]
 
-  numA_blocks = len(blockA_dict)
-  numB_blocks = len(blockB_dict)
+    if (len(block_size_list) > 0):
+      stats_dict['min_block_size'+dataset] = min(block_size_list)
+      stats_dict['avr_block_size'+dataset] = \
+                      float(sum(block_size_list)) / len(block_size_list)
+      stats_dict['max_block_size'+dataset] = max(block_size_list)
+    else:
+      stats_dict['min_block_size'+dataset] = 0
+      stats_dict['avr_block_size'+dataset] = 0.0
+      stats_dict['max_block_size'+dataset] = 0
 
-  block_sizeA_list = []
-  for rec_id_list in blockA_dict.values():  # Loop over all blocks
-    block_sizeA_list.append(len(rec_id_list))
+    stats_dict['block_size_hist'+dataset] = \
+                                   _blockSizeHistogram(block_size_list)
 
-  block_sizeB_list = []
-  for rec_id_list in blockB_dict.values():  # Loop over all blocks
-    block_sizeB_list.append(len(rec_id_list))
+  num_common_blocks =   0
+  num_candidate_pairs = 0
+  max_block_pairs =     0
 
-  # print('Dataset A number of blocks generated: %d' % (numA_blocks))
-  # print('    Minimum block size: %d' % (min(block_sizeA_list)))
-  # print('    Average block size: %.2f' % \
-  #       (float(sum(block_sizeA_list)) / len(block_sizeA_list)))
-  # print('    Maximum block size: %d' % (max(block_sizeA_list)))
-  # print('')
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+    if (block_bkv in blockB_dict):
+      num_block_pairs = len(rec_idA_list) * len(blockB_dict[block_bkv])
+
+      num_common_blocks += 1
+      num_candidate_pairs += num_block_pairs
+      max_block_pairs = max(max_block_pairs, num_block_pairs)
+
+  stats_dict['num_common_blocks'] =   num_common_blocks
+  stats_dict['num_candidate_pairs'] = num_candidate_pairs
+  stats_dict['max_block_pairs'] =     max_block_pairs
+
+  if (true_match_set is None):
+    return stats_dict
+
+  # A true match is a candidate pair if its two records share a block, so
+  # only the blocks of the records in true matches are needed
   #
-  # print('Dataset B number of blocks generated: %d' % (numB_blocks))
-  # print('    Minimum block size: %d' % (min(block_sizeB_list)))
-  # print('    Average block size: %.2f' % \
-  #       (float(sum(block_sizeB_list)) / len(block_sizeB_list)))
-  # print('    Maximum block size: %d' % (max(block_sizeB_list)))
-  # print('')
+  rec_idA_set = set(rec_id_pair[0] for rec_id_pair in true_match_set)
+  rec_idB_set = set(rec_id_pair[1] for rec_id_pair in true_match_set)
+
+  rec_bkvA_dict = {}  # Blocking key values of records in true matches
+  rec_bkvB_dict = {}
+
+  for (block_bkv, rec_idA_list) in blockA_dict.items():
+    if (block_bkv in blockB_dict):
+      for rec_idA in rec_idA_list:
+        if (rec_idA in rec_idA_set):
+          rec_bkvA_dict.setdefault(rec_idA, []).append(block_bkv)
+      for rec_idB in blockB_dict[block_bkv]:
+        if (rec_idB in rec_idB_set):
+          rec_bkvB_dict.setdefault(rec_idB, set()).add(block_bkv)
+
+  num_true_matches_block = 0
+
+  for (rec_idA, rec_idB) in true_match_set:
+    if (rec_idA in rec_bkvA_dict) and (rec_idB in rec_bkvB_dict):
+      rec_bkvB_set = rec_bkvB_dict[rec_idB]
+      for block_bkv in rec_bkvA_dict[rec_idA]:
+        if (block_bkv in rec_bkvB_set):
+          num_true_matches_block += 1
+          break
+
+  stats_dict['num_true_matches_block'] = num_true_matches_block
+
+  if (len(true_match_set) > 0):
+    stats_dict['pc'] = float(num_true_matches_block) / len(true_match_set)
+  else:
+    stats_dict['pc'] = 0.0
+
+  if (num_candidate_pairs > 0):
+    stats_dict['pq'] = float(num_true_matches_block) / num_candidate_pairs
+  else:
+    stats_dict['pq'] = 0.0
+
+  return stats_dict
+
+# -----------------------------------------------------------------------------
+
+def printBlockStatistics(blockA_dict, blockB_dict, true_match_set=None):
+  """Calculate (see blockStatistics) and print some basic statistics about
+     the generated blocks.
+  """
+
+  stats_dict = blockStatistics(blockA_dict, blockB_dict, true_match_set)
+
+  print('Statistics of the generated blocks:')
+
+  for dataset in ['A', 'B']:
+    print('Dataset %s number of blocks generated: %d' % \
+          (dataset, stats_dict['num_blocks'+dataset]))
+    print('    Minimum block size: %d' % \
+          (stats_dict['min_block_size'+dataset]))
+    print('    Average block size: %.2f' % \
+          (stats_dict['avr_block_size'+dataset]))
+    print('    Maximum block size: %d' % \
+          (stats_dict['max_block_size'+dataset]))
+    print('    Block size histogram: %s' % \
+          (', '.join('%d+: %d' % size_count for size_count in \
+                     sorted(stats_dict['block_size_hist'+dataset].items()))))
+    print('')
+
+  print('Number of blocks in both datasets: %d' % \
+        (stats_dict['num_common_blocks']))
+  print('Number of candidate record pairs:  %d' % \
+        (stats_dict['num_candidate_pairs']))
+
+  if (true_match_set is not None):
+    print('Pairs completeness: %.3f' % (stats_dict['pc']))
+    print('Pairs quality:      %.3f' % (stats_dict['pq']))
+  print('')
+
+  return stats_dict
 
 # -----------------------------------------------------------------------------
 
@@ -4,8 +4,17 @@
     Each function in this module returns two sets, one with record pairs
     classified as matches and the other with record pairs classified as
     non-matches.
+
+    Instead of a dictionary, all functions can also classify a similarity
+    matrix (see comparison.SimMatrix), which is done with vectorised numpy
+    operations except for the decision tree classifier.
 """
 
+# =============================================================================
+# Import necessary modules
+
+import comparison
+
 # =============================================================================
 
 def exactClassify(sim_vec_dict):
@@ -26,6 +35,10 @@ def exactClassify(sim_vec_dict):
        (recA2, recB5) = [0.0, 1.0, 0.0, 1.0] = non-match
   """
 
+  if isinstance(sim_vec_dict, comparison.SimMatrix):
+    sim_matrix = sim_vec_dict.similarities()
+    return sim_vec_dict.classified_sets((sim_matrix == 1.0).all(axis=1))
+
   # print('Exact classification of %d record pairs' % (len(sim_vec_dict)))
 
   class_match_set    = set()
@@ -65,6 +78,16 @@ def thresholdClassify(sim_vec_dict, sim_thres):
 
   assert sim_thres >= 0.0 and sim_thres <= 1.0, sim_thres
 
+  if isinstance(sim_vec_dict, comparison.SimMatrix):
+    sim_matrix = sim_vec_dict.similarities().astype('float64')
+
+    sim_sum = sim_matrix[:,0].copy()  # Sum similarities in the same order
+    for i in range(1, sim_matrix.shape[1]):
+      sim_sum += sim_matrix[:,i]
+
+    avr_sim = sim_sum / sim_matrix.shape[1]
+    return sim_vec_dict.classified_sets(avr_sim >= sim_thres)
+
   # print('Similarity threshold based classification of %d record pairs' % \
   #       (len(sim_vec_dict)))
   # print('  Classification similarity threshold: %.3f' % (sim_thres))
@@ -108,6 +131,10 @@ def minThresholdClassify(sim_vec_dict, sim_thres):
 
   assert sim_thres >= 0.0 and sim_thres <= 1.0, sim_thres
 
+  if isinstance(sim_vec_dict, comparison.SimMatrix):
+    sim_matrix = sim_vec_dict.similarities()
+    return sim_vec_dict.classified_sets((sim_matrix >= sim_thres).all(axis=1))
+
   # print('Minimum similarity threshold based classification of ' + \
   #       '%d record pairs' % (len(sim_vec_dict)))
   # print('  Classification similarity threshold: %.3f' % (sim_thres))
@@ -161,6 +188,19 @@ def weightedSimilarityClassify(sim_vec_dict, weight_vec, sim_thres):
 
   assert sim_thres >= 0.0 and sim_thres <= 1.0, sim_thres
 
+  if isinstance(sim_vec_dict, comparison.SimMatrix):
+    sim_matrix = sim_vec_dict.similarities()
+    assert len(weight_vec) == sim_matrix.shape[1], len(weight_vec)
+
+    sim_matrix = sim_matrix.astype('float64')
+
+    sim_sum = sim_matrix[:,0] * weight_vec[0]
+    for i in range(1, sim_matrix.shape[1]):
+      sim_sum += sim_matrix[:,i] * weight_vec[i]
+
+    avr_sim = sim_sum / sum(weight_vec)
+    return sim_vec_dict.classified_sets(avr_sim >= sim_thres)
+
   # Check weights are available for all attributes
   #
   first_sim_vec = list(sim_vec_dict.values())[0]
@@ -251,7 +291,7 @@ def supervisedMLClassify(sim_vec_dict, true_match_set):
   # (match or non-match)
   #
   num_train_rec = len(sim_vec_dict)
-  num_features =  len(list(sim_vec_dict.values())[0])
+  num_features =  len(next(iter(sim_vec_dict.values())))
 
   # print('  Number of training records and features: %d / %d' % \
   #       (num_train_rec, num_features))
@@ -264,12 +304,19 @@ def supervisedMLClassify(sim_vec_dict, true_match_set):
   num_pos = 0
   num_neg = 0
 
+  # The similarities of a similarity matrix are copied all at once
+  #
+  is_sim_matrix = isinstance(sim_vec_dict, comparison.SimMatrix)
+  if (is_sim_matrix == True):
+    all_train_data[:] = sim_vec_dict.similarities()
+
   i = 0
   for (rec_id1,rec_id2) in sim_vec_dict:
     rec_pair_id_list.append((rec_id1,rec_id2))
-    sim_vec = sim_vec_dict[(rec_id1,rec_id2)]
 
-    all_train_data[:][i] = sim_vec
+    if (is_sim_matrix == False):
+      sim_vec = sim_vec_dict[(rec_id1,rec_id2)]
+      all_train_data[:][i] = sim_vec
 
     if (rec_id1,rec_id2) in true_match_set:
       all_train_class[i] = 1.0
@@ -373,4 +420,35 @@ def supervisedMLClassify(sim_vec_dict, true_match_set):
 
 # -----------------------------------------------------------------------------
 
+def classifyBatches(sim_batch_iter, classify_funct, *classify_args):
+  """Classify batches of compared record pairs as they are generated (for
+     example by comparison.compareBlocksStream()), so that the similarity
+     vectors of all record pairs never need to be kept in memory at the same
+     time.
+
+     Parameter Description:
+       sim_batch_iter : Iterator over tuples (list of record identifier
+                        pairs, list of similarity vectors)
+       classify_funct : A classification function that classifies each
+                        record pair on its own, such as exactClassify,
+                        thresholdClassify, minThresholdClassify or
+                        weightedSimilarityClassify (but not
+                        supervisedMLClassify, which has to learn from all
+                        record pairs)
+       classify_args  : The remaining arguments of the classification
+                        function (after the similarity vector dictionary)
+
+     This method generates for each batch a tuple with the set of record
+     pairs classified as matches and the set classified as non-matches.
+  """
+
+  assert classify_funct != supervisedMLClassify
+
+  for (rec_id_pair_list, sim_vec_list) in sim_batch_iter:
+    batch_sim_vec_dict = dict(zip(rec_id_pair_list, sim_vec_list))
+
+    yield classify_funct(batch_sim_vec_dict, *classify_args)
+
+# -----------------------------------------------------------------------------
+
 # End of program.
\ No newline at end of file
@@ -3,6 +3,19 @@
     of the compared pairs to be used for classification.
 """
 
+# =============================================================================
+# Import necessary modules
+
+import array
+import collections
+import collections.abc
+import functools
+import itertools
+import multiprocessing
+import os
+
+import loadDataset
+
 Q = 2  # Value length of q-grams for Jaccard and Dice comparison function
 
 # =============================================================================
@@ -114,6 +127,20 @@ def dice_comp(val1, val2):
 
 JARO_MARKER_CHAR = chr(1)  # Special character used in the Jaro, Winkler comp.
 
+def _jaro_find_marker(val, start, end, assigned_flags):
+  """Return the position of the first character in val[start:end] that is
+     either assigned (see jaro_comp()) or the marker character itself, which
+     is where the marker character would be found in a value where assigned
+     characters are replaced with the marker character. Returns -1 if there
+     is no such character.
+  """
+
+  for index in range(start, end):
+    if (assigned_flags[index]) or (val[index] == JARO_MARKER_CHAR):
+      return index
+
+  return -1
+
 def jaro_comp(val1, val2):
   """Calculate the similarity between the two given attribute values based on
      the Jaro comparison function.
@@ -140,32 +167,62 @@ def jaro_comp(val1, val2):
 
   halflen = int(max(len1, len2) / 2) - 1
 
-  assingment1 = ''  # Characters assigned in val1
-  assingment2 = ''  # Characters assigned in val2
+  assigned_flags1 = bytearray(len1)  # Flags of characters assigned to a
+  assigned_flags2 = bytearray(len2)  # common character of the other value
 
-  workstr1 = val1  # Copy of original value1
-  workstr2 = val2  # Copy of original value1
+  common_list1 = []  # Common characters of val1 in their order
+  common_list2 = []  # Common characters of val2 in their order
 
-  common1 = 0  # Number of common characters
-  common2 = 0  # Number of common characters
+  start = -halflen     # Range of positions in the other value where common
+  end =   halflen + 1  # characters can be, moved along with the position
+
+  for ch in val1:  # Analyse the first string
+    if (start < 0):
+      start_pos = 0
+    else:
+      start_pos = start
+
+    if (ch == JARO_MARKER_CHAR):
+      index = _jaro_find_marker(val2, start_pos, min(end, len2),
+                                assigned_flags2)
+    else:  # Find first character in the range that is not yet assigned
+      index = val2.find(ch, start_pos, end)
+      while (index > -1) and (assigned_flags2[index]):
+        index = val2.find(ch, index + 1, end)
 
-  for i in range(len1):  # Analyse the first string
-    start = max(0, i - halflen)
-    end   = min(i + halflen + 1, len2)
-    index = workstr2.find(val1[i], start, end)
     if (index > -1):  # Found common character, count and mark it as assigned
-      common1 += 1
-      assingment1 = assingment1 + val1[i]
-      workstr2 = workstr2[:index] + JARO_MARKER_CHAR + workstr2[index+1:]
-
-  for i in range(len2):  # Analyse the second string
-    start = max(0, i - halflen)
-    end   = min(i + halflen + 1, len1)
-    index = workstr1.find(val2[i], start, end)
+      common_list1.append(ch)
+      assigned_flags2[index] = 1
+
+    start += 1
+    end +=   1
+
+  start = -halflen
+  end =   halflen + 1
+
+  for ch in val2:  # Analyse the second string
+    if (start < 0):
+      start_pos = 0
+    else:
+      start_pos = start
+
+    if (ch == JARO_MARKER_CHAR):
+      index = _jaro_find_marker(val1, start_pos, min(end, len1),
+                                assigned_flags1)
+    else:
+      index = val1.find(ch, start_pos, end)
+      while (index > -1) and (assigned_flags1[index]):
+        index = val1.find(ch, index + 1, end)
+
     if (index > -1):  # Found common character, count and mark it as assigned
-      common2 += 1
-      assingment2 = assingment2 + val2[i]
-      workstr1 = workstr1[:index] + JARO_MARKER_CHAR + workstr1[index+1:]
+      common_list2.append(ch)
+      assigned_flags1[index] = 1
+
+    start += 1
+    end +=   1
+
+  common1 = len(common_list1)  # Number of common characters
+  common2 = len(common_list2)
 
   if (common1 != common2):
     common1 = float(common1 + common2) / 2.0
@@ -175,8 +232,8 @@ def jaro_comp(val1, val2):
 
   transposition = 0  # Calculate number of transpositions
 
-  for i in range(len(assingment1)):
-    if (assingment1[i] != assingment2[i]):
+  for i in range(len(common_list1)):
+    if (common_list1[i] != common_list2[i]):
       transposition += 1
   transposition = transposition / 2.0
 
@@ -228,11 +285,14 @@ def jaro_winkler_comp(val1, val2):
   # Calculate how many characters are common (the same) at beginning
   #
   minlen = min(len(val1), len(val2))
+  maxlen = min(minlen, 5)  # Only up to four characters are counted
 
-  for i in range(1, minlen + 1):
-    if (val1[:i] != val2[:i]):
-      break
-  i -= 1
+  i = 0
+  while (i < maxlen) and (val1[i] == val2[i]):
+    i += 1
+
+  if (i == minlen):  # The shorter value is a prefix of the longer one, its
+    i -= 1           # last character is not counted
 
   if (i > 4):
     i = 4
@@ -296,28 +356,23 @@ def bag_dist_sim_comp(val1, val2):
 
 # -----------------------------------------------------------------------------
 
-def edit_dist_sim_comp(val1, val2):
-  """Calculate the edit distance similarity between the two given attribute
-     values.
-
-     Returns a value between 0.0 and 1.0.
-  """
+EDIT_DIST_MAX_BIT_LEN = 64  # Maximum length of values for which the edit
+                            # distance is calculated with bit vectors
 
-  # If at least one of the values is empty return 0
-  #
-  if (len(val1) == 0) or (len(val2) == 0):
-    return 0.0
+def _edit_dist_dp(val1, val2, max_dist=None):
+  """Calculate the edit distance between the two given attribute values by
+     filling the edit matrix row by row (dynamic programming).
 
-  # If both attribute values exactly match return 1
-  #
-  elif (val1 == val2):
-    return 1.0
+     If a maximum distance is given, max_dist + 1 is returned as soon as all
+     values of a row of the edit matrix are larger than max_dist (as the
+     edit distance cannot become smaller than the minimum of any row).
+  """
 
   # Faster if the first value is longer than the second value, so call
   # function with reversed values
   #
-  elif len(val1) < len(val2):
-    return edit_dist_sim_comp(val2, val1)
+  if len(val1) < len(val2):
+    return _edit_dist_dp(val2, val1, max_dist)
 
   # Iterate through the characters in each value
   #
@@ -338,9 +393,127 @@ def edit_dist_sim_comp(val1, val2):
       #
       current_row.append(min(insertion, deletion, substitution))
 
+    if (max_dist is not None) and (min(current_row) > max_dist):
+      return max_dist + 1
+
     previous_row = current_row  # Set previous row as current one
 
-  edit_dist = current_row[-1]  # Lower right corner of edit matrix
+  return current_row[-1]  # Lower right corner of edit matrix
+
+def _pattern_bit_masks(val):
+  """Return a dictionary with the characters of the given value as keys and
+     bit masks of their positions in the value as values.
+  """
+
+  bit_mask_dict = {}
+  bit = 1
+
+  for ch in val:
+    bit_mask_dict[ch] = bit_mask_dict.get(ch, 0) | bit
+    bit <<= 1
+
+  return bit_mask_dict
+
+def _edit_dist_bit_parallel(bit_mask_dict, pattern_len, val, max_dist=None):
+  """Calculate the edit distance between a pattern value (given by the bit
+     masks of its characters, see _pattern_bit_masks(), and its length) and
+     the given value, with the bit-parallel algorithm of Myers (as described
+     by Hyyro). Each column of the edit matrix is stored as two bit vectors
+     of its positive and negative vertical differences, so that one column
+     is calculated with a few bit operations for each character of the value.
+
+     If a maximum distance is given, max_dist + 1 is returned as soon as the
+     distance in the bottom row is larger than max_dist plus the number of
+     characters of the value left to process.
+  """
+
+  all_bits = (1 << pattern_len) - 1
+  last_bit = 1 << (pattern_len - 1)
+
+  if (max_dist is None):  # Never larger than the length of both values
+    max_dist = pattern_len + len(val)
+
+  dist_limit = max_dist + len(val)
+
+  pos_vert = all_bits  # First column increases by one in each row
+  neg_vert = 0
+  edit_dist = pattern_len
+
+  for ch in val:
+    eq_bits = bit_mask_dict.get(ch, 0)
+
+    x_vert = eq_bits | neg_vert
+    x_hori = (((eq_bits & pos_vert) + pos_vert) ^ pos_vert) | eq_bits
+
+    pos_hori = (neg_vert | ~(x_hori | pos_vert)) & all_bits
+    neg_hori = pos_vert & x_hori
+
+    if (pos_hori & last_bit):  # Bottom row of the edit matrix
+      edit_dist += 1
+    elif (neg_hori & last_bit):
+      edit_dist -= 1
+
+    pos_hori = ((pos_hori << 1) | 1) & all_bits  # First row increases by one
+    neg_hori = (neg_hori << 1) & all_bits
+
+    pos_vert = (neg_hori | ~(x_vert | pos_hori)) & all_bits
+    neg_vert = pos_hori & x_vert
+
+    dist_limit -= 1
+    if (edit_dist > dist_limit):
+      return max_dist + 1
+
+  return edit_dist
+
+def _edit_dist(val1, val2, bit_mask_cache=None, max_dist=None):
+  """Calculate the edit distance between the two given non-empty attribute
+     values, with bit vectors if one of them has at most EDIT_DIST_MAX_BIT_LEN
+     characters (and otherwise with dynamic programming).
+
+     If a bit mask cache dictionary is given, the bit masks of pattern values
+     are taken from it (and added to it). If a maximum distance is given, the
+     calculation can stop early and return max_dist + 1 if the distance is
+     larger than max_dist.
+  """
+
+  if (len(val1) < len(val2)):  # Use the longer value as pattern if possible
+    val1, val2 = val2, val1
+
+  if (len(val1) <= EDIT_DIST_MAX_BIT_LEN):
+    pattern, val = val1, val2
+  elif (len(val2) <= EDIT_DIST_MAX_BIT_LEN):
+    pattern, val = val2, val1
+  else:
+    return _edit_dist_dp(val1, val2, max_dist)
+
+  if (bit_mask_cache is None):
+    bit_mask_dict = _pattern_bit_masks(pattern)
+  else:
+    bit_mask_dict = bit_mask_cache.get(pattern)
+    if (bit_mask_dict is None):
+      bit_mask_dict = _pattern_bit_masks(pattern)
+      bit_mask_cache[pattern] = bit_mask_dict
+
+  return _edit_dist_bit_parallel(bit_mask_dict, len(pattern), val, max_dist)
+
+def edit_dist_sim_comp(val1, val2):
+  """Calculate the edit distance similarity between the two given attribute
+     values.
+
+     Returns a value between 0.0 and 1.0.
+  """
+
+  # If at least one of the values is empty return 0
+  #
+  if (len(val1) == 0) or (len(val2) == 0):
+    return 0.0
+
+  # If both attribute values exactly match return 1
+  #
+  elif (val1 == val2):
+    return 1.0
+
+  edit_dist = _edit_dist(val1, val2)
 
   edit_sim = 1.0 - float(edit_dist) / float(max(len(val1), len(val2)))
 
@@ -357,11 +530,1221 @@ def edit_dist_sim_comp(val1, val2):
 # - emails
 # etc.
 
+# =============================================================================
+# Comparison of derived forms of attribute values
+
+class ValueProfile:
+  """The derived forms of an attribute value that are needed by the q-gram
+     and bag distance comparison functions, so they only need to be built
+     once for each value and not for each comparison of the value.
+
+     Each form is only built when it is first used, so a profile used by one
+     comparison function does not pay for the forms of the others.
+
+     Parameter Description:
+       val : The attribute value
+  """
+
+  __slots__ = ('value', 'length', '_q_gram_set', '_char_count_dict')
+
+  def __init__(self, val):
+    self.value =  val
+    self.length = len(val)
+
+    self._q_gram_set =      None
+    self._char_count_dict = None
+
+  @property
+  def q_gram_set(self):
+    """The set of q-grams of the value.
+    """
+
+    if (self._q_gram_set is None):
+      val = self.value
+      self._q_gram_set = frozenset([val[i:i+Q] for i in \
+                                    range(len(val) - (Q-1))])
+
+    return self._q_gram_set
+
+  @property
+  def char_count_dict(self):
+    """Dictionary with the characters of the value as keys and their numbers
+       as values.
+    """
+
+    if (self._char_count_dict is None):
+      char_count_dict = {}
+      for ch in self.value:
+        char_count_dict[ch] = char_count_dict.get(ch, 0) + 1
+      self._char_count_dict = char_count_dict
+
+    return self._char_count_dict
+
+# -----------------------------------------------------------------------------
+
+def jaccard_comp_profile(profile1, profile2, min_sim=0.0):
+  """Calculate the same Jaccard similarity as jaccard_comp(), from the
+     profiles (see ValueProfile) of the two attribute values.
+
+     Returns 0.0 without comparing the q-gram sets if the similarity is
+     below min_sim because the sizes of the sets are too different.
+  """
+
+  if (profile1.length == 0) or (profile2.length == 0):
+    return 0.0
+  elif (profile1.value == profile2.value):
+    return 1.0
+
+  q_gram_set1 = profile1.q_gram_set
+  q_gram_set2 = profile2.q_gram_set
+
+  if (len(q_gram_set1) == 0) or (len(q_gram_set2) == 0):
+    return 0.0
+
+  # The intersection is at most as large as the smaller set, and the union
+  # at least as large as the larger set
+  #
+  if (min_sim > 0.0) and \
+     (float(min(len(q_gram_set1), len(q_gram_set2))) / \
+      max(len(q_gram_set1), len(q_gram_set2)) < min_sim):
+    return 0.0
+
+  intersect_size = len(q_gram_set1 & q_gram_set2)
+  union_size =     len(q_gram_set1) + len(q_gram_set2) - intersect_size
+
+  return float(intersect_size) / union_size
+
+def dice_comp_profile(profile1, profile2, min_sim=0.0):
+  """Calculate the same Dice coefficient similarity as dice_comp(), from the
+     profiles (see ValueProfile) of the two attribute values.
+
+     Returns 0.0 without comparing the q-gram sets if the similarity is
+     below min_sim because the sizes of the sets are too different.
+  """
+
+  if (profile1.length == 0) or (profile2.length == 0):
+    return 0.0
+  elif (profile1.value == profile2.value):
+    return 1.0
+
+  q_gram_set1 = profile1.q_gram_set
+  q_gram_set2 = profile2.q_gram_set
+
+  if (len(q_gram_set1) == 0) or (len(q_gram_set2) == 0):
+    return 0.0
+
+  # The intersection is at most as large as the smaller set
+  #
+  if (min_sim > 0.0) and \
+     (2.0*min(len(q_gram_set1), len(q_gram_set2)) / \
+      (len(q_gram_set1) + len(q_gram_set2)) < min_sim):
+    return 0.0
+
+  intersect_size = len(q_gram_set1 & q_gram_set2)
+
+  return 2.0*intersect_size / (len(q_gram_set1) + len(q_gram_set2))
+
+def bag_dist_sim_comp_profile(profile1, profile2, min_sim=0.0):
+  """Calculate the same bag distance similarity as bag_dist_sim_comp(), from
+     the profiles (see ValueProfile) of the two attribute values.
+
+     Returns 0.0 without counting the common characters if the similarity is
+     below min_sim because the lengths of the values are too different.
+  """
+
+  len_val1 = profile1.length
+  len_val2 = profile2.length
+
+  if (len_val1 == 0) or (len_val2 == 0):
+    return 0.0
+  elif (profile1.value == profile2.value):
+    return 1.0
+
+  # The bag distance is at least the difference of the lengths
+  #
+  if (min_sim > 0.0) and (1.0 - (float(abs(len_val1 - len_val2)) / \
+                                 float(max(len_val1, len_val2))) < min_sim):
+    return 0.0
+
+  # Number of characters the two values have in common (counting repeated
+  # characters as often as they occur in both values)
+  #
+  char_count_dict2 = profile2.char_count_dict
+  num_common = 0
+
+  for (ch, count1) in profile1.char_count_dict.items():
+    count2 = char_count_dict2.get(ch)
+    if (count2 is not None):
+      num_common += min(count1, count2)
+
+  # After removing the common characters the longer value has the most
+  # characters left
+  #
+  diff = max(len_val1, len_val2) - num_common
+
+  return 1.0 - (float(diff) / float(max(len_val1, len_val2)))
+
+# =============================================================================
+# Comparison with a minimum similarity
+
+# The bounded comparison functions below have a third argument min_sim, and
+# they return the same similarity as the corresponding comparison function if
+# it is at least min_sim. For lower similarities they can stop as soon as it
+# is clear that min_sim cannot be reached, and then return 0.0 (or another
+# similarity below min_sim). This is enough for classifiers that only need to
+# know whether similarities reach a threshold (see minThresholdClassify() in
+# the classification module).
+
+JARO_BOUND_MARGIN = 1e-9  # Safety margin for the rounding of Jaro bounds
+
+def jaccard_comp_bounded(val1, val2, min_sim):
+  """Bounded form of jaccard_comp(), see jaccard_comp_profile().
+  """
+
+  return jaccard_comp_profile(ValueProfile(val1), ValueProfile(val2), min_sim)
+
+def dice_comp_bounded(val1, val2, min_sim):
+  """Bounded form of dice_comp(), see dice_comp_profile().
+  """
+
+  return dice_comp_profile(ValueProfile(val1), ValueProfile(val2), min_sim)
+
+def bag_dist_sim_comp_bounded(val1, val2, min_sim):
+  """Bounded form of bag_dist_sim_comp(). Values with lengths too different
+     to reach min_sim are not compared.
+  """
+
+  if (len(val1) == 0) or (len(val2) == 0):
+    return 0.0
+
+  # The bag distance is at least the difference of the lengths
+  #
+  if (1.0 - (float(abs(len(val1) - len(val2))) / \
+             float(max(len(val1), len(val2)))) < min_sim):
+    return 0.0
+
+  return bag_dist_sim_comp(val1, val2)
+
+# -----------------------------------------------------------------------------
+
+def _max_edit_dist(max_len, min_sim):
+  """Return the largest edit distance between values with at most max_len
+     characters that still gives an edit distance similarity of at least
+     min_sim (-1 if there is none).
+  """
+
+  max_dist = int((1.0 - min_sim) * max_len) + 1
+
+  # Check the bound with the same calculation as edit_dist_sim_comp()
+  #
+  while (max_dist >= 0) and \
+        (1.0 - float(max_dist) / float(max_len) < min_sim):
+    max_dist -= 1
+
+  return max_dist
+
+def edit_dist_sim_comp_bounded(val1, val2, min_sim, bit_mask_cache=None):
+  """Bounded form of edit_dist_sim_comp(). Values with lengths too different
+     to reach min_sim are not compared, and the edit distance calculation
+     stops as soon as the distance becomes too large.
+
+     If a bit mask cache dictionary is given it is used as in _edit_dist().
+  """
+
+  if (len(val1) == 0) or (len(val2) == 0):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  max_len = max(len(val1), len(val2))
+  max_dist = _max_edit_dist(max_len, min_sim)
+
+  if (abs(len(val1) - len(val2)) > max_dist):  # Each character is an edit
+    return 0.0
+
+  edit_dist = _edit_dist(val1, val2, bit_mask_cache, max_dist)
+
+  if (edit_dist > max_dist):
+    return 0.0
+
+  return 1.0 - float(edit_dist) / float(max_len)
+
+# -----------------------------------------------------------------------------
+
+def _max_jaro_sim(val1, val2):
+  """Return an upper bound of the Jaro similarity of the two given values,
+     which is reached if all characters of the shorter value are common
+     characters and there are no transpositions.
+  """
+
+  min_len = float(min(len(val1), len(val2)))
+
+  return 1./3.*(min_len / len(val1) + min_len / len(val2) + 1.0)
+
+def jaro_comp_bounded(val1, val2, min_sim):
+  """Bounded form of jaro_comp(). Values with lengths too different to reach
+     min_sim are not compared.
+  """
+
+  if (val1 == '') or (val2 == ''):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  if (_max_jaro_sim(val1, val2) + JARO_BOUND_MARGIN < min_sim):
+    return 0.0
+
+  return jaro_comp(val1, val2)
+
+def jaro_winkler_comp_bounded(val1, val2, min_sim):
+  """Bounded form of jaro_winkler_comp(). Values with lengths too different
+     to reach min_sim even with the largest Winkler modification are not
+     compared.
+  """
+
+  if (val1 == '') or (val2 == ''):
+    return 0.0
+  elif (val1 == val2):
+    return 1.0
+
+  max_jaro_sim = _max_jaro_sim(val1, val2)
+
+  if (max_jaro_sim + 0.4 * (1.0 - max_jaro_sim) + JARO_BOUND_MARGIN < \
+      min_sim):
+    return 0.0
+
+  return jaro_winkler_comp(val1, val2)
+
+# -----------------------------------------------------------------------------
+
+# Bounded forms of the comparison functions
+#
+BOUNDED_COMP_FUNCT_DICT = {jaccard_comp:       jaccard_comp_bounded,
+                           dice_comp:          dice_comp_bounded,
+                           jaro_comp:          jaro_comp_bounded,
+                           jaro_winkler_comp:  jaro_winkler_comp_bounded,
+                           bag_dist_sim_comp:  bag_dist_sim_comp_bounded,
+                           edit_dist_sim_comp: edit_dist_sim_comp_bounded}
+
+# =============================================================================
+# Batch comparison of attribute values
+
+def _compareBatch(comp_funct, val_list1, val_list2, value_list=None):
+  """Compare the values of the two given lists pairwise with the given
+     comparison function, and return an array with the similarities. Each
+     distinct pair of values is only compared once.
+
+     Parameter Description:
+       comp_funct : The comparison function for attribute values
+       val_list1  : First list of attribute values
+       val_list2  : Second list of attribute values (of the same length)
+       value_list : If given, the two lists contain codes of values, which
+                    are the positions of the values in this list
+  """
+
+  sim_dict =  {}  # Pairs of values (or codes) as keys, similarities as values
+  sim_array = array.array('d')
+
+  for val_pair in zip(val_list1, val_list2):
+    sim = sim_dict.get(val_pair)
+
+    if (sim is None):
+      if (value_list is None):
+        sim = comp_funct(val_pair[0], val_pair[1])
+      else:
+        sim = comp_funct(value_list[val_pair[0]], value_list[val_pair[1]])
+      sim_dict[val_pair] = sim
+
+    sim_array.append(sim)
+
+  return sim_array
+
+# -----------------------------------------------------------------------------
+
+# The batch forms of the comparison functions below have the arguments of
+# _compareBatch() (without comp_funct), and an optional minimum similarity
+# min_sim. For a min_sim larger than 0.0 they can return similarities below
+# min_sim as 0.0, as the bounded comparison functions do.
+
+def exact_comp_batch(val_list1, val_list2, value_list=None, min_sim=0.0):
+  """Batch form of exact_comp().
+  """
+
+  if (value_list is None):
+    return array.array('d', [1.0 if ((val1 == val2) and (val1 != '')) else \
+                             0.0 for (val1, val2) in zip(val_list1,
+                                                         val_list2)])
+
+  # Equal codes mean equal values
+  #
+  return array.array('d', [1.0 if ((code1 == code2) and \
+                                   (value_list[code1] != '')) else 0.0 for \
+                           (code1, code2) in zip(val_list1, val_list2)])
+
+# -----------------------------------------------------------------------------
+
+def _profileCompBatch(profile_comp_funct, value_comp_funct, val_list1,
+                      val_list2, value_list, min_sim):
+  """Compare the values of the two given lists pairwise as _compareBatch()
+     does, with the given comparison function for value profiles (see
+     ValueProfile). The profile of each distinct value is only built once.
+
+     Building a profile costs more than the comparison it saves, so pairs
+     with a value that occurs only once in the two lists are compared with
+     the given comparison function for values (or its bounded form if
+     min_sim is larger than 0.0) instead.
+  """
+
+  # Values (or codes) that occur more than once
+  #
+  val_count_dict = collections.Counter(val_list1)
+  val_count_dict.update(val_list2)
+
+  repeated_val_set = set([val for (val, count) in val_count_dict.items() \
+                          if (count > 1)])
+  if (value_list is not None):
+    repeated_val_set = set([value_list[code] for code in repeated_val_set])
+
+  del val_count_dict
+
+  if (min_sim > 0.0):
+    bounded_comp_funct = BOUNDED_COMP_FUNCT_DICT[value_comp_funct]
+    single_comp_funct = lambda val1, val2: bounded_comp_funct(val1, val2,
+                                                              min_sim)
+  else:
+    single_comp_funct = value_comp_funct
+
+  profile_dict = {}  # Values as keys, their profiles as values
+
+  def comp_funct(val1, val2):
+    if (val1 not in repeated_val_set) or (val2 not in repeated_val_set):
+      return single_comp_funct(val1, val2)
+
+    profile1 = profile_dict.get(val1)
+    if (profile1 is None):
+      profile1 = ValueProfile(val1)
+      profile_dict[val1] = profile1
+
+    profile2 = profile_dict.get(val2)
+    if (profile2 is None):
+      profile2 = ValueProfile(val2)
+      profile_dict[val2] = profile2
+
+    return profile_comp_funct(profile1, profile2, min_sim)
+
+  return _compareBatch(comp_funct, val_list1, val_list2, value_list)
+
+def jaccard_comp_batch(val_list1, val_list2, value_list=None, min_sim=0.0):
+  """Batch form of jaccard_comp().
+  """
+
+  return _profileCompBatch(jaccard_comp_profile, jaccard_comp, val_list1,
+                           val_list2, value_list, min_sim)
+
+def dice_comp_batch(val_list1, val_list2, value_list=None, min_sim=0.0):
+  """Batch form of dice_comp().
+  """
+
+  return _profileCompBatch(dice_comp_profile, dice_comp, val_list1,
+                           val_list2, value_list, min_sim)
+
+def bag_dist_sim_comp_batch(val_list1, val_list2, value_list=None,
+                            min_sim=0.0):
+  """Batch form of bag_dist_sim_comp().
+  """
+
+  return _profileCompBatch(bag_dist_sim_comp_profile, bag_dist_sim_comp, val_list1,
+                           val_list2, value_list, min_sim)
+
+# -----------------------------------------------------------------------------
+
+def jaro_comp_batch(val_list1, val_list2, value_list=None, min_sim=0.0):
+  """Batch form of jaro_comp().
+  """
+
+  if (min_sim > 0.0):
+    comp_funct = lambda val1, val2: jaro_comp_bounded(val1, val2, min_sim)
+  else:
+    comp_funct = jaro_comp
+
+  return _compareBatch(comp_funct, val_list1, val_list2, value_list)
+
+def jaro_winkler_comp_batch(val_list1, val_list2, value_list=None,
+                            min_sim=0.0):
+  """Batch form of jaro_winkler_comp().
+  """
+
+  if (min_sim > 0.0):
+    comp_funct = lambda val1, val2: jaro_winkler_comp_bounded(val1, val2,
+                                                              min_sim)
+  else:
+    comp_funct = jaro_winkler_comp
+
+  return _compareBatch(comp_funct, val_list1, val_list2, value_list)
+
+def edit_dist_sim_comp_batch(val_list1, val_list2, value_list=None,
+                             min_sim=0.0):
+  """Batch form of edit_dist_sim_comp(), where the bit masks of each distinct
+     pattern value are only built once.
+  """
+
+  bit_mask_cache = {}  # Bit masks of the distinct pattern values
+
+  def comp_funct(val1, val2):
+    return edit_dist_sim_comp_bounded(val1, val2, min_sim, bit_mask_cache)
+
+  return _compareBatch(comp_funct, val_list1, val_list2, value_list)
+
+# -----------------------------------------------------------------------------
+
+# Batch forms of the comparison functions
+#
+BATCH_COMP_FUNCT_DICT = {exact_comp:         exact_comp_batch,
+                         jaccard_comp:       jaccard_comp_batch,
+                         dice_comp:          dice_comp_batch,
+                         jaro_comp:          jaro_comp_batch,
+                         jaro_winkler_comp:  jaro_winkler_comp_batch,
+                         bag_dist_sim_comp:  bag_dist_sim_comp_batch,
+                         edit_dist_sim_comp: edit_dist_sim_comp_batch}
+
+def batch_comp_funct(comp_funct):
+  """Return the batch form of the given comparison function. For comparison
+     functions without their own batch form, each distinct pair of values is
+     compared once (see _compareBatch()) and min_sim is not used.
+  """
+
+  batch_funct = BATCH_COMP_FUNCT_DICT.get(comp_funct)
+
+  if (batch_funct is None):
+    def batch_funct(val_list1, val_list2, value_list=None, min_sim=0.0):
+      return _compareBatch(comp_funct, val_list1, val_list2, value_list)
+
+  return batch_funct
+
+# -----------------------------------------------------------------------------
+
+def _attrValueList(rec_dict, rec_id_list, attr_num):
+  """Return the list of values of the given attribute for the records with
+     the given identifiers (records can occur several times), and the value
+     table list if the values are codes of a dictionary encoded column of a
+     column store (otherwise None).
+
+     Each value is taken from its record (and lowercased, as in
+     compareRecord()) only once.
+  """
+
+  if isinstance(rec_dict, loadDataset.ColumnStore):
+    column = rec_dict.column(attr_num)
+    row_index = rec_dict.row_index
+
+    if (column is None):  # Attribute was not loaded
+      return [''] * len(rec_id_list), None
+
+    if isinstance(column, loadDataset.CodedColumn):
+      codes = column.codes
+      return [codes[row_index[rec_id]] for rec_id in rec_id_list], \
+             column.value_table.value_list
+
+    rec_val_dict = dict((rec_id, column[row_index[rec_id]]) for rec_id in \
+                        set(rec_id_list))
+
+  else:
+    rec_val_dict = {}
+
+    for rec_id in set(rec_id_list):
+      rec_values = rec_dict[rec_id]
+
+      if (attr_num >= len(rec_values)):  # No value for this attribute
+        rec_val_dict[rec_id] = ''
+      else:
+        rec_val_dict[rec_id] = rec_values[attr_num].lower()
+
+  return list(map(rec_val_dict.__getitem__, rec_id_list)), None
+
+# -----------------------------------------------------------------------------
+
+class ComparisonCache:
+  """A cache of the similarities of compared attribute value pairs, with the
+     comparison function and the two values as key, which can be used across
+     many calls of compareBlocks() (for example for all configurations of a
+     parameter sweep). It contains at most max_size similarities, and when it
+     is full the least recently used similarity is removed.
+
+     Parameter Description:
+       max_size : Maximum number of similarities kept in the cache
+
+     The numbers of cache hits, misses and evictions are counted, to show how
+     often the same value pairs are compared.
+  """
+
+  def __init__(self, max_size=100000):
+    self.max_size =  max_size
+    self.sim_dict =  collections.OrderedDict()  # Least recently used first
+
+    self.reset_statistics()
+
+  def __len__(self):
+    return len(self.sim_dict)
+
+  def reset_statistics(self):
+    """Set the numbers of cache hits, misses and evictions to zero.
+    """
+
+    self.num_hits =      0
+    self.num_misses =    0
+    self.num_evictions = 0
+
+  def statistics(self):
+    """Return a dictionary with the numbers of cache hits, misses and
+       evictions, the hit rate and the number of cached similarities.
+    """
+
+    num_lookups = self.num_hits + self.num_misses
+
+    if (num_lookups > 0):
+      hit_rate = float(self.num_hits) / num_lookups
+    else:
+      hit_rate = 0.0
+
+    return {'num_hits':      self.num_hits,
+            'num_misses':    self.num_misses,
+            'num_evictions': self.num_evictions,
+            'hit_rate':      hit_rate,
+            'size':          len(self.sim_dict)}
+
+  def compareBatch(self, comp_funct, val_list1, val_list2, value_list=None):
+    """Compare the values of the two given lists pairwise as _compareBatch()
+       does, but take the similarities from the cache where possible.
+    """
+
+    sim_dict =    self.sim_dict
+    max_size =    self.max_size
+    sim_array =   array.array('d')
+    num_misses =  0
+
+    for (val1, val2) in zip(val_list1, val_list2):
+      if (value_list is not None):  # Look up the values of the codes
+        val1 = value_list[val1]
+        val2 = value_list[val2]
+
+      key = (comp_funct, val1, val2)
+      sim = sim_dict.get(key)
+
+      if (sim is None):
+        sim = comp_funct(val1, val2)
+        num_misses += 1
+
+        sim_dict[key] = sim
+        if (len(sim_dict) > max_size):
+          sim_dict.popitem(last=False)
+          self.num_evictions += 1
+      else:
+        sim_dict.move_to_end(key)
+
+      sim_array.append(sim)
+
+    self.num_hits +=   len(sim_array) - num_misses
+    self.num_misses += num_misses
+
+    return sim_array
+
+# -----------------------------------------------------------------------------
+
+# Smallest average number of pairs per distinct record for which compareColumns()
+# compares the pairs attribute by attribute (a block with 4 records from each
+# dataset has 2 pairs per record)
+#
+COLUMN_MIN_PAIRS_PER_RECORD = 2.0
+
+def _comparePairVectors(rec_idA_list, rec_idB_list, recA_dict, recB_dict,
+                        attr_comp_list, min_sim=0.0):
+  """Compare the record pairs given by the two lists of record identifiers
+     one pair at a time with compareRecord(), using the bounded comparison
+     functions if min_sim is larger than 0.0, and return the list of their
+     similarity vectors.
+  """
+
+  if (min_sim > 0.0):
+    pair_comp_list = []
+
+    for (comp_funct, attr_numA, attr_numB) in attr_comp_list:
+      bounded_comp_funct = BOUNDED_COMP_FUNCT_DICT.get(comp_funct)
+      if (bounded_comp_funct is not None):
+        comp_funct = lambda val1, val2, bounded_comp_funct= \
+                       bounded_comp_funct: bounded_comp_funct(val1, val2,
+                                                              min_sim)
+      pair_comp_list.append((comp_funct, attr_numA, attr_numB))
+  else:
+    pair_comp_list = attr_comp_list
+
+  return [compareRecord(recA_dict[rec_idA], recB_dict[rec_idB],
+                        pair_comp_list) for (rec_idA, rec_idB) in \
+          zip(rec_idA_list, rec_idB_list)]
+
+def _comparePairByPair(rec_idA_list, rec_idB_list, comp_cache, cascade):
+  """Return True if the record pairs given by the two lists of record
+     identifiers are better compared one pair at a time than attribute by
+     attribute (see compareColumns()).
+  """
+
+  return (comp_cache is None) and (cascade is None) and \
+         (len(rec_idA_list) < COLUMN_MIN_PAIRS_PER_RECORD * \
+          (len(set(rec_idA_list)) + len(set(rec_idB_list))))
+
+def compareColumns(rec_idA_list, rec_idB_list, recA_dict, recB_dict,
+                   attr_comp_list, comp_cache=None, min_sim=0.0,
+                   cascade=None):
+  """Compare the record pairs given by the two lists of record identifiers
+     (the i-th pair is rec_idA_list[i] and rec_idB_list[i]) attribute by
+     attribute, using the batch forms of the comparison functions.
+
+     Parameter Description:
+       rec_idA_list   : List of record identifiers from dataset A
+       rec_idB_list   : List of record identifiers from dataset B
+       recA_dict      : Dictionary of records from dataset A
+       recB_dict      : Dictionary of records from dataset B
+       attr_comp_list : List of comparison methods (see compareBlocks())
+       comp_cache     : A ComparisonCache to take similarities from, or None
+       min_sim        : Minimum similarity, if larger than 0.0 similarities
+                        below it can be returned as 0.0 (not used with a
+                        comparison cache, which keeps exact similarities)
+       cascade        : A CascadedComparison to compare the pairs with
+                        (min_sim is then not used, as the cascade sets the
+                        minimum similarity of each attribute itself), or None
+
+     Attributes that are dictionary encoded with the same value table in two
+     column stores are compared on their codes.
+
+     Extracting the values of each attribute and remembering the
+     similarities of distinct value pairs only pays off if records (and so
+     their values) occur in several pairs. If the pairs have on average
+     fewer than COLUMN_MIN_PAIRS_PER_RECORD pairs per distinct record (as
+     with many small blocks), and neither a comparison cache nor a cascade
+     is given, the pairs are instead compared one at a time with
+     compareRecord().
+
+     This method returns a list with one array of similarities for each
+     compared attribute.
+  """
+
+  if (cascade is not None):
+    return cascade.compareColumns(rec_idA_list, rec_idB_list, recA_dict,
+                                  recB_dict, attr_comp_list, comp_cache)
+
+  if _comparePairByPair(rec_idA_list, rec_idB_list, comp_cache, cascade):
+    sim_vec_list = _comparePairVectors(rec_idA_list, rec_idB_list, recA_dict,
+                                       recB_dict, attr_comp_list, min_sim)
+    if (len(sim_vec_list) == 0):
+      return [array.array('d') for attr_comp in attr_comp_list]
+
+    return [array.array('d', sim_list) for sim_list in zip(*sim_vec_list)]
+
+  sim_array_list = []
+
+  for (comp_funct, attr_numA, attr_numB) in attr_comp_list:
+    (val_listA, value_listA) = _attrValueList(recA_dict, rec_idA_list,
+                                              attr_numA)
+    (val_listB, value_listB) = _attrValueList(recB_dict, rec_idB_list,
+                                              attr_numB)
+
+    if (value_listA is not value_listB):  # Not the same value table
+      if (value_listA is not None):
+        val_listA = [value_listA[code] for code in val_listA]
+      if (value_listB is not None):
+        val_listB = [value_listB[code] for code in val_listB]
+      value_listA = None
+
+    if (comp_cache is not None):
+      sim_array = comp_cache.compareBatch(comp_funct, val_listA, val_listB,
+                                          value_listA)
+    else:
+      sim_array = batch_comp_funct(comp_funct)(val_listA, val_listB,
+                                               value_listA, min_sim)
+
+    sim_array_list.append(sim_array)
+
+  return sim_array_list
+
+# -----------------------------------------------------------------------------
+
+# Number of record pairs that are compared together by compareBlocks(), so that
+# the lists of values and the memos of similarities of distinct value pairs are
+# never built for all candidate pairs at once
+#
+COMPARE_BATCH_SIZE = 10000
+
+def _uniqueRecordPairLists(blockA_dict, blockB_dict):
+  """Generate tuples of a record identifier from dataset A and the list of
+     all record identifiers from dataset B it is in a block with, where each
+     record from dataset B is only included once even if the two records are
+     in several blocks together.
+
+     Only the identifiers of the blocks of each record from dataset A are
+     kept in memory, and the pairs of one record at a time.
+  """
+
+  rec_bkv_dict = {}  # Records from dataset A as keys, their blocks as values
+
+  for (block_bkv, block_rec_idA_list) in blockA_dict.items():
+    if (block_bkv in blockB_dict):
+      for rec_idA in block_rec_idA_list:
+        if (rec_idA in rec_bkv_dict):
+          rec_bkv_dict[rec_idA].append(block_bkv)
+        else:
+          rec_bkv_dict[rec_idA] = [block_bkv]
+
+  for (rec_idA, block_bkv_list) in rec_bkv_dict.items():
+    if (len(block_bkv_list) == 1):
+      yield rec_idA, blockB_dict[block_bkv_list[0]]
+      continue
+
+    seen_rec_idB_set = set()
+    rec_idB_list = []
+
+    for block_bkv in block_bkv_list:
+      for rec_idB in blockB_dict[block_bkv]:
+        if (rec_idB not in seen_rec_idB_set):
+          seen_rec_idB_set.add(rec_idB)
+          rec_idB_list.append(rec_idB)
+
+    yield rec_idA, rec_idB_list
+
+def _blockPairBatches(blockA_dict, blockB_dict, batch_size,
+                      unique_pairs=False):
+  """Generate tuples of two lists with the record identifiers from dataset A
+     and B of the record pairs of the given blocks, with at least batch_size
+     pairs in each tuple (except the last one), in the order of
+     compareBlocks() (a pair that occurs in several blocks is included once
+     for each).
+
+     If unique_pairs is True, each pair is only included once, and the pairs
+     are ordered by the records from dataset A instead (see
+     _uniqueRecordPairLists()).
+  """
+
+  if (unique_pairs == True):
+    rec_pair_iter = _uniqueRecordPairLists(blockA_dict, blockB_dict)
+  else:
+    rec_pair_iter = ((rec_idA, blockB_dict[block_bkv]) for \
+                     (block_bkv, block_rec_idA_list) in blockA_dict.items() \
+                     if (block_bkv in blockB_dict) \
+                     for rec_idA in block_rec_idA_list)
+
+  rec_idA_list = []
+  rec_idB_list = []
+
+  for (rec_idA, block_rec_idB_list) in rec_pair_iter:
+    rec_idA_list.extend([rec_idA] * len(block_rec_idB_list))
+    rec_idB_list.extend(block_rec_idB_list)
+
+    if (len(rec_idA_list) >= batch_size):
+      yield rec_idA_list, rec_idB_list
+
+      rec_idA_list = []
+      rec_idB_list = []
+
+  if (len(rec_idA_list) > 0):
+    yield rec_idA_list, rec_idB_list
+
+# =============================================================================
+# Cascaded comparison of record pairs
+
+# Relative costs of comparing two attribute values with the comparison
+# functions (measured on names and addresses), used to compare the attributes
+# with cheap comparison functions first in a cascaded comparison
+#
+COMP_FUNCT_COST_DICT = {exact_comp:         1,
+                        bag_dist_sim_comp:  4,
+                        dice_comp:          5,
+                        jaccard_comp:       5,
+                        edit_dist_sim_comp: 6,
+                        jaro_comp:          8,
+                        jaro_winkler_comp:  9}
+
+DEFAULT_COMP_FUNCT_COST = 10  # Cost of other comparison functions
+
+CASCADE_MARGIN = 1e-9  # Safety margin for the rounding of similarity sums
+
+class CascadedComparison:
+  """Compare record pairs attribute by attribute, and skip the remaining
+     attributes of a pair as soon as its classification by the given
+     classifier cannot change any more. Similarities of skipped attributes
+     are set to 0.0, which gives the same classification.
+
+     Parameter Description:
+       classify_method : The classifier, 'exact', 'minsim', 'simthresh' or
+                         'weightsim' (see exactClassify(),
+                         minThresholdClassify(), thresholdClassify() and
+                         weightedSimilarityClassify() in the classification
+                         module)
+       sim_thres       : The classification similarity threshold (not used
+                         for 'exact')
+       weight_vec      : The list of (non-negative) attribute weights for
+                         'weightsim'
+       attr_order      : The positions of the attributes in the comparison
+                         list in the order they are compared, or None to
+                         compare them in the order of the costs of their
+                         comparison functions (see COMP_FUNCT_COST_DICT)
+
+     The numbers of compared and skipped attribute value pairs are counted.
+  """
+
+  def __init__(self, classify_method, sim_thres=1.0, weight_vec=None,
+               attr_order=None):
+
+    assert classify_method in ['exact', 'minsim', 'simthresh',
+                               'weightsim'], classify_method
+
+    if (classify_method == 'weightsim'):
+      assert min(weight_vec) >= 0.0, weight_vec
+
+    self.classify_method = classify_method
+    self.sim_thres =       sim_thres
+    self.weight_vec =      weight_vec
+    self.attr_order =      attr_order
+
+    self.reset_statistics()
+
+  def reset_statistics(self):
+    """Set the numbers of compared record pairs and of compared and skipped
+       attribute value pairs to zero.
+    """
+
+    self.num_pairs =    0
+    self.num_compared = 0
+    self.num_skipped =  0
+
+  def statistics(self):
+    """Return a dictionary with the numbers of compared record pairs and of
+       compared and skipped attribute value pairs, and the skipped fraction
+       of all attribute value pairs.
+    """
+
+    num_attr_pairs = self.num_compared + self.num_skipped
+
+    if (num_attr_pairs > 0):
+      skip_rate = float(self.num_skipped) / num_attr_pairs
+    else:
+      skip_rate = 0.0
+
+    return {'num_pairs':    self.num_pairs,
+            'num_compared': self.num_compared,
+            'num_skipped':  self.num_skipped,
+            'skip_rate':    skip_rate}
+
+  def compare_order(self, attr_comp_list):
+    """Return the list of positions of the attributes in the given list of
+       comparison methods in the order they are compared.
+    """
+
+    if (self.attr_order is not None):
+      assert sorted(self.attr_order) == list(range(len(attr_comp_list))), \
+             self.attr_order
+      return list(self.attr_order)
+
+    return sorted(range(len(attr_comp_list)), key=lambda attr_pos: \
+                  COMP_FUNCT_COST_DICT.get(attr_comp_list[attr_pos][0],
+                                           DEFAULT_COMP_FUNCT_COST))
+
+  def compareColumns(self, rec_idA_list, rec_idB_list, recA_dict, recB_dict,
+                     attr_comp_list, comp_cache=None):
+    """Compare the record pairs given by the two lists of record identifiers
+       as the module function compareColumns() does, but only compare each
+       attribute for the pairs whose classification is not yet decided.
+    """
+
+    num_pairs = len(rec_idA_list)
+    num_attrs = len(attr_comp_list)
+
+    # For exact and minimum threshold classification a pair is a non-match
+    # as soon as one similarity is below the threshold, so attribute values
+    # can be compared with this minimum similarity. Otherwise pairs are
+    # classified on the (weighted) sum of their similarities
+    #
+    sum_classify = self.classify_method in ['simthresh', 'weightsim']
+
+    if (self.classify_method == 'exact'):
+      min_sim = 1.0
+    elif (self.classify_method == 'minsim'):
+      min_sim = self.sim_thres
+    else:
+      min_sim = 0.0
+
+      if (self.classify_method == 'weightsim'):
+        weight_list = self.weight_vec
+      else:
+        weight_list = [1.0] * num_attrs
+
+      weight_sum =    float(sum(weight_list))
+      remain_weight = weight_sum  # Weight of attributes not yet compared
+
+      sim_sum_list = [0.0] * num_pairs
+
+    sim_array_list = [None] * num_attrs
+    undecided_list = list(range(num_pairs))  # Positions of undecided pairs
+
+    for (order_num, attr_pos) in enumerate(self.compare_order(attr_comp_list)):
+
+      if (len(undecided_list) == num_pairs):
+        pair_idA_list = rec_idA_list
+        pair_idB_list = rec_idB_list
+      else:
+        pair_idA_list = [rec_idA_list[pos] for pos in undecided_list]
+        pair_idB_list = [rec_idB_list[pos] for pos in undecided_list]
+
+      sim_array = compareColumns(pair_idA_list, pair_idB_list, recA_dict,
+                                 recB_dict, [attr_comp_list[attr_pos]],
+                                 comp_cache, min_sim)[0]
+
+      if (len(undecided_list) == num_pairs):
+        sim_array_list[attr_pos] = sim_array
+      else:
+        pair_sim_array = array.array('d', bytes(8 * num_pairs))
+        for (pos, sim) in zip(undecided_list, sim_array):
+          pair_sim_array[pos] = sim
+        sim_array_list[attr_pos] = pair_sim_array
+
+      num_undecided = len(undecided_list)
+      self.num_compared += num_undecided
+
+      if (order_num == num_attrs - 1):  # All attributes are compared
+        break
+
+      # Keep only the pairs whose classification can still change
+      #
+      if (sum_classify == False):
+        undecided_list = [pos for (pos, sim) in zip(undecided_list,
+                                                    sim_array) \
+                          if (sim >= min_sim)]
+      else:
+        weight = weight_list[attr_pos]
+        remain_weight -= weight
+
+        min_sum = (self.sim_thres - CASCADE_MARGIN) * weight_sum
+        max_sum = (self.sim_thres + CASCADE_MARGIN) * weight_sum
+
+        new_undecided_list = []
+
+        for (pos, sim) in zip(undecided_list, sim_array):
+          sim_sum = sim_sum_list[pos] + sim * weight
+          sim_sum_list[pos] = sim_sum
+
+          # Not decided if the threshold is neither reached nor out of reach
+          #
+          if (sim_sum + remain_weight >= min_sum) and (sim_sum < max_sum):
+            new_undecided_list.append(pos)
+
+        undecided_list = new_undecided_list
+
+      self.num_skipped += (num_undecided - len(undecided_list)) * \
+                          (num_attrs - order_num - 1)
+
+    self.num_pairs += num_pairs
+
+    return sim_array_list
+
+# =============================================================================
+# Compact similarity matrix of compared record pairs
+
+class SimMatrix(collections.abc.Mapping):
+  """The similarity vectors of compared record pairs stored in numpy arrays:
+     two arrays with the row numbers of the records of each pair in dataset A
+     and B, and a matrix with one row of similarities per pair. This needs
+     much less memory than a dictionary of record identifier pairs and lists
+     of similarities, and allows classification to be vectorised.
+
+     Parameter Description:
+       rowA         : Integer array with the row numbers in dataset A
+       rowB         : Integer array with the row numbers in dataset B
+       sim_matrix   : Matrix with the similarities of each pair, of type
+                      float64 or float32, or of type uint8 with the
+                      similarities quantised into the values 0 to 255
+       rec_idA_list : List of the record identifiers of dataset A (in the
+                      order of the row numbers)
+       rec_idB_list : List of the record identifiers of dataset B
+
+     A similarity matrix can be used like a similarity vector dictionary (see
+     compareBlocks), with record identifier pairs as keys and lists of
+     similarities as values, by all classification and evaluation functions.
+     Only float64 similarities give exactly the same classification as a
+     dictionary, as similarities equal (or very close) to a classification
+     threshold can end up on the other side of it when they are rounded to
+     float32 or quantised.
+  """
+
+  def __init__(self, rowA, rowB, sim_matrix, rec_idA_list, rec_idB_list):
+
+    assert len(rowA) == len(rowB) == len(sim_matrix)
+
+    self.rowA =         rowA
+    self.rowB =         rowB
+    self.sim_matrix =   sim_matrix
+    self.rec_idA_list = rec_idA_list
+    self.rec_idB_list = rec_idB_list
+
+    self.pair_pos_dict = None  # Only built if pairs are looked up
+
+  def __len__(self):
+    return len(self.rowA)
+
+  def __iter__(self):
+    return zip(map(self.rec_idA_list.__getitem__, self.rowA.tolist()),
+               map(self.rec_idB_list.__getitem__, self.rowB.tolist()))
+
+  def __getitem__(self, rec_id_pair):
+    if (self.pair_pos_dict is None):
+      self.pair_pos_dict = dict((pair, pos) for (pos, pair) in \
+                                enumerate(self))
+
+    return self.similarities(self.pair_pos_dict[rec_id_pair]).tolist()
+
+  def similarities(self, pos=None):
+    """Return the matrix of all similarities (or the similarities of the pair
+       at the given position), converting quantised similarities back into
+       float32 values in the range 0.0 to 1.0.
+    """
+
+    if (pos is None):
+      sim_matrix = self.sim_matrix
+    else:
+      sim_matrix = self.sim_matrix[pos]
+
+    if (sim_matrix.dtype.name == 'uint8'):
+      return sim_matrix.astype('float32') / 255
+
+    return sim_matrix
+
+  def rec_id_pair(self, pos):
+    """Return the record identifier pair at the given position.
+    """
+
+    return (self.rec_idA_list[self.rowA[pos]],
+            self.rec_idB_list[self.rowB[pos]])
+
+  def values(self, chunk_size=65536):
+    """Generate the similarity vectors of all pairs as lists.
+    """
+
+    for start in range(0, len(self), chunk_size):
+      for sim_vec in self.similarities()[start:start+chunk_size].tolist():
+        yield sim_vec
+
+  def items(self):
+    """Generate tuples of record identifier pairs and similarity vectors.
+    """
+
+    return zip(self, self.values())
+
+  def classified_sets(self, match_mask):
+    """Return a tuple with the set of record identifier pairs where the given
+       boolean array is True (matches) and the set of all other pairs
+       (non-matches).
+    """
+
+    rec_id_pair_list = list(self)
+
+    class_match_set =    set(itertools.compress(rec_id_pair_list,
+                                                match_mask.tolist()))
+    class_nonmatch_set = set(itertools.compress(rec_id_pair_list,
+                                                (~match_mask).tolist()))
+
+    return class_match_set, class_nonmatch_set
+
+# -----------------------------------------------------------------------------
+
+# Set once the missing numpy module has been reported by _compareBlocksMatrix()
+#
+_numpy_fallback_reported = False
+
+def _compareBlocksMatrix(blockA_dict, blockB_dict, recA_dict, recB_dict,
+                         attr_comp_list, sim_dtype, comp_cache=None,
+                         min_sim=0.0, cascade=None,
+                         batch_size=COMPARE_BATCH_SIZE):
+  """Compare the record pairs of the given blocks as in compareBlocks() and
+     return their similarities as a SimMatrix (or None if numpy is not
+     installed). Pairs that occur in several blocks are only kept once.
+  """
+
+  global _numpy_fallback_reported
+
+  try:
+    import numpy
+  except ImportError:
+    if (not _numpy_fallback_reported):
+      print('The "numpy" module is not installed! Falling back to ' + \
+            'dictionary output.')
+      print('')
+      _numpy_fallback_reported = True
+
+    return None
+
+  rec_idA_list = list(recA_dict.keys())
+  rec_idB_list = list(recB_dict.keys())
+
+  rowA_index = dict((rec_id, row) for (row, rec_id) in enumerate(rec_idA_list))
+  rowB_index = dict((rec_id, row) for (row, rec_id) in enumerate(rec_idB_list))
+
+  rowA_list =       []
+  rowB_list =       []
+  sim_matrix_list = []
+
+  for (pair_idA_list, pair_idB_list) in _blockPairBatches(blockA_dict,
+                                                          blockB_dict,
+                                                          batch_size):
+    rowA_list.append(numpy.array([rowA_index[rec_idA] for rec_idA in \
+                                  pair_idA_list], dtype=numpy.int64))
+    rowB_list.append(numpy.array([rowB_index[rec_idB] for rec_idB in \
+                                  pair_idB_list], dtype=numpy.int64))
+
+    sim_array_list = compareColumns(pair_idA_list, pair_idB_list, recA_dict,
+                                    recB_dict, attr_comp_list, comp_cache,
+                                    min_sim, cascade)
+
+    batch_sim_matrix = numpy.empty((len(pair_idA_list), len(attr_comp_list)),
+                                   dtype=numpy.float64)
+    for (col_num, sim_array) in enumerate(sim_array_list):
+      batch_sim_matrix[:,col_num] = numpy.frombuffer(sim_array,
+                                                     dtype=numpy.float64)
+    sim_matrix_list.append(batch_sim_matrix)
+
+  if (len(rowA_list) > 0):
+    rowA =       numpy.concatenate(rowA_list)
+    rowB =       numpy.concatenate(rowB_list)
+    sim_matrix = numpy.concatenate(sim_matrix_list)
+  else:
+    rowA =       numpy.empty(0, dtype=numpy.int64)
+    rowB =       numpy.empty(0, dtype=numpy.int64)
+    sim_matrix = numpy.empty((0, len(attr_comp_list)), dtype=numpy.float64)
+
+  del rowA_list, rowB_list, sim_matrix_list
+
+  # Keep only the first occurrence of pairs that are in several blocks
+  #
+  pair_codes = rowA * max(len(rec_idB_list), 1) + rowB
+  first_pos = numpy.unique(pair_codes, return_index=True)[1]
+
+  if (len(first_pos) < len(pair_codes)):
+    first_pos.sort()
+    rowA, rowB, sim_matrix = rowA[first_pos], rowB[first_pos], \
+                             sim_matrix[first_pos]
+
+  if (sim_dtype == 'uint8'):
+    sim_matrix = numpy.rint(sim_matrix * 255).astype(numpy.uint8)
+  elif (sim_dtype == 'float32'):
+    sim_matrix = sim_matrix.astype(numpy.float32)
+  else:
+    assert sim_dtype == 'float64', sim_dtype
+
+  return SimMatrix(rowA.astype(numpy.int32), rowB.astype(numpy.int32),
+                   sim_matrix, rec_idA_list, rec_idB_list)
+
 # =============================================================================
 # Function to compare a block
 
 def compareBlocks(blockA_dict, blockB_dict, recA_dict, recB_dict, \
-                  attr_comp_list):
+                  attr_comp_list, output='dict', sim_dtype='float64',
+                  comp_cache=None, min_sim=0.0, cascade=None,
+                  batch_size=COMPARE_BATCH_SIZE):
   """Build a similarity dictionary with pair of records from the two given
      block dictionaries. Candidate pairs are generated by pairing each record
      in a given block from data set A with all the records in the same block
@@ -380,6 +1763,30 @@ def compareBlocks(blockA_dict, blockB_dict, recA_dict, recB_dict, \
                         where each tuple contains: (comparison function,
                         attribute number in record A, attribute number in
                         record B).
+       output         : 'dict' to return a similarity vector dictionary, or
+                        'matrix' to return a SimMatrix (needs numpy)
+       sim_dtype      : Type of the similarities of a SimMatrix, 'float64',
+                        'float32' or 'uint8' (quantised to 256 levels)
+       comp_cache     : A ComparisonCache to take similarities of attribute
+                        value pairs from (and add them to), or None
+       min_sim        : Minimum similarity, if larger than 0.0 attribute
+                        values are compared with the bounded comparison
+                        functions, and similarities below min_sim can be
+                        returned as 0.0. This gives the same classification
+                        with minThresholdClassify() (with a threshold of at
+                        least min_sim) and exactClassify() (with min_sim 1.0)
+       cascade        : A CascadedComparison to compare the pairs with,
+                        which skips the remaining attributes of a pair once
+                        its classification is decided, or None
+       batch_size     : Number of record pairs that are compared together
+
+     The candidate pairs are compared in batches of batch_size pairs,
+     attribute by attribute with the batch forms of the comparison functions
+     (see compareColumns()), where each attribute value is only extracted
+     once per record of a batch, and the similarity of each distinct pair of
+     values is only calculated once per batch. Attributes
+     that are dictionary encoded with the same value table in two column
+     stores (see loadDataset.ColumnStore) are compared on their codes.
 
      This method returns a similarity vector with one similarity value per
      compared record pair.
@@ -393,42 +1800,244 @@ def compareBlocks(blockA_dict, blockB_dict, recA_dict, recB_dict, \
   # print('Compare %d blocks from dataset A with %d blocks from dataset B' % \
   #       (len(blockA_dict), len(blockB_dict)))
 
-  sim_vec_dict = {}  # A dictionary where keys are record pairs and values
-                     # lists of similarity values
+  if (output == 'matrix'):
+    sim_matrix = _compareBlocksMatrix(blockA_dict, blockB_dict, recA_dict,
+                                      recB_dict, attr_comp_list, sim_dtype,
+                                      comp_cache, min_sim, cascade,
+                                      batch_size)
+    if (sim_matrix is not None):
+      return sim_matrix
+
+  # Compare each batch of candidate pairs attribute by attribute, then combine
+  # the similarities of each pair into its similarity vector (a pair that
+  # occurs in several blocks keeps the similarities of its last occurrence)
+  #
+  sim_vec_dict = {}
+
+  for (pair_idA_list, pair_idB_list) in _blockPairBatches(blockA_dict,
+                                                          blockB_dict,
+                                                          batch_size):
+    if _comparePairByPair(pair_idA_list, pair_idB_list, comp_cache, cascade):
+      sim_vec_list = _comparePairVectors(pair_idA_list, pair_idB_list,
+                                         recA_dict, recB_dict, attr_comp_list,
+                                         min_sim)
+    else:
+      sim_array_list = compareColumns(pair_idA_list, pair_idB_list, recA_dict,
+                                      recB_dict, attr_comp_list, comp_cache,
+                                      min_sim, cascade)
+      sim_vec_list = map(list, zip(*sim_array_list))
+
+    sim_vec_dict.update(zip(zip(pair_idA_list, pair_idB_list), sim_vec_list))
+
+  # print('  Compared %d record pairs' % (len(sim_vec_dict)))
+  # print('')
+
+  return sim_vec_dict
+
+# -----------------------------------------------------------------------------
+
+def compareBlocksStream(blockA_dict, blockB_dict, recA_dict, recB_dict,
+                        attr_comp_list, batch_size=COMPARE_BATCH_SIZE,
+                        comp_cache=None, min_sim=0.0, cascade=None,
+                        unique_pairs=False):
+  """Compare the record pairs of the given blocks in the same way as
+     compareBlocks(), but instead of returning one dictionary with all
+     compared pairs generate batches of compared pairs, so that only one
+     batch needs to be kept in memory.
+
+     Parameter Description:
+       blockA_dict    : Dictionary of blocks from dataset A
+       blockB_dict    : Dictionary of blocks from dataset B
+       recA_dict      : Dictionary of records from dataset A
+       recB_dict      : Dictionary of records from dataset B
+       attr_comp_list : List of comparison methods (see compareBlocks())
+       batch_size     : Number of record pairs in each batch
+       comp_cache     : A ComparisonCache to take similarities from, or None
+       min_sim        : Minimum similarity (see compareBlocks())
+       cascade        : A CascadedComparison, or None (see compareBlocks())
+       unique_pairs   : If True, a record pair that occurs in several blocks
+                        is only compared once (for blocks that can overlap,
+                        such as canopies), otherwise once for each block
+
+     This method generates tuples (list of record identifier pairs, list of
+     similarity vectors), where the lists of all batches contain all compared
+     record pairs in the order of compareBlocks(). With unique_pairs the pairs
+     are instead ordered by their records from dataset A, and duplicate pairs
+     are removed while the pairs of each record are generated, so the memory
+     needed does not depend on the total number of pairs.
+  """
+
+  def compare_batch(pair_idA_list, pair_idB_list):
+    if _comparePairByPair(pair_idA_list, pair_idB_list, comp_cache, cascade):
+      return list(zip(pair_idA_list, pair_idB_list)), \
+             _comparePairVectors(pair_idA_list, pair_idB_list, recA_dict,
+                                 recB_dict, attr_comp_list, min_sim)
+
+    sim_array_list = compareColumns(pair_idA_list, pair_idB_list, recA_dict,
+                                    recB_dict, attr_comp_list, comp_cache,
+                                    min_sim, cascade)
+    return list(zip(pair_idA_list, pair_idB_list)), \
+           list(map(list, zip(*sim_array_list)))
+
+  for (pair_idA_list, pair_idB_list) in _blockPairBatches(blockA_dict,
+                                                          blockB_dict,
+                                                          batch_size,
+                                                          unique_pairs):
+    yield compare_batch(pair_idA_list, pair_idB_list)
+
+# -----------------------------------------------------------------------------
+
+# Records and comparison methods used by the worker processes of
+# compareBlocksParallel(), set once in each worker by _initCompareWorker()
+#
+_worker_data = None
+
+def _initCompareWorker(recA_dict, recB_dict, attr_comp_list, min_sim=0.0,
+                       cascade=None):
+  """Store the records, comparison methods, minimum similarity and cascaded
+     comparison (each worker counts with its own copy) in a worker process.
+     With the 'fork' start method the arguments are inherited from the
+     parent process without being copied.
+  """
+
+  global _worker_data
+
+  _worker_data = (recA_dict, recB_dict, attr_comp_list, min_sim, cascade)
+
+def _compareTiles(tile_list):
+  """Compare all record pairs of the given list of tiles (tuples of a list of
+     record identifiers from dataset A and a list from dataset B), and return
+     their similarity vectors concatenated into one array, in the order of
+     the tiles and pairs, together with a tuple of the numbers of compared
+     record pairs, and compared and skipped attribute value pairs of the
+     cascaded comparison (or None without cascaded comparison).
+  """
+
+  (recA_dict, recB_dict, attr_comp_list, min_sim, cascade) = _worker_data
+
+  if (cascade is not None):
+    cascade.reset_statistics()  # Only count the pairs of these tiles
+
+  sim_array = array.array('d')
+
+  for (rec_idA_list, rec_idB_list) in tile_list:
+    tile_sim_vec_dict = compareBlocks({0: rec_idA_list}, {0: rec_idB_list},
+                                      recA_dict, recB_dict, attr_comp_list,
+                                      min_sim=min_sim, cascade=cascade)
+    for rec_idA in rec_idA_list:
+      for rec_idB in rec_idB_list:
+        sim_array.extend(tile_sim_vec_dict[(rec_idA, rec_idB)])
+
+  if (cascade is None):
+    return sim_array, None
+
+  return sim_array, (cascade.num_pairs, cascade.num_compared,
+                     cascade.num_skipped)
+
+def compareBlocksParallel(blockA_dict, blockB_dict, recA_dict, recB_dict,
+                          attr_comp_list, num_workers=None,
+                          max_tile_pairs=20000, min_sim=0.0, cascade=None):
+  """Build the same similarity dictionary as compareBlocks(), but compare the
+     record pairs in several worker processes.
+
+     Parameter Description:
+       blockA_dict    : Dictionary of blocks from dataset A
+       blockB_dict    : Dictionary of blocks from dataset B
+       recA_dict      : Dictionary of records from dataset A
+       recB_dict      : Dictionary of records from dataset B
+       attr_comp_list : List of comparison methods (see compareBlocks())
+       num_workers    : Number of worker processes (default is the number of
+                        CPUs)
+       max_tile_pairs : Maximum number of record pairs compared in one task
+       min_sim        : Minimum similarity (see compareBlocks())
+       cascade        : A CascadedComparison, or None (see compareBlocks()),
+                        whose counts include the pairs of all workers
+
+     The blocks are divided into tiles of at most max_tile_pairs record pairs
+     (large blocks are split into parts of their records from dataset A, and
+     if needed from dataset B), and neighbouring tiles are combined into
+     tasks of about max_tile_pairs pairs, which are distributed over the
+     workers. The records are given to each worker once when it is started
+     (with the 'fork' start method they are shared with the parent process),
+     and workers return only arrays of similarity values. The result does not
+     depend on the number of workers, and the order of the record pairs is
+     the same as in compareBlocks() unless a block has more than
+     max_tile_pairs records from dataset B.
+  """
+
+  if (num_workers is None):
+    num_workers = os.cpu_count() or 1
 
-  # Iterate through each block in block dictionary from dataset A
+  if (num_workers <= 1):
+    return compareBlocks(blockA_dict, blockB_dict, recA_dict, recB_dict,
+                         attr_comp_list, min_sim=min_sim, cascade=cascade)
+
+  # Divide the blocks into tiles, and group the tiles into tasks
   #
+  task_list = []
+
+  task_tile_list = []
+  task_num_pairs = 0
+
   for (block_bkv, rec_idA_list) in blockA_dict.items():
+    if (block_bkv not in blockB_dict):
+      continue
 
-    # Check if the same blocking key occurs also for dataset B
-    #
-    if (block_bkv in blockB_dict):
+    rec_idB_list = blockB_dict[block_bkv]
 
-      # If so get the record identifier list from dataset B
-      #
-      rec_idB_list = blockB_dict[block_bkv]
+    tileB_size = min(len(rec_idB_list), max_tile_pairs)
+    tileA_size = max(max_tile_pairs // max(tileB_size, 1), 1)
 
-      # Compare each record in rec_id_listA with each record from rec_id_listB
-      #
-      for rec_idA in rec_idA_list:
+    for startA in range(0, len(rec_idA_list), tileA_size):
+      tileA_list = rec_idA_list[startA:startA+tileA_size]
 
-        recA = recA_dict[rec_idA]  # Get the actual record A
+      for startB in range(0, len(rec_idB_list), tileB_size):
+        tileB_list = rec_idB_list[startB:startB+tileB_size]
 
-        for rec_idB in rec_idB_list:
+        task_tile_list.append((tileA_list, tileB_list))
+        task_num_pairs += len(tileA_list) * len(tileB_list)
 
-          recB = recB_dict[rec_idB]  # Get the actual record B
+        if (task_num_pairs >= max_tile_pairs):
+          task_list.append(task_tile_list)
+          task_tile_list = []
+          task_num_pairs = 0
 
-          # generate the similarity vector
-          #
-          sim_vec = compareRecord(recA, recB, attr_comp_list)
+  if (len(task_tile_list) > 0):
+    task_list.append(task_tile_list)
 
-          # Add the similarity vector of the compared pair to the similarity
-          # vector dictionary
-          #
-          sim_vec_dict[(rec_idA, rec_idB)] = sim_vec
+  if ('fork' in multiprocessing.get_all_start_methods()):
+    mp_context = multiprocessing.get_context('fork')
+  else:
+    mp_context = multiprocessing.get_context()
 
-  # print('  Compared %d record pairs' % (len(sim_vec_dict)))
-  # print('')
+  num_attrs = len(attr_comp_list)
+
+  sim_vec_dict = {}
+
+  with mp_context.Pool(num_workers, _initCompareWorker,
+                       (recA_dict, recB_dict, attr_comp_list, min_sim,
+                        cascade)) as pool:
+
+    # Results are returned in the order of the tasks, so record pairs can be
+    # matched with their similarity values
+    #
+    for (task_tile_list, (sim_array, cascade_counts)) in \
+        zip(task_list, pool.imap(_compareTiles, task_list)):
+
+      if (cascade_counts is not None):
+        cascade.num_pairs +=    cascade_counts[0]
+        cascade.num_compared += cascade_counts[1]
+        cascade.num_skipped +=  cascade_counts[2]
+
+      sim_list = sim_array.tolist()
+      sim_pos = 0
+
+      for (rec_idA_list, rec_idB_list) in task_tile_list:
+        for rec_idA in rec_idA_list:
+          for rec_idB in rec_idB_list:
+            sim_vec_dict[(rec_idA, rec_idB)] = \
+                                         sim_list[sim_pos:sim_pos+num_attrs]
+            sim_pos += num_attrs
 
   return sim_vec_dict
 
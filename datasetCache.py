@@ -0,0 +1,336 @@
+""" Module with functionalities for caching parsed data sets and truth data in
+    binary files, so they can be loaded much faster than by parsing the
+    original CSV files again.
+
+    A cache file contains the normalised (stripped and lowercased) values of
+    the used attributes, stored as the byte buffers and offset arrays of the
+    columns of a column store (see loadDataset.StringColumn). When loaded the
+    cache file is memory mapped, so the columns directly use the mapped file.
+
+    Each cache file records the path, size, modification time and content
+    hash of its source file as well as the loading parameters, and it is
+    rebuilt automatically if any of these have changed (the content hash is
+    only compared if asked for, as this reads the whole source file).
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import array
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+
+import loadDataset
+
+CACHE_MAGIC =   b'RLCACHE1'  # First bytes of each cache file
+CACHE_VERSION = 1            # Increase if the file format changes
+
+# -----------------------------------------------------------------------------
+
+def file_content_hash(file_name, block_size=1<<20):
+  """Calculate the SHA-1 hash (as hexadecimal string) of the content of the
+     given file.
+  """
+
+  content_hash = hashlib.sha1()
+
+  with open(file_name, 'rb') as in_f:
+    block = in_f.read(block_size)
+    while (block):
+      content_hash.update(block)
+      block = in_f.read(block_size)
+
+  return content_hash.hexdigest()
+
+# -----------------------------------------------------------------------------
+
+def cache_key(file_name, load_param_dict):
+  """Build the dictionary that identifies a cached version of the given file
+     (without the content hash, which is only calculated when needed).
+
+     Parameter Description:
+       file_name       : Name of the source data file
+       load_param_dict : Dictionary with the parameters used for loading
+  """
+
+  file_stat = os.stat(file_name)
+
+  key_dict = {'version':    CACHE_VERSION,
+              'byteorder':  sys.byteorder,
+              'path':       os.path.abspath(file_name),
+              'size':       file_stat.st_size,
+              'mtime':      file_stat.st_mtime_ns,
+              'load_param': load_param_dict}
+
+  return key_dict
+
+# -----------------------------------------------------------------------------
+
+def cache_file_name(cache_dir, file_name, load_param_dict):
+  """Return the name of the cache file for the given source file and loading
+     parameters.
+  """
+
+  name_str = os.path.abspath(file_name) + json.dumps(load_param_dict,
+                                                     sort_keys=True)
+  name_hash = hashlib.sha1(name_str.encode('utf-8')).hexdigest()[:16]
+
+  return os.path.join(cache_dir, os.path.basename(file_name) + '.' + \
+                      name_hash + '.rlc')
+
+# -----------------------------------------------------------------------------
+
+def write_cache_file(file_name, key_dict, column_list, num_attrs=0):
+  """Write the given columns into a binary cache file.
+
+     Parameter Description:
+       file_name   : Name of the cache file to write
+       key_dict    : Dictionary identifying the cached source (see cache_key)
+       column_list : List of tuples (column name, StringColumn)
+       num_attrs   : Number of attributes per record of the data set
+
+     The file starts with a magic string and the length of a JSON header,
+     followed by the header and then the 8-byte aligned buffers and offset
+     arrays of all columns. Offsets are stored as absolute positions in the
+     file, so a memory mapped file can be used directly as the buffer of all
+     columns.
+  """
+
+  header_dict = {'key': key_dict, 'num_attrs': num_attrs, 'columns': []}
+
+  # The header has to be written before the data, but the data positions
+  # depend on the header length, so reserve space for the column positions
+  # by first building the header with dummy positions
+  #
+  for (col_name, column) in column_list:
+    header_dict['columns'].append({'name':       col_name,
+                                   'buf_pos':    0,
+                                   'offset_pos': 0,
+                                   'num_values': len(column)})
+
+  def _header_bytes(pad_len):
+    header_bytes = json.dumps(header_dict).encode('utf-8')
+    return header_bytes + b' ' * (pad_len - len(header_bytes))
+
+  header_len = len(_header_bytes(0)) + 48 * len(column_list) + 64
+  header_len += (-header_len) % 8
+  data_pos = len(CACHE_MAGIC) + 8 + header_len
+
+  # Calculate the position of each column buffer and offset array
+  #
+  for (col_num, (col_name, column)) in enumerate(column_list):
+    buf_start = column.offsets[0]
+    buf_len =   column.offsets[len(column)] - buf_start
+
+    col_header = header_dict['columns'][col_num]
+    col_header['buf_pos'] = data_pos
+    data_pos += buf_len
+    data_pos += (-data_pos) % 8
+    col_header['offset_pos'] = data_pos
+    data_pos += 8 * (len(column) + 1)
+
+  header_bytes = _header_bytes(header_len)
+  assert len(header_bytes) == header_len, (len(header_bytes), header_len)
+
+  tmp_file_name = file_name + '.tmp%d' % (os.getpid())
+
+  with open(tmp_file_name, 'wb') as out_f:
+    out_f.write(CACHE_MAGIC)
+    out_f.write(struct.pack('<Q', header_len))
+    out_f.write(header_bytes)
+
+    for (col_num, (col_name, column)) in enumerate(column_list):
+      col_header = header_dict['columns'][col_num]
+
+      buf_start = column.offsets[0]
+      buf_end =   column.offsets[len(column)]
+
+      assert out_f.tell() == col_header['buf_pos']
+      out_f.write(column.buf[buf_start:buf_end])
+      out_f.write(b'\0' * ((-out_f.tell()) % 8))
+
+      # Convert offsets into absolute positions in the cache file
+      #
+      shift = col_header['buf_pos'] - buf_start
+      offsets = array.array('Q', [offset + shift for offset in \
+                                  column.offsets])
+      assert out_f.tell() == col_header['offset_pos']
+      out_f.write(offsets.tobytes())
+
+  os.replace(tmp_file_name, file_name)  # Only complete files become visible
+
+# -----------------------------------------------------------------------------
+
+def read_cache_file(file_name):
+  """Memory map the given cache file and return a tuple (key dictionary,
+     number of attributes, dictionary of columns with column names as keys).
+
+     Returns None if the file is not a valid cache file.
+  """
+
+  with open(file_name, 'rb') as in_f:
+    if (in_f.read(len(CACHE_MAGIC)) != CACHE_MAGIC):
+      return None
+
+    cache_mmap = mmap.mmap(in_f.fileno(), 0, access=mmap.ACCESS_READ)
+
+  header_len = struct.unpack('<Q', cache_mmap[len(CACHE_MAGIC): \
+                                              len(CACHE_MAGIC)+8])[0]
+  header_start = len(CACHE_MAGIC) + 8
+
+  try:
+    header_dict = json.loads(cache_mmap[header_start:header_start + \
+                                        header_len].decode('utf-8'))
+  except ValueError:
+    return None
+
+  cache_view = memoryview(cache_mmap)
+
+  column_dict = {}
+
+  for col_header in header_dict['columns']:
+    offset_pos = col_header['offset_pos']
+    offset_end = offset_pos + 8 * (col_header['num_values'] + 1)
+
+    offsets = cache_view[offset_pos:offset_end].cast('Q')
+
+    column_dict[col_header['name']] = \
+                           loadDataset.StringColumn(cache_mmap, offsets)
+
+  return header_dict['key'], header_dict['num_attrs'], column_dict
+
+# -----------------------------------------------------------------------------
+
+def _load_valid_cache(cache_name, file_name, key_dict, check_content):
+  """Return the content of the given cache file if it exists and matches the
+     given key dictionary (and if required the hash of the content of the
+     given source file), otherwise None.
+  """
+
+  if (not os.path.exists(cache_name)):
+    return None
+
+  cache_content = read_cache_file(cache_name)
+
+  if (cache_content is None):
+    return None
+
+  cache_key_dict = dict(cache_content[0])
+  cache_hash = cache_key_dict.pop('hash', None)
+
+  if (cache_key_dict != key_dict):
+    return None
+
+  if (check_content == True) and \
+     (cache_hash != file_content_hash(file_name)):
+    return None
+
+  return cache_content
+
+# -----------------------------------------------------------------------------
+
+def load_data_set_cached(file_name, rec_id_col, use_attr_list, header_line,
+                         cache_dir='.rl_cache', check_content=False):
+  """Load the data set as a column store (see loadDataset.load_column_store)
+     from its cache file, parsing the data file and writing the cache file
+     first if no valid cache file exists.
+
+     Parameter Description:
+       file_name      : Name of the data file to be read (CSV or CSV.GZ file)
+       rec_id_col     : Record identifier column of the data file
+       use_attr_list  : List of attributes to extract from the file
+       header_line    : Availability of the header line (True of False)
+       cache_dir      : Directory where cache files are stored
+       check_content  : If True a cache file is only used if the hash of the
+                        content of the data file is unchanged, in addition
+                        to its size and modification time (which are always
+                        checked). Hashing reads the whole data file, so it
+                        is only done if asked for
+  """
+
+  load_param_dict = {'type':          'data_set',
+                     'rec_id_col':    rec_id_col,
+                     'use_attr_list': sorted(set(use_attr_list)),
+                     'header_line':   header_line}
+
+  key_dict =   cache_key(file_name, load_param_dict)
+  cache_name = cache_file_name(cache_dir, file_name, load_param_dict)
+
+  cache_content = _load_valid_cache(cache_name, file_name, key_dict,
+                                    check_content)
+
+  if (cache_content is None):  # Parse the data file and write cache file
+    rec_store = loadDataset.load_column_store(file_name, rec_id_col,
+                                              use_attr_list, header_line)
+
+    column_list = [('rec_id', rec_store.rec_id_column)]
+    for (attr_id, column) in sorted(rec_store.column_dict.items()):
+      column_list.append((str(attr_id), column))
+
+    key_dict['hash'] = file_content_hash(file_name)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    write_cache_file(cache_name, key_dict, column_list, rec_store.num_attrs)
+
+    cache_content = read_cache_file(cache_name)
+
+  (num_attrs, column_dict) = cache_content[1:]
+
+  rec_id_column = column_dict.pop('rec_id')
+  column_dict = dict((int(attr_id), column) for (attr_id, column) in \
+                     column_dict.items())
+
+  return loadDataset.ColumnStore(rec_id_column, column_dict, num_attrs)
+
+# -----------------------------------------------------------------------------
+
+def load_truth_data_cached(file_name, cache_dir='.rl_cache',
+                           check_content=False):
+  """Load a truth data set (see loadDataset.load_truth_data) from its cache
+     file, parsing the truth data file and writing the cache file first if
+     no valid cache file exists.
+
+     Parameter Description:
+       file_name     : Name of the truth data file to be read
+       cache_dir     : Directory where cache files are stored
+       check_content : If True a cache file is only used if the hash of the
+                       content of the truth data file is unchanged, in
+                       addition to its size and modification time
+  """
+
+  load_param_dict = {'type': 'truth_data'}
+
+  key_dict =   cache_key(file_name, load_param_dict)
+  cache_name = cache_file_name(cache_dir, file_name, load_param_dict)
+
+  cache_content = _load_valid_cache(cache_name, file_name, key_dict,
+                                    check_content)
+
+  if (cache_content is None):  # Parse the truth file and write cache file
+    truth_data_set = loadDataset.load_truth_data(file_name)
+
+    rec_id_pair_list = sorted(truth_data_set)
+
+    column_list = [('rec_id1', loadDataset.StringColumn.from_values( \
+                                     [pair[0] for pair in rec_id_pair_list])),
+                   ('rec_id2', loadDataset.StringColumn.from_values( \
+                                     [pair[1] for pair in rec_id_pair_list]))]
+
+    key_dict['hash'] = file_content_hash(file_name)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    write_cache_file(cache_name, key_dict, column_list)
+
+    return truth_data_set
+
+  column_dict = cache_content[2]
+
+  return set(zip(column_dict['rec_id1'], column_dict['rec_id2']))
+
+# -----------------------------------------------------------------------------
+
+# End of program.
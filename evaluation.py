@@ -275,6 +275,88 @@ def pairs_quality(cand_rec_id_pair_list, true_match_set):
 
   return pq
 
+# =============================================================================
+# Evaluation of record pairs that are classified in batches
+
+class BatchEvaluation:
+  """Count the values of the confusion matrix and the true matches among the
+     candidate record pairs for record pairs that are classified in batches
+     (see classification.classifyBatches()), without keeping the classified
+     non-matches.
+
+     Parameter Description:
+       true_match_set  : Set of true matches (record identifier pairs)
+       all_comparisons : The total number of comparisons between all record
+                         pairs
+
+     Each record pair must be added only once. The methods of this class give
+     the same results as the corresponding functions of this module for all
+     added record pairs.
+  """
+
+  def __init__(self, true_match_set, all_comparisons):
+
+    self.true_match_set =  true_match_set
+    self.all_comparisons = all_comparisons
+
+    self.num_comparisons =        0  # Number of added record pairs
+    self.num_true_matches_block = 0  # Number of added true matches
+    self.num_tp =                 0
+    self.num_fp =                 0
+
+  def add_batch(self, class_match_set, class_nonmatch_set):
+    """Add the record pairs of a batch classified as matches and non-matches.
+    """
+
+    true_match_set = self.true_match_set
+
+    num_tp = 0
+    for rec_id_tuple in class_match_set:
+      if (rec_id_tuple in true_match_set):
+        num_tp += 1
+
+    num_fn = 0
+    for rec_id_tuple in class_nonmatch_set:
+      if (rec_id_tuple in true_match_set):
+        num_fn += 1
+
+    self.num_tp += num_tp
+    self.num_fp += len(class_match_set) - num_tp
+
+    self.num_comparisons += len(class_match_set) + len(class_nonmatch_set)
+    self.num_true_matches_block += num_tp + num_fn
+
+  def confusion_matrix(self):
+    """Return the list with the TP, FP, FN and TN values (see
+       confusion_matrix()).
+    """
+
+    # All true matches that are not classified as matches are false
+    # negatives, whether they were compared or not
+    #
+    num_fn = len(self.true_match_set) - self.num_tp
+    num_tn = self.all_comparisons - self.num_tp - self.num_fp - num_fn
+
+    return [self.num_tp, self.num_fp, num_fn, num_tn]
+
+  def reduction_ratio(self):
+    """Return the reduction ratio of the added record pairs.
+    """
+
+    return reduction_ratio(self.num_comparisons, self.all_comparisons)
+
+  def pairs_completeness(self):
+    """Return the pairs completeness of the added record pairs.
+    """
+
+    return float(self.num_true_matches_block) / len(self.true_match_set)
+
+  def pairs_quality(self):
+    """Return the pairs quality of the added record pairs.
+    """
+
+    return float(self.num_true_matches_block) / self.num_comparisons
+
 # -----------------------------------------------------------------------------
 
 # End of program.
\ No newline at end of file
@@ -1,6 +1,10 @@
 """ Module with functionalities for reading data from a file and return a
     dictionary with record identifiers as keys and a list of attribute values.
 
+    Alternatively a data set can be loaded into a column store, which keeps
+    one compact column per used attribute and integer row numbers for records,
+    while still behaving like the dictionary of records for existing code.
+
     Also provides a function to load a truth data set of record pairs that are
     matches.
 """
@@ -8,8 +12,15 @@
 # =============================================================================
 # Import necessary modules
 
+import array
+import collections.abc
 import csv
 import gzip
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
 
 # -----------------------------------------------------------------------------
 
@@ -48,6 +59,10 @@ def load_data_set(file_name, rec_id_col, use_attr_list, header_line):
   rec_num =  0
   rec_dict = {}
 
+  dup_rec_id_list = []  # Identifiers that occur more than once
+
+  use_attr_set = set(use_attr_list)  # Faster to check than a list
+
   # Iterate through the record in the file
   #
   for rec_list in csv_reader:
@@ -57,10 +72,13 @@ def load_data_set(file_name, rec_id_col, use_attr_list, header_line):
     #
     rec_id = rec_list[rec_id_col].strip().lower()
 
+    if (rec_id in rec_dict):
+      dup_rec_id_list.append(rec_id)
+
     rec_val_list = []  # One value list per record
 
     for attr_id in range(len(rec_list)):
-      if attr_id in use_attr_list:
+      if attr_id in use_attr_set:
         rec_val_list.append(rec_list[attr_id].strip().lower())
       else:
         rec_val_list.append('')
@@ -73,6 +91,8 @@ def load_data_set(file_name, rec_id_col, use_attr_list, header_line):
     print('  *** Warning, data set contains %d duplicates ***' % \
           (rec_num - len(rec_dict)))
     print('       %d unique records' % (len(rec_dict)))
+    print('       Duplicate record identifiers: %s' % \
+          (_dup_rec_id_str(dup_rec_id_list)))
 
   # print('')
 
@@ -82,6 +102,643 @@ def load_data_set(file_name, rec_id_col, use_attr_list, header_line):
 
 # -----------------------------------------------------------------------------
 
+def _load_data_shard(shard_tuple):
+  """Parse the records between two byte positions of an uncompressed data
+     file, used by load_data_set_parallel() in each worker process.
+
+     Returns a tuple (dictionary of records, number of records parsed, list
+     of duplicate record identifiers within the shard).
+  """
+
+  (file_name, start_pos, end_pos, rec_id_col, use_attr_list) = shard_tuple
+
+  with open(file_name, 'rb') as in_f:
+    in_f.seek(start_pos)
+    shard_str = in_f.read(end_pos - start_pos).decode('utf-8')
+
+  use_attr_set = set(use_attr_list)
+
+  rec_num =  0
+  rec_dict = {}
+
+  dup_rec_id_list = []
+
+  for rec_list in csv.reader(io.StringIO(shard_str, newline='')):
+    rec_num += 1
+
+    rec_id = rec_list[rec_id_col].strip().lower()
+
+    if (rec_id in rec_dict):
+      dup_rec_id_list.append(rec_id)
+
+    rec_val_list = []  # One value list per record
+
+    for attr_id in range(len(rec_list)):
+      if attr_id in use_attr_set:
+        rec_val_list.append(rec_list[attr_id].strip().lower())
+      else:
+        rec_val_list.append('')
+
+    rec_dict[rec_id] = rec_val_list
+
+  return rec_dict, rec_num, dup_rec_id_list
+
+# -----------------------------------------------------------------------------
+
+def load_data_set_parallel(file_name, rec_id_col, use_attr_list, header_line,
+                           num_workers=None):
+  """Load the data set into the same dictionary as load_data_set(), but
+     parse the file in parallel using a pool of worker processes.
+
+     Parameter Description:
+       file_name      : Name of the data file to be read (CSV or CSV.GZ file)
+       rec_id_col     : Record identifier column of the data file
+       use_attr_list  : List of attributes to extract from the file
+       header_line    : Availability of the header line (True of False)
+       num_workers    : Number of worker processes (default is the number of
+                        CPU cores)
+
+     The file is split into one shard per worker at line boundaries, so
+     values must not contain line breaks (quoted multi-line values are not
+     supported). A CSV.GZ file is first decompressed into a temporary file.
+  """
+
+  if (num_workers is None):
+    num_workers = os.cpu_count() or 1
+
+  tmp_file_name = None
+
+  if (file_name.endswith('gz')):  # Decompress into a temporary file
+    with gzip.open(file_name, 'rb') as in_f:
+      with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as tmp_f:
+        shutil.copyfileobj(in_f, tmp_f, 1<<20)
+        tmp_file_name = tmp_f.name
+
+    data_file_name = tmp_file_name
+  else:
+    data_file_name = file_name
+
+  try:
+    file_size = os.path.getsize(data_file_name)
+
+    # Find the shard boundaries, each at the start of a line
+    #
+    with open(data_file_name, 'rb') as in_f:
+      if (header_line == True):
+        in_f.readline()
+      start_pos = in_f.tell()
+
+      shard_pos_list = [start_pos]
+
+      for shard_num in range(1, num_workers):
+        pos = start_pos + (file_size - start_pos) * shard_num // num_workers
+
+        if (pos <= shard_pos_list[-1]):
+          continue
+
+        in_f.seek(pos - 1)
+        in_f.readline()  # Move to the start of the next line
+
+        if (in_f.tell() > shard_pos_list[-1]) and (in_f.tell() < file_size):
+          shard_pos_list.append(in_f.tell())
+
+      shard_pos_list.append(file_size)
+
+    shard_list = []
+    for i in range(len(shard_pos_list) - 1):
+      shard_list.append((data_file_name, shard_pos_list[i],
+                         shard_pos_list[i+1], rec_id_col, use_attr_list))
+
+    if (len(shard_list) == 1):
+      shard_result_list = [_load_data_shard(shard_list[0])]
+    else:
+      with multiprocessing.Pool(len(shard_list)) as pool:
+        shard_result_list = pool.map(_load_data_shard, shard_list)
+
+  finally:
+    if (tmp_file_name is not None):
+      os.remove(tmp_file_name)
+
+  # Merge the shards in file order, so later duplicates overwrite earlier
+  # records as in load_data_set()
+  #
+  rec_num =  0
+  rec_dict = {}
+
+  dup_rec_id_list = []
+
+  for (shard_rec_dict, shard_rec_num, shard_dup_rec_id_list) in \
+      shard_result_list:
+    rec_num += shard_rec_num
+    dup_rec_id_list += shard_dup_rec_id_list
+
+    if (len(rec_dict) == 0):
+      rec_dict = shard_rec_dict
+      continue
+
+    for rec_id in shard_rec_dict:
+      if (rec_id in rec_dict):
+        dup_rec_id_list.append(rec_id)
+
+    rec_dict.update(shard_rec_dict)
+
+  if (len(rec_dict) < rec_num):
+    print('  *** Warning, data set contains %d duplicates ***' % \
+          (rec_num - len(rec_dict)))
+    print('       %d unique records' % (len(rec_dict)))
+    print('       Duplicate record identifiers: %s' % \
+          (_dup_rec_id_str(dup_rec_id_list)))
+
+  return rec_dict
+
+# -----------------------------------------------------------------------------
+
+def iter_data_set_chunks(file_name, rec_id_col, use_attr_list, header_line,
+                         chunk_size=100000, dup_rec_id_list=None):
+  """Read the data set in chunks and yield one dictionary of records (with
+     the same format as returned by load_data_set()) per chunk, so that data
+     sets larger than the available memory can be processed.
+
+     Parameter Description:
+       file_name       : Name of the data file to be read (CSV or CSV.GZ file)
+       rec_id_col      : Record identifier column of the data file
+       use_attr_list   : List of attributes to extract from the file
+       header_line     : Availability of the header line (True of False)
+       chunk_size      : Maximum number of records per chunk
+       dup_rec_id_list : An optional list, to which the identifiers of all
+                         duplicate records are appended
+
+     Only the set of record identifiers seen so far is kept across chunks.
+     As earlier chunks might already have been processed, a record with an
+     identifier that was seen before is not yielded again (unlike in
+     load_data_set() where the last record with an identifier is kept), but
+     it is reported at the end of reading.
+  """
+
+  if (file_name.endswith('gz')):
+    in_f = gzip.open(file_name, 'rt')
+  else:
+    in_f = open(file_name)
+
+  csv_reader = csv.reader(in_f)
+
+  if (header_line == True):
+    header_list = next(csv_reader)
+
+  if (dup_rec_id_list is None):
+    dup_rec_id_list = []
+
+  use_attr_set = set(use_attr_list)
+
+  rec_num =    0
+  rec_id_set = set()  # Identifiers of all records read so far
+  rec_dict =   {}     # Records of the current chunk
+
+  try:
+    for rec_list in csv_reader:
+      rec_num += 1
+
+      rec_id = rec_list[rec_id_col].strip().lower()
+
+      if (rec_id in rec_id_set):
+        dup_rec_id_list.append(rec_id)
+        continue
+
+      rec_id_set.add(rec_id)
+
+      rec_val_list = []  # One value list per record
+
+      for attr_id in range(len(rec_list)):
+        if attr_id in use_attr_set:
+          rec_val_list.append(rec_list[attr_id].strip().lower())
+        else:
+          rec_val_list.append('')
+
+      rec_dict[rec_id] = rec_val_list
+
+      if (len(rec_dict) >= chunk_size):
+        yield rec_dict
+        rec_dict = {}
+
+    if (len(rec_dict) > 0):
+      yield rec_dict
+
+  finally:
+    in_f.close()
+
+  if (len(rec_id_set) < rec_num):
+    print('  *** Warning, data set contains %d duplicates ***' % \
+          (rec_num - len(rec_id_set)))
+    print('       %d unique records' % (len(rec_id_set)))
+    print('       Duplicate record identifiers: %s' % \
+          (_dup_rec_id_str(dup_rec_id_list)))
+
+# -----------------------------------------------------------------------------
+
+def _dup_rec_id_str(dup_rec_id_list, max_num_ids=10):
+  """Return a string with (at most the given number of) the given duplicate
+     record identifiers, for printing.
+  """
+
+  dup_rec_id_str = ', '.join(dup_rec_id_list[:max_num_ids])
+
+  if (len(dup_rec_id_list) > max_num_ids):
+    dup_rec_id_str += ', ... (%d more)' % (len(dup_rec_id_list) - max_num_ids)
+
+  return dup_rec_id_str
+
+# =============================================================================
+# Column based storage of a data set
+
+class StringColumn:
+  """A column of string values stored as one UTF-8 encoded byte buffer and an
+     array of offsets into this buffer (value i is stored between offsets i
+     and i+1). This needs much less memory than one string object per value.
+
+     The buffer can be any bytes-like object that returns bytes when sliced
+     (for example a memory mapped file).
+  """
+
+  def __init__(self, buf, offsets):
+    self.buf =     buf
+    self.offsets = offsets
+
+  @classmethod
+  def from_values(cls, val_list):
+    """Build a column from the given list of string values.
+    """
+
+    offsets =   array.array('Q', [0])
+    byte_list = []
+    pos =       0
+
+    for val in val_list:
+      val_bytes = val.encode('utf-8')
+      byte_list.append(val_bytes)
+      pos += len(val_bytes)
+      offsets.append(pos)
+
+    return cls(b''.join(byte_list), offsets)
+
+  def __len__(self):
+    return len(self.offsets) - 1
+
+  def __getitem__(self, row):
+    offsets = self.offsets
+    return self.buf[offsets[row]:offsets[row+1]].decode('utf-8')
+
+  def __iter__(self):
+    offsets = self.offsets
+    num_values = len(self)
+
+    buf_str = self.buf[offsets[0]:offsets[num_values]].decode('utf-8')
+
+    if (len(buf_str) == offsets[num_values] - offsets[0]):  # Only ASCII
+      start = offsets[0]                                   # characters
+      for row in range(num_values):
+        yield buf_str[offsets[row]-start:offsets[row+1]-start]
+
+    else:
+      for row in range(num_values):
+        yield self[row]
+
+# -----------------------------------------------------------------------------
+
+class ValueTable:
+  """A table of the distinct values of an attribute, which assigns an integer
+     code to each value. The empty value always has code 0. The same table
+     can be shared by the columns of several data sets, so equal values have
+     equal codes in all of them.
+  """
+
+  def __init__(self):
+    self.value_list = ['']    # Values with their codes as list positions
+    self.code_dict =  {'': 0}  # Values as keys and their codes as values
+
+  def encode(self, val):
+    """Return the code of the given value, adding the value to the table if
+       it is not in there yet.
+    """
+
+    code = self.code_dict.get(val)
+
+    if (code is None):
+      code = len(self.value_list)
+      self.code_dict[val] = code
+      self.value_list.append(val)
+
+    return code
+
+  def __len__(self):
+    return len(self.value_list)
+
+# -----------------------------------------------------------------------------
+
+class CodedColumn:
+  """A column of dictionary encoded values, stored as an array of integer
+     codes into a value table (see ValueTable).
+  """
+
+  def __init__(self, codes, value_table):
+    self.codes =       codes
+    self.value_table = value_table
+
+  @classmethod
+  def from_values(cls, val_list, value_table):
+    """Build a column from the given list of string values, encoding them
+       with (and adding new values to) the given value table.
+    """
+
+    encode = value_table.encode
+
+    return cls(array.array('I', [encode(val) for val in val_list]),
+               value_table)
+
+  def __len__(self):
+    return len(self.codes)
+
+  def __getitem__(self, row):
+    return self.value_table.value_list[self.codes[row]]
+
+  def __iter__(self):
+    value_list = self.value_table.value_list
+    for code in self.codes:
+      yield value_list[code]
+
+# -----------------------------------------------------------------------------
+
+class RecordView(collections.abc.Sequence):
+  """A light-weight view of one record (row) of a column store that can be
+     indexed by attribute number like the list of values of a record in the
+     dictionary returned by load_data_set(). Attributes that were not loaded
+     have the value ''.
+  """
+
+  __slots__ = ('store', 'row')
+
+  def __init__(self, store, row):
+    self.store = store
+    self.row =   row
+
+  def __len__(self):
+    return self.store.num_attrs
+
+  def __getitem__(self, attr_num):
+    num_attrs = self.store.num_attrs
+
+    if isinstance(attr_num, slice):  # A list of values as for a record list
+      return [self.store.value(self.row, i) for i in \
+              range(*attr_num.indices(num_attrs))]
+
+    if (attr_num < -num_attrs) or (attr_num >= num_attrs):
+      raise IndexError(attr_num)
+    if (attr_num < 0):
+      attr_num += num_attrs
+
+    return self.store.value(self.row, attr_num)
+
+  def __eq__(self, other):
+    return list(self) == list(other)
+
+  def __repr__(self):
+    return repr(list(self))
+
+# -----------------------------------------------------------------------------
+
+class ColumnStore(collections.abc.Mapping):
+  """A data set stored column-wise, with one column per used attribute, the
+     record identifiers in their own column, and an index from record
+     identifiers to (integer) row numbers.
+
+     The store can be used wherever a dictionary of records (as returned by
+     load_data_set()) is expected: indexing it with a record identifier
+     returns a RecordView of that record.
+
+     The index from record identifiers to row numbers is only built when a
+     record is first looked up, so a store whose columns are mapped from a
+     cache file (see datasetCache) is created without processing its rows.
+
+     Parameter Description:
+       rec_id_column : Column with the record identifier of each row
+       column_dict   : Dictionary with attribute numbers as keys and the
+                       columns of the used attributes as values
+       num_attrs     : Number of attributes (values) of each record
+  """
+
+  def __init__(self, rec_id_column, column_dict, num_attrs):
+    self.rec_id_column = rec_id_column
+    self.column_dict =   column_dict
+    self.num_attrs =     num_attrs
+
+    self._row_index = None  # Built when first used (see row_index)
+
+  @property
+  def row_index(self):
+    """Dictionary with the record identifiers as keys and their row numbers
+       as values.
+    """
+
+    if (self._row_index is None):
+      self._row_index = dict((rec_id, row) for (row, rec_id) in \
+                             enumerate(self.rec_id_column))
+
+    return self._row_index
+
+  def row(self, rec_id):
+    """Return the row number of the record with the given identifier.
+    """
+
+    return self.row_index[rec_id]
+
+  def rec_id(self, row):
+    """Return the record identifier of the given row.
+    """
+
+    return self.rec_id_column[row]
+
+  def column(self, attr_num):
+    """Return the column of the given attribute, or None if the attribute
+       was not loaded.
+    """
+
+    return self.column_dict.get(attr_num)
+
+  def value(self, row, attr_num):
+    """Return the value of the given attribute in the given row.
+    """
+
+    column = self.column_dict.get(attr_num)
+
+    if (column is None):
+      return ''
+    return column[row]
+
+  def to_dict(self):
+    """Return the data set as a dictionary of records in the format returned
+       by load_data_set().
+    """
+
+    return dict((rec_id, list(RecordView(self, row))) for (row, rec_id) in \
+                enumerate(self.rec_id_column))
+
+  def __getitem__(self, rec_id):
+    return RecordView(self, self.row_index[rec_id])
+
+  def __iter__(self):
+    return iter(self.rec_id_column)
+
+  def __len__(self):
+    return len(self.rec_id_column)
+
+  def __contains__(self, rec_id):
+    return rec_id in self.row_index
+
+# -----------------------------------------------------------------------------
+
+def encode_columns(rec_store, encode_attr_list, value_table_dict=None):
+  """Replace the columns of the given attributes in the given column store
+     with dictionary encoded columns (see CodedColumn). This is useful for
+     attributes with few distinct values, such as gender, state or postcode.
+
+     Parameter Description:
+       rec_store        : The column store
+       encode_attr_list : List of attributes to encode
+       value_table_dict : Dictionary with attribute numbers as keys and value
+                          tables as values. Missing value tables are created
+                          and added, so the same dictionary can be passed
+                          when encoding another data set to share the tables.
+
+     This function returns the dictionary of value tables.
+  """
+
+  if (value_table_dict is None):
+    value_table_dict = {}
+
+  for attr_id in encode_attr_list:
+    column = rec_store.column_dict.get(attr_id)
+
+    if (column is None) or isinstance(column, CodedColumn):
+      continue
+
+    if (attr_id not in value_table_dict):
+      value_table_dict[attr_id] = ValueTable()
+
+    rec_store.column_dict[attr_id] = \
+                CodedColumn.from_values(column, value_table_dict[attr_id])
+
+  return value_table_dict
+
+# -----------------------------------------------------------------------------
+
+def load_column_store(file_name, rec_id_col, use_attr_list, header_line,
+                      encode_attr_list=None, value_table_dict=None):
+  """Load the data set and store in memory as a column store, with one
+     compact column for each attribute to be used.
+
+     Parameter Description:
+       file_name        : Name of the data file to be read (CSV or CSV.GZ
+                          file)
+       rec_id_col       : Record identifier column of the data file
+       use_attr_list    : List of attributes to extract from the file
+       header_line      : Availability of the header line (True of False)
+       encode_attr_list : Optional list of attributes to dictionary encode
+                          (see encode_columns())
+       value_table_dict : Optional dictionary of value tables to use for the
+                          encoded attributes (see encode_columns())
+
+     If a record identifier occurs more than once the values of its last
+     occurrence are kept (as done by load_data_set()).
+  """
+
+  if (file_name.endswith('gz')):
+    in_f = gzip.open(file_name, 'rt')
+  else:
+    in_f = open(file_name)
+
+  csv_reader = csv.reader(in_f)
+
+  num_attrs = None
+
+  if (header_line == True):
+    header_list = next(csv_reader)
+    num_attrs = len(header_list)
+
+  use_attr_list = sorted(set(use_attr_list))
+
+  rec_num =    0
+  row_index =  {}
+  rec_id_list = []
+
+  dup_rec_id_list = []  # Identifiers that occur more than once
+  val_lists =  dict((attr_id, []) for attr_id in use_attr_list)
+
+  # Iterate through the record in the file
+  #
+  for rec_list in csv_reader:
+    rec_num += 1
+
+    if (num_attrs is None):
+      num_attrs = len(rec_list)
+
+    # Get the record identifier
+    #
+    rec_id = rec_list[rec_id_col].strip().lower()
+
+    row = row_index.get(rec_id)
+
+    if (row is None):  # A new record
+      row = len(rec_id_list)
+      row_index[rec_id] = row
+      rec_id_list.append(rec_id)
+
+      for attr_id in use_attr_list:
+        if (attr_id < len(rec_list)):
+          val_lists[attr_id].append(rec_list[attr_id].strip().lower())
+        else:
+          val_lists[attr_id].append('')
+
+    else:  # Duplicate, overwrite values of earlier record
+      dup_rec_id_list.append(rec_id)
+
+      for attr_id in use_attr_list:
+        if (attr_id < len(rec_list)):
+          val_lists[attr_id][row] = rec_list[attr_id].strip().lower()
+        else:
+          val_lists[attr_id][row] = ''
+
+  in_f.close()
+
+  if (len(rec_id_list) < rec_num):
+    print('  *** Warning, data set contains %d duplicates ***' % \
+          (rec_num - len(rec_id_list)))
+    print('       %d unique records' % (len(rec_id_list)))
+    print('       Duplicate record identifiers: %s' % \
+          (_dup_rec_id_str(dup_rec_id_list)))
+
+  if (encode_attr_list is None):
+    encode_attr_list = []
+
+  if (value_table_dict is None):
+    value_table_dict = {}
+
+  column_dict = {}
+  for attr_id in use_attr_list:
+    if (attr_id in encode_attr_list):
+      if (attr_id not in value_table_dict):
+        value_table_dict[attr_id] = ValueTable()
+
+      column_dict[attr_id] = CodedColumn.from_values(val_lists[attr_id],
+                                                     value_table_dict[attr_id])
+    else:
+      column_dict[attr_id] = StringColumn.from_values(val_lists[attr_id])
+
+    val_lists[attr_id] = None  # Free the value list once it is compacted
+
+  return ColumnStore(StringColumn.from_values(rec_id_list), column_dict,
+                     num_attrs or 0)
+
+# -----------------------------------------------------------------------------
+
 def load_truth_data(file_name):
   """Load a truth data file where each line contains two record identifiers
      where the corresponding record pair is a true match.
@@ -20,6 +20,7 @@
 import time
 
 import loadDataset
+import datasetCache
 import blocking
 import comparison
 import classification
@@ -81,8 +82,203 @@ rec_idB_col = 0
 attrA_list = [1, 2, 3, 4, 6, 7, 8, 9, 10, 11, 12]
 attrB_list = [1, 2, 3, 4, 6, 7, 8, 9, 10, 11, 12]
 
+# Set to True to load the datasets into column stores (less memory for large
+# datasets) instead of dictionaries of record value lists
+#
+use_column_store = False
+
+# Set to a directory name to cache the parsed datasets and truth data in
+# binary files, which are loaded much faster than the CSV files (the
+# datasets are then always loaded into column stores)
+#
+cache_dir = None
+
+# Attributes with few distinct values (such as gender, postcode and state) to
+# dictionary encode in column stores, so they are compared on integer codes
+# and each distinct pair of values is only compared once
+#
+encode_attr_list = []  # For example [4, 9, 10]
+
+# Size of the sliding window for sorted neighbourhood blocking
+#
+sn_window_size = 5
+
+# Loose and tight similarity thresholds for canopy clustering blocking
+#
+canopy_loose_thres = 0.5
+canopy_tight_thres = 0.8
+
+# Number of bands and rows per band for MinHash LSH blocking (see
+# blocking.lshBandParameters to select them for a similarity threshold)
+#
+lsh_num_bands = 20
+lsh_num_rows = 5
+
+# Control of oversized blocks after blocking: blocks with more record pairs than
+# max_block_pairs (if not None) are either removed ('drop'), split by the values
+# of the block_split_attrs ('split'), or removed before the candidate pairs of
+# all other blocks are pruned with meta-blocking ('meta')
+#
+max_block_pairs = None
+block_limit_method = 'drop'
+block_split_attrs = [1]
+meta_weight_scheme = 'cbs'
+
+# Set to True to calculate the blocking key components of each attribute only
+# once per session for attribute ('attr') and Soundex ('soundex') blocking,
+# which makes trying many combinations of blocking attributes much faster. The
+# Soundex blocks are the same, but the values of 'attr' blocking are not
+# concatenated (see blocking.BlockingKeyCache), which can change its candidate
+# pairs compared to runs without the cache
+#
+cache_blocking_keys = False
+
+# Blocking configurations are rejected before any record pairs are compared if
+# their blocks contain more than max_candidate_pairs candidate pairs, or if their
+# pairs completeness is below min_pairs_completeness (if not None), so that the
+# parameter tuning quickly skips configurations that are too slow or too poor
+#
+max_candidate_pairs = None  # For example 5000000
+min_pairs_completeness = None
+
+# Number of worker processes used to compare the candidate record pairs (with 1
+# all pairs are compared in the main process)
+#
+num_comparison_workers = 1  # For example os.cpu_count()
 
-def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocking_attrs, func_list, save = False):
+# Set to True to compare, classify and evaluate the candidate record pairs in
+# batches of comparison_batch_size pairs, so the similarity vectors of all pairs
+# are never kept in memory together (not possible for the decision tree
+# classifier 'dt', which learns from all pairs)
+#
+stream_comparison = False
+comparison_batch_size = 10000
+
+# Set to True to return the similarities of the compared record pairs as a numpy
+# matrix (see comparison.SimMatrix) instead of a dictionary, which needs much less
+# memory and is classified faster. Similarities are stored as 'float64' values, or
+# to save more memory as 'float32' values or quantised into 'uint8' values (0 to
+# 255), which can change the classification of pairs close to the thresholds
+#
+sim_matrix_output = False
+sim_matrix_dtype = 'float64'
+
+# Maximum number of similarities of compared attribute value pairs kept in a
+# cache shared by all runs of a session (see comparison.ComparisonCache), so that
+# value pairs that occur again are not compared again. The hit rate of the cache
+# is added to the results. None disables the cache (it is not used by parallel
+# comparison)
+#
+comparison_cache_size = None  # For example 1000000
+
+# Set to True to give the classification threshold of the minimum threshold
+# ('minsim') and exact ('exact') classifiers to the comparison functions, which
+# then stop comparing attribute values as soon as their similarity cannot reach
+# the threshold. The classification is not changed, but similarities below the
+# threshold are not exact
+#
+bounded_comparison = False
+
+# Set to True to compare the attributes of the candidate pairs one after the
+# other, and to skip the remaining attributes of a pair as soon as its
+# classification by the 'exact', 'minsim', 'simthresh' or 'weightsim' classifier
+# is decided (see comparison.CascadedComparison). The attributes are compared in
+# the order given by cascade_attr_order (positions in the list of comparison
+# functions), or if None cheap comparison functions first. The classification
+# is not changed, but similarities of skipped attributes are 0.0
+#
+cascaded_comparison = False
+cascade_attr_order = None  # For example [5, 4, 3, 0, 1, 2]
+
+# Blocking passes used by the 'multi' blocking function, as a list of tuples
+# (blocking function, list of blocking attributes). The candidate record pairs
+# of all passes are combined, and each pair is only compared once
+#
+blocking_passes = [('soundex', [3]),
+                   ('slk', []),
+                   ('attr', [9, 1])]
+
+
+def load_data():
+    """Load the two datasets and the truth data as configured above, and return
+    a tuple (records of dataset A, records of dataset B, set of true matches).
+    """
+
+    if cache_dir is not None:
+        recA_dict = datasetCache.load_data_set_cached(datasetA_name, rec_idA_col, attrA_list,
+                                                      headerA_line, cache_dir)
+        recB_dict = datasetCache.load_data_set_cached(datasetB_name, rec_idB_col, attrB_list,
+                                                      headerB_line, cache_dir)
+
+        # Load data set of true matching pairs
+        #
+        true_match_set = datasetCache.load_truth_data_cached(truthfile_name, cache_dir)
+
+        value_table_dict = loadDataset.encode_columns(recA_dict, encode_attr_list)
+        loadDataset.encode_columns(recB_dict, encode_attr_list, value_table_dict)
+
+    else:
+        if use_column_store:
+            value_table_dict = {}  # Shared by both datasets
+
+            recA_dict = loadDataset.load_column_store(datasetA_name, rec_idA_col, attrA_list,
+                                                      headerA_line, encode_attr_list,
+                                                      value_table_dict)
+            recB_dict = loadDataset.load_column_store(datasetB_name, rec_idB_col, attrB_list,
+                                                      headerB_line, encode_attr_list,
+                                                      value_table_dict)
+        else:
+            recA_dict = loadDataset.load_data_set(datasetA_name, rec_idA_col, attrA_list,
+                                                  headerA_line)
+            recB_dict = loadDataset.load_data_set(datasetB_name, rec_idB_col, attrB_list,
+                                                  headerB_line)
+
+        # Load data set of true matching pairs
+        #
+        true_match_set = loadDataset.load_truth_data(truthfile_name)
+
+    return recA_dict, recB_dict, true_match_set
+
+
+class LinkageSession:
+    """Holds the loaded datasets and truth data, so that many linkage
+    configurations can be run by main() while the data is only loaded once.
+
+    The loading time is amortised over the planned number of runs of the session,
+    so every run reports the same share of the total loading time and the linkage
+    times of all runs can be compared.
+    """
+
+    def __init__(self, num_planned_runs = 1):
+        start_time = time.time()
+
+        self.recA_dict, self.recB_dict, self.true_match_set = load_data()
+
+        self.loading_time = time.time() - start_time
+        self.num_runs = 0
+        self.num_planned_runs = max(1, num_planned_runs)
+
+        self.blocking_key_cache_dict = {}  # Key caches for value and Soundex blocking
+
+        if comparison_cache_size is None:
+            self.comparison_cache = None
+        else:
+            self.comparison_cache = comparison.ComparisonCache(comparison_cache_size)
+
+    def blocking_key_cache(self, phonetic):
+        """Return the blocking key cache of the session for value (phonetic is False) or
+        Soundex (phonetic is True) based blocking, which is created when first used.
+        """
+
+        if phonetic not in self.blocking_key_cache_dict:
+            self.blocking_key_cache_dict[phonetic] = \
+                blocking.BlockingKeyCache(self.recA_dict, self.recB_dict, phonetic)
+
+        return self.blocking_key_cache_dict[phonetic]
+
+
+def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocking_attrs, func_list, save = False,
+         session = None):
 
     # ******** In lab 3, explore different attribute sets for blocking ************
 
@@ -114,20 +310,21 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
 
     # =============================================================================
     #
-    # Step 1: Load the two datasets from CSV files
+    # Step 1: Load the two datasets from CSV files (unless they have been loaded
+    # before in the given session)
 
-    start_time = time.time()
+    if session is None:
+        session = LinkageSession()
 
-    recA_dict = loadDataset.load_data_set(datasetA_name, rec_idA_col, \
-                                          attrA_list, headerA_line)
-    recB_dict = loadDataset.load_data_set(datasetB_name, rec_idB_col, \
-                                          attrB_list, headerB_line)
+    session.num_runs += 1
 
-    # Load data set of true matching pairs
-    #
-    true_match_set = loadDataset.load_truth_data(truthfile_name)
+    recA_dict = session.recA_dict
+    recB_dict = session.recB_dict
+    true_match_set = session.true_match_set
 
-    loading_time = time.time() - start_time
+    # Loading time is shared equally between all planned runs of the session
+    #
+    loading_time = session.loading_time / session.num_planned_runs
 
     # -----------------------------------------------------------------------------
     # Step 2: Block the datasets
@@ -145,17 +342,46 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
             resultA = blocking.noBlocking(recA_dict)
             resultB = blocking.noBlocking(recB_dict)
 
+        use_key_cache = cache_blocking_keys and (blocking_attrA_list == blocking_attrB_list)
+
         if block_function == 'attr':
             # Simple attribute-based blocking
             #
-            resultA = blocking.simpleBlocking(recA_dict, blocking_attrA_list)
-            resultB = blocking.simpleBlocking(recB_dict, blocking_attrB_list)
+            if use_key_cache:
+                resultA, resultB = session.blocking_key_cache(False).blocks(blocking_attrA_list)
+            else:
+                resultA = blocking.simpleBlocking(recA_dict, blocking_attrA_list)
+                resultB = blocking.simpleBlocking(recB_dict, blocking_attrB_list)
 
         if block_function == 'soundex':
             # Phonetic (Soundex) based blocking
             #
-            resultA = blocking.phoneticBlocking(recA_dict, blocking_attrA_list)
-            resultB = blocking.phoneticBlocking(recB_dict, blocking_attrB_list)
+            if use_key_cache:
+                resultA, resultB = session.blocking_key_cache(True).blocks(blocking_attrA_list)
+            else:
+                resultA = blocking.phoneticBlocking(recA_dict, blocking_attrA_list)
+                resultB = blocking.phoneticBlocking(recB_dict, blocking_attrB_list)
+
+        if block_function == 'sn':
+            # Sorted neighbourhood blocking
+            #
+            resultA, resultB = blocking.sortedNeighbourhoodBlocking(recA_dict, recB_dict,
+                                                                    blocking_attrA_list,
+                                                                    sn_window_size)
+
+        if block_function == 'canopy':
+            # Canopy clustering based blocking
+            #
+            resultA, resultB = blocking.canopyBlocking(recA_dict, recB_dict, blocking_attrA_list,
+                                                       canopy_loose_thres, canopy_tight_thres)
+
+        if block_function == 'lsh':
+            # MinHash locality sensitive hashing based blocking
+            #
+            resultA = blocking.minHashLSHBlocking(recA_dict, blocking_attrA_list,
+                                                  lsh_num_bands, lsh_num_rows)
+            resultB = blocking.minHashLSHBlocking(recB_dict, blocking_attrB_list,
+                                                  lsh_num_bands, lsh_num_rows)
 
         if block_function == 'slk':
             # Statistical linkage key (SLK-581) based blocking
@@ -180,15 +406,135 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
 
         return resultA, resultB, block_time
 
-    blockA_dict, blockB_dict, blocking_time = genericBlock(block_function=blocking_fn)
+    num_duplicate_pairs = 0
+
+    if blocking_fn == 'multi':
+        # Several blocking passes, with duplicate candidate pairs removed
+        #
+        block_pair_list = []
+        blocking_time = 0.0
+
+        for (pass_blocking_fn, pass_blocking_attrs) in blocking_passes:
+            passA_dict, passB_dict, pass_time = genericBlock(block_function=pass_blocking_fn,
+                                                             blocking_attrA_list=pass_blocking_attrs,
+                                                             blocking_attrB_list=pass_blocking_attrs)
+            block_pair_list.append((passA_dict, passB_dict))
+            blocking_time += pass_time
+
+        start_time = time.time()
+
+        blockA_dict, blockB_dict, multi_pass_stats = \
+            blocking.multiPassBlocking(recA_dict, recB_dict, block_pair_list)
+        del block_pair_list
+
+        num_duplicate_pairs = multi_pass_stats['num_pairs_saved']
+        blocking_time += time.time() - start_time
+    else:
+        blockA_dict, blockB_dict, blocking_time = genericBlock(block_function=blocking_fn)
+
+    num_pairs_saved = 0
+
+    if max_block_pairs is not None:
+        start_time = time.time()
+
+        if block_limit_method == 'meta':
+            blockA_dict, blockB_dict, block_limit_stats = \
+                blocking.metaBlocking(blockA_dict, blockB_dict, meta_weight_scheme, max_block_pairs)
+        else:
+            blockA_dict, blockB_dict, block_limit_stats = \
+                blocking.limitBlockSizes(blockA_dict, blockB_dict, max_block_pairs,
+                                         method=block_limit_method, recA_dict=recA_dict,
+                                         recB_dict=recB_dict, split_attr_list=block_split_attrs)
+
+        num_pairs_saved = block_limit_stats['num_pairs_saved']
+        blocking_time += time.time() - start_time
+
+    # Calculate the number of candidate pairs of the blocks without generating the
+    # pairs. The full block statistics (with the pairs completeness, which looks up
+    # the blocks of all true matches) are only needed to reject configurations
+    #
+    if (max_candidate_pairs is None) and (min_pairs_completeness is None):
+        num_candidate_pairs = blocking._numBlockPairs(blockA_dict, blockB_dict)
+        reject_config = False
+    else:
+        block_stats = blocking.blockStatistics(blockA_dict, blockB_dict, true_match_set)
+        num_candidate_pairs = block_stats['num_candidate_pairs']
+
+        reject_config = ((max_candidate_pairs is not None) and \
+                         (num_candidate_pairs > max_candidate_pairs)) or \
+                        ((min_pairs_completeness is not None) and \
+                         (block_stats['pc'] < min_pairs_completeness))
+
+    if reject_config:
+        all_comparisons = len(recA_dict) * len(recB_dict)
+
+        return {'blocking_fn': blocking_fn,
+                'classification_fn': classification_fn,
+                'threshold': threshold,
+                'min_thresh': minthresh,
+                'weight_vec': weightvec,
+                'blocking_attrs': blocking_attrs,
+                'comp_funcs': func_list,
+                'num_candidate_pairs': num_candidate_pairs,
+                'all_comparisons': all_comparisons,
+                'rr': evaluation.reduction_ratio(num_candidate_pairs, all_comparisons),
+                'pc': block_stats['pc'],
+                'pq': block_stats['pq'],
+                'blocking_time': blocking_time,
+                'loading_time': loading_time,
+                'rejected': True}
     # -----------------------------------------------------------------------------
     # Step 3: Compare the candidate pairs
 
+    stream_pairs = stream_comparison and (classification_fn != 'dt')
+
+    comp_cache = session.comparison_cache
+
+    # Lowest similarity of attribute values that can change the classification
+    #
+    if bounded_comparison and classification_fn == 'minsim':
+        min_sim = minthresh
+    elif bounded_comparison and classification_fn == 'exact':
+        min_sim = 1.0
+    else:
+        min_sim = 0.0
+
+    if comp_cache is not None:
+        comp_cache.reset_statistics()  # Only count the lookups of this run
+
+    if cascaded_comparison and classification_fn == 'minsim':
+        cascade = comparison.CascadedComparison(classification_fn, minthresh,
+                                                attr_order=cascade_attr_order)
+    elif cascaded_comparison and classification_fn in ['exact', 'simthresh', 'weightsim']:
+        cascade = comparison.CascadedComparison(classification_fn, threshold, weightvec,
+                                                cascade_attr_order)
+    else:
+        cascade = None
+
     start_time = time.time()
 
-    sim_vec_dict = comparison.compareBlocks(blockA_dict, blockB_dict, \
-                                            recA_dict, recB_dict, \
-                                            approx_comp_funct_list)
+    if stream_pairs:
+        # Record pairs are compared in batches while they are classified (Step 4)
+        #
+        sim_vec_dict = {}
+
+    elif num_comparison_workers > 1:
+        sim_vec_dict = comparison.compareBlocksParallel(blockA_dict, blockB_dict, \
+                                                        recA_dict, recB_dict, \
+                                                        approx_comp_funct_list,
+                                                        num_comparison_workers,
+                                                        min_sim=min_sim, cascade=cascade)
+    else:
+        if sim_matrix_output:
+            comparison_output = 'matrix'
+        else:
+            comparison_output = 'dict'
+
+        sim_vec_dict = comparison.compareBlocks(blockA_dict, blockB_dict, \
+                                                recA_dict, recB_dict, \
+                                                approx_comp_funct_list,
+                                                comparison_output, sim_matrix_dtype,
+                                                comp_cache, min_sim, cascade)
 
     comparison_time = time.time() - start_time
 
@@ -244,7 +590,42 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
 
     threshold = minthresh
 
-    class_match_set, class_nonmatch_set, classification_time = genericClassification(classification_fn)
+    if stream_pairs:
+        batch_evaluation = evaluation.BatchEvaluation(true_match_set,
+                                                      len(recA_dict) * len(recB_dict))
+
+        class_time_list = []
+
+        def classify_batch(batch_sim_vec_dict):
+            batch_match_set, batch_nonmatch_set, batch_class_time = \
+                genericClassification(classification_fn, batch_sim_vec_dict)
+            class_time_list.append(batch_class_time)
+
+            return batch_match_set, batch_nonmatch_set
+
+        # Blocks of these methods can overlap, so make each candidate pair unique
+        #
+        unique_pairs = blocking_fn in ['canopy', 'lsh']
+
+        start_time = time.time()
+
+        sim_batch_iter = comparison.compareBlocksStream(blockA_dict, blockB_dict, recA_dict,
+                                                        recB_dict, approx_comp_funct_list,
+                                                        comparison_batch_size, comp_cache,
+                                                        min_sim, cascade, unique_pairs)
+
+        class_match_set = set()  # Non-matches are only counted
+
+        for (batch_match_set, batch_nonmatch_set) in \
+                classification.classifyBatches(sim_batch_iter, classify_batch):
+            batch_evaluation.add_batch(batch_match_set, batch_nonmatch_set)
+            class_match_set |= batch_match_set
+
+        classification_time = sum(class_time_list)
+        comparison_time += time.time() - start_time - classification_time
+
+    else:
+        class_match_set, class_nonmatch_set, classification_time = genericClassification(classification_fn)
 
     # -----------------------------------------------------------------------------
     # Step 5: Evaluate the classification
@@ -252,31 +633,43 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
     # Initialise dictionary of results
     dict = {}
 
-    # Get the number of record pairs compared
-    #
-    num_comparisons = len(sim_vec_dict)
-
     # Get the number of total record pairs to compared if no blocking used
     #
     all_comparisons = len(recA_dict) * len(recB_dict)
 
-    # Get the list of identifiers of the compared record pairs
-    #
-    cand_rec_id_pair_list = sim_vec_dict.keys()
+    if stream_pairs:
+        # Evaluation is based on the counts of all classified batches
+        #
+        num_comparisons = batch_evaluation.num_comparisons
 
-    # Blocking evaluation
-    #
-    rr = evaluation.reduction_ratio(num_comparisons, all_comparisons)
-    pc = evaluation.pairs_completeness(cand_rec_id_pair_list, true_match_set)
-    pq = evaluation.pairs_quality(cand_rec_id_pair_list, true_match_set)
+        rr = batch_evaluation.reduction_ratio()
+        pc = batch_evaluation.pairs_completeness()
+        pq = batch_evaluation.pairs_quality()
 
+        linkage_result = batch_evaluation.confusion_matrix()
+
+    else:
+        # Get the number of record pairs compared
+        #
+        num_comparisons = len(sim_vec_dict)
+
+        # Get the list of identifiers of the compared record pairs
+        #
+        cand_rec_id_pair_list = sim_vec_dict.keys()
+
+        # Blocking evaluation
+        #
+        rr = evaluation.reduction_ratio(num_comparisons, all_comparisons)
+        pc = evaluation.pairs_completeness(cand_rec_id_pair_list, true_match_set)
+        pq = evaluation.pairs_quality(cand_rec_id_pair_list, true_match_set)
 
-    # Linkage evaluation
-    #
-    linkage_result = evaluation.confusion_matrix(class_match_set,
-                                                 class_nonmatch_set,
-                                                 true_match_set,
-                                                 all_comparisons)
+
+        # Linkage evaluation
+        #
+        linkage_result = evaluation.confusion_matrix(class_match_set,
+                                                     class_nonmatch_set,
+                                                     true_match_set,
+                                                     all_comparisons)
 
     accuracy =    evaluation.accuracy(linkage_result)
     precision =   evaluation.precision(linkage_result)
@@ -303,19 +696,38 @@ def main(blocking_fn, classification_fn, threshold, minthresh, weightvec, blocki
     dict['blocking_attrs'] = blocking_attrs
     dict['comp_funcs'] = func_list
     dict['num_comparisons'] = num_comparisons
+    dict['num_candidate_pairs'] = num_candidate_pairs
     dict['all_comparisons'] = all_comparisons
     # dict['cand_rec_id_pair_list'] = cand_rec_id_pair_list
     dict['rr'] = rr
     dict['pc'] = pc
     dict['pq'] = pq
+    dict['num_pairs_saved'] = num_pairs_saved
+    dict['num_duplicate_pairs'] = num_duplicate_pairs
     dict['blocking_time'] = blocking_time
     # dict['linkage_result'] = linkage_result
     dict['accuracy'] = accuracy
     dict['precision'] = precision
     dict['recall'] = recall
     dict['fmeasure'] = fmeasure
+    dict['loading_time'] = loading_time
+    dict['session_loading_time'] = session.loading_time
     dict['linkage_time'] = linkage_time
 
+    if comp_cache is not None:
+        cache_stats = comp_cache.statistics()
+        dict['comp_cache_hits'] = cache_stats['num_hits']
+        dict['comp_cache_misses'] = cache_stats['num_misses']
+        dict['comp_cache_evictions'] = cache_stats['num_evictions']
+        dict['comp_cache_hit_rate'] = cache_stats['hit_rate']
+
+    if cascade is not None:
+        cascade_stats = cascade.statistics()
+        dict['cascade_compared'] = cascade_stats['num_compared']
+        dict['cascade_skipped'] = cascade_stats['num_skipped']
+        dict['cascade_skip_rate'] = cascade_stats['skip_rate']
+    dict['rejected'] = False
+
     # Save results
     if save:
         saveLinkResult.save_linkage_set('final_results.txt', class_match_set)
@@ -339,12 +751,13 @@ weight_vectors = [[2.0, 1.0, 2.0, 2.0, 2.0, 1.0], [1, 1, 1, 1, 1, 1]]
 results_list = []
 
 def main_iter(block, classif, threshold = 0.5, minthresh = 0.5, weightvec = [1, 1, 1, 1, 1, 1], blocking_attrs = [4,7],
-              func_list = [comparison.exact_comp] * 6, timeout = 60):
+              func_list = [comparison.exact_comp] * 6, timeout = 60, session = None):
     # Set the signal handler and a 5-second alarm
     signal.signal(signal.SIGALRM, handler)
     signal.alarm(timeout)
     try:
-        return main(block, classif, threshold, minthresh, weightvec, blocking_attrs, func_list)
+        return main(block, classif, threshold, minthresh, weightvec, blocking_attrs, func_list,
+                    session = session)
     except TimeOutError:
         return {'blocking_fn': block, 'classification_fn': classif}
     signal.alarm(0)
@@ -379,7 +792,7 @@ def tune_parametres(variables = variables_to_vary, random = False):
     # Set variables for iteration
     if 'blocking' in variables:
         # Excluding no for computational reasons add
-        block_options = ['attr', 'soundex', 'slk']
+        block_options = ['attr', 'soundex', 'slk', 'sn', 'canopy', 'lsh']
     else:
         block_options = ['soundex']
 
@@ -409,56 +822,73 @@ def tune_parametres(variables = variables_to_vary, random = False):
         func_list = [[comparison.bag_dist_sim_comp, comparison.jaro_winkler_comp, comparison.jaro_winkler_comp,
                       comparison.bag_dist_sim_comp, comparison.bag_dist_sim_comp, comparison.bag_dist_sim_comp]]
 
+    # Count the configurations to run, so their share of the loading time is the same
+    num_configs = 0
+    for block_option in block_options:
+        for class_option in class_options:
+            if class_option in ['simthresh', 'minsim']:
+                num_class_configs = len(thresholds)
+            elif class_option == 'weightsim':
+                num_class_configs = len(thresholds) * len(weight_vectors)
+            else:
+                num_class_configs = 1
+            if block_option in ['attr', 'soundex', 'sn', 'canopy', 'lsh']:
+                num_class_configs *= len(blocking_attrs)
+            num_configs += num_class_configs * len(func_list)
+
+    # Load the datasets once for all configurations
+    session = LinkageSession(num_configs)
+
 
     for block_option in block_options:
         for class_option in tqdm(class_options):
             for func in func_list:
-                if block_option == 'attr' or block_option == 'soundex':
+                if block_option in ['attr', 'soundex', 'sn', 'canopy', 'lsh']:
                     # Had to repeat code here, a bit messy
                     for blocking_attr in blocking_attrs:
                         if class_option == 'simthresh':
                             for threshold1 in thresholds:
                                 results_list.append(main_iter(block_option, class_option, threshold1,
-                                                              blocking_attrs = blocking_attr, func_list=func, timeout = TIMEOUT))
+                                                              blocking_attrs = blocking_attr, func_list=func, timeout = TIMEOUT, session = session))
 
                         elif class_option == 'minsim':
                             for threshold1 in thresholds:
                                 results_list.append(main_iter(block_option, class_option, threshold1, minthresh=threshold1,
-                                                              blocking_attrs = blocking_attr, func_list=func, timeout = TIMEOUT))
+                                                              blocking_attrs = blocking_attr, func_list=func, timeout = TIMEOUT, session = session))
 
                         elif class_option == 'weightsim':
                             for threshold1 in thresholds:
                                 for weight_vector in weight_vectors:
                                     results_list.append(main_iter(block_option, class_option, threshold1,
                                                                   weightvec=weight_vector, blocking_attrs = blocking_attr,
-                                                                  func_list=func, timeout = TIMEOUT))
+                                                                  func_list=func, timeout = TIMEOUT, session = session))
 
                         else:
                             results_list.append(main_iter(block_option, class_option, blocking_attrs = blocking_attr,
-                                                          func_list=func, timeout=TIMEOUT))
+                                                          func_list=func, timeout=TIMEOUT, session=session))
                 else:
                     if class_option == 'simthresh':
                         for threshold in thresholds:
                             results_list.append(
                                 main_iter(block_option, class_option, threshold, blocking_attrs=None, func_list=func,
-                                          timeout=TIMEOUT))
+                                          timeout=TIMEOUT, session=session))
 
                     elif class_option == 'minsim':
                         for threshold in thresholds:
                             results_list.append(
                                 main_iter(block_option, class_option, threshold, minthresh=threshold, blocking_attrs=None,
-                                          func_list=func, timeout=TIMEOUT))
+                                          func_list=func, timeout=TIMEOUT, session=session))
 
                     elif class_option == 'weightsim':
                         for threshold in thresholds:
                             for weight_vector in weight_vectors:
                                 results_list.append(
                                     main_iter(block_option, class_option, threshold, weightvec=weight_vector,
-                                              blocking_attrs=None, func_list=func, timeout=TIMEOUT))
+                                              blocking_attrs=None, func_list=func, timeout=TIMEOUT, session=session))
 
                     else:
                         results_list.append(
-                            main_iter(block_option, class_option, blocking_attrs=None, func_list=func, timeout=TIMEOUT))
+                            main_iter(block_option, class_option, blocking_attrs=None, func_list=func, timeout=TIMEOUT, session=session))
 
     return results_list
 
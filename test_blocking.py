@@ -0,0 +1,39 @@
+""" Tests of the blocking module, run with:
+
+      python -m pytest test_blocking.py
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import blocking
+
+# -----------------------------------------------------------------------------
+
+def test_limit_block_sizes_split_keys():
+
+  # The block 'a' is oversized and split by the second attribute, and a split
+  # block must not replace the existing block 'a|b'
+  #
+  blockA_dict = {'a|b': ['a1'], 'a': ['a2', 'a3']}
+  blockB_dict = {'a|b': ['b1'], 'a': ['b2', 'b3']}
+
+  recA_dict = {'a1': ['a', 'x'], 'a2': ['a', 'b'], 'a3': ['a', 'c']}
+  recB_dict = {'b1': ['a', 'y'], 'b2': ['a', 'b'], 'b3': ['a', 'c']}
+
+  (new_blockA_dict, new_blockB_dict, stats_dict) = \
+    blocking.limitBlockSizes(blockA_dict, blockB_dict, max_block_pairs=2,
+                             method='split', recA_dict=recA_dict,
+                             recB_dict=recB_dict, split_attr_list=[1])
+
+  assert new_blockA_dict == {'a|b': ['a1'], ('a', ('b',)): ['a2'],
+                             ('a', ('c',)): ['a3']}
+  assert new_blockB_dict == {'a|b': ['b1'], ('a', ('b',)): ['b2'],
+                             ('a', ('c',)): ['b3']}
+
+  assert stats_dict == {'num_oversized_blocks': 1, 'num_pairs_before': 5,
+                        'num_pairs_after': 3, 'num_pairs_saved': 2}
+
+# -----------------------------------------------------------------------------
+
+# End of program.
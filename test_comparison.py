@@ -0,0 +1,247 @@
+""" Tests of the comparison module, run with:
+
+      python -m pytest test_comparison.py
+
+    The faster implementations of the comparison functions are checked on
+    random values against the original implementations (kept as reference
+    in the benchmark module).
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import functools
+import random
+
+import pytest
+
+import benchmark
+import comparison
+
+NUM_RANDOM_PAIRS = 500  # Number of random value pairs in each test
+
+MIN_SIM_LIST = [0.1, 0.5, 0.8, 0.95, 1.0]  # Minimum similarities to test
+
+# -----------------------------------------------------------------------------
+
+def _random_value(rand, max_len):
+  """Return a random value of at most the given length (mostly much shorter)
+     over a small alphabet (many repeated characters), a medium or a large
+     alphabet.
+  """
+
+  alphabet = rand.choice(['a', 'ab', 'abc ', 'abcdefghijklmnopqrstuvwxyz0123'])
+
+  val_len = rand.randint(0, rand.choice([max_len // 4, max_len // 2, max_len]))
+
+  return ''.join([rand.choice(alphabet) for i in range(val_len)])
+
+def _edited_value(rand, val, max_num_edits=10):
+  """Return the given value with random insertions, deletions,
+     substitutions and transpositions of characters.
+  """
+
+  alphabet = val + 'xyz'
+
+  val = list(val)
+
+  for i in range(rand.randint(0, max_num_edits)):
+    pos = rand.randint(0, len(val))
+    edit = rand.choice(['ins', 'del', 'sub', 'trans'])
+
+    if (edit == 'ins') or (pos == len(val)):
+      val.insert(pos, rand.choice(alphabet))
+    elif (edit == 'del'):
+      del val[pos]
+    elif (edit == 'sub'):
+      val[pos] = rand.choice(alphabet)
+    elif (pos + 1 < len(val)):
+      val[pos], val[pos+1] = val[pos+1], val[pos]
+
+  return ''.join(val)
+
+def _random_value_pairs(num_pairs, seed, max_len):
+  """Return a list of random pairs of values that are likely to be similar,
+     of all lengths up to max_len, including empty values.
+  """
+
+  rand = random.Random(seed)
+
+  pair_list = []
+
+  for pair_num in range(num_pairs):
+    val1 = _random_value(rand, max_len)
+    if (rand.random() < 0.2):
+      val2 = _random_value(rand, max_len)  # Unrelated value
+    else:
+      val2 = _edited_value(rand, val1)
+
+    pair_list.append((val1, val2))
+
+  return pair_list
+
+def _check_bounded_sims(sim_list, ref_sim_list, min_sim, pair_list):
+  """Check that the similarities of a bounded comparison are the reference
+     similarities if these are at least min_sim, and otherwise below min_sim.
+  """
+
+  for (sim, ref_sim, val_pair) in zip(sim_list, ref_sim_list, pair_list):
+    if (ref_sim >= min_sim):
+      assert sim == ref_sim, (val_pair, min_sim)
+    else:
+      assert sim < min_sim, (val_pair, min_sim)
+
+# =============================================================================
+# Edit distance
+
+# Values around the length of the bit vectors of the bit-parallel edit
+# distance, and longer
+#
+EDIT_DIST_MAX_LEN = 2 * comparison.EDIT_DIST_MAX_BIT_LEN + 10
+
+EDIT_DIST_EDGE_PAIR_LIST = [('', ''), ('a', ''), ('', 'a'), ('a', 'a'),
+                            ('a', 'b'), ('ab', 'ba'),
+                            ('a' * 63, 'a' * 64), ('a' * 64, 'a' * 65),
+                            ('a' * 64, 'b' * 64), ('ab' * 32, 'ba' * 32),
+                            ('a' * 65, 'a' * 130), ('ab' * 40, 'b' * 80),
+                            ('abc' * 30, 'abc' * 29 + 'abd')]
+
+@functools.lru_cache(maxsize=None)
+def _edit_dist_pairs(seed):
+  """Return a tuple with a list of value pairs for the edit distance tests
+     and the list of their similarities calculated with the edit matrix
+     (shared by the tests, as the edit matrix is slow for long values).
+  """
+
+  pair_list = EDIT_DIST_EDGE_PAIR_LIST + \
+              _random_value_pairs(NUM_RANDOM_PAIRS, seed, EDIT_DIST_MAX_LEN)
+
+  ref_sim_list = [benchmark._edit_dist_sim_dp(val1, val2) for \
+                  (val1, val2) in pair_list]
+
+  return pair_list, ref_sim_list
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_edit_dist_sim_comp(seed):
+  (pair_list, ref_sim_list) = _edit_dist_pairs(seed)
+
+  for (val_pair, ref_sim) in zip(pair_list, ref_sim_list):
+    assert comparison.edit_dist_sim_comp(val_pair[0], val_pair[1]) == \
+           ref_sim, val_pair
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_edit_dist_sim_comp_batch(seed):
+  (pair_list, ref_sim_list) = _edit_dist_pairs(seed)
+
+  # Repeat values so bit masks are taken from the cache of the batch
+  #
+  pair_list = pair_list + pair_list[:NUM_RANDOM_PAIRS // 2]
+  ref_sim_list = ref_sim_list + ref_sim_list[:NUM_RANDOM_PAIRS // 2]
+
+  val_list1 = [val_pair[0] for val_pair in pair_list]
+  val_list2 = [val_pair[1] for val_pair in pair_list]
+
+  assert comparison.edit_dist_sim_comp_batch(val_list1, val_list2).tolist() \
+         == ref_sim_list
+
+  for min_sim in MIN_SIM_LIST:
+    sim_array = comparison.edit_dist_sim_comp_batch(val_list1, val_list2,
+                                                    min_sim=min_sim)
+    _check_bounded_sims(sim_array.tolist(), ref_sim_list, min_sim, pair_list)
+
+@pytest.mark.parametrize('seed', [1, 2])
+def test_edit_dist_sim_comp_bounded(seed):
+  (pair_list, ref_sim_list) = _edit_dist_pairs(seed)
+
+  for min_sim in [0.0] + MIN_SIM_LIST:
+    sim_list = [comparison.edit_dist_sim_comp_bounded(val1, val2, min_sim) \
+                for (val1, val2) in pair_list]
+    _check_bounded_sims(sim_list, ref_sim_list, min_sim, pair_list)
+
+# =============================================================================
+# Jaro and Jaro-Winkler similarity
+
+JARO_MAX_LEN = 20  # Mostly short values as names
+
+NUM_JARO_PAIRS = 10 * NUM_RANDOM_PAIRS  # Short values are compared quickly
+
+JARO_EDGE_PAIR_LIST = [('', ''), ('a', ''), ('a', 'a'), ('ab', 'ba'),
+                       ('martha', 'marhta'), ('dwayne', 'duane'),
+                       ('dixon', 'dicksonx'), ('aaaa', 'aa'),
+                       ('abab', 'baba'), ('aab', 'aba'),
+                       ('a' + comparison.JARO_MARKER_CHAR, 'a'),
+                       (comparison.JARO_MARKER_CHAR + 'ab', 'ab')]
+
+def _jaro_value_pairs(num_pairs, seed):
+  """Return random value pairs for the Jaro tests, where some values contain
+     the marker character of the original implementation.
+  """
+
+  rand = random.Random(seed)
+
+  pair_list = []
+
+  for (val1, val2) in _random_value_pairs(num_pairs, seed, JARO_MAX_LEN):
+    if (rand.random() < 0.01):
+      val1 += comparison.JARO_MARKER_CHAR
+    if (rand.random() < 0.01):
+      val2 = comparison.JARO_MARKER_CHAR + val2
+    pair_list.append((val1, val2))
+
+  return JARO_EDGE_PAIR_LIST + pair_list
+
+def _ref_sims(ref_comp_funct, pair_list):
+  """Return the pairs of the given list for which the reference comparison
+     function gives a similarity (it fails for some values with the marker
+     character), and their similarities.
+  """
+
+  ref_pair_list = []
+  ref_sim_list = []
+
+  for (val1, val2) in pair_list:
+    try:
+      ref_sim = ref_comp_funct(val1, val2)
+    except IndexError:  # Fewer common characters of the second value
+      continue
+
+    ref_pair_list.append((val1, val2))
+    ref_sim_list.append(ref_sim)
+
+  return ref_pair_list, ref_sim_list
+
+@pytest.mark.parametrize('comp_funct, ref_comp_funct, batch_funct, ' \
+                         'bounded_funct',
+  [(comparison.jaro_comp, benchmark._jaro_comp_slicing,
+    comparison.jaro_comp_batch, comparison.jaro_comp_bounded),
+   (comparison.jaro_winkler_comp, benchmark._jaro_winkler_comp_slicing,
+    comparison.jaro_winkler_comp_batch,
+    comparison.jaro_winkler_comp_bounded)])
+@pytest.mark.parametrize('seed', [1, 2])
+def test_jaro_comp(comp_funct, ref_comp_funct, batch_funct, bounded_funct,
+                   seed):
+  (pair_list, ref_sim_list) = _ref_sims(ref_comp_funct,
+                                        _jaro_value_pairs(NUM_JARO_PAIRS,
+                                                          seed))
+
+  assert len(pair_list) > NUM_JARO_PAIRS // 2
+
+  sim_list = [comp_funct(val1, val2) for (val1, val2) in pair_list]
+  assert sim_list == ref_sim_list
+
+  val_list1 = [val_pair[0] for val_pair in pair_list]
+  val_list2 = [val_pair[1] for val_pair in pair_list]
+
+  assert batch_funct(val_list1, val_list2).tolist() == ref_sim_list
+
+  for min_sim in MIN_SIM_LIST:
+    sim_list = [bounded_funct(val1, val2, min_sim) for (val1, val2) in \
+                pair_list]
+    _check_bounded_sims(sim_list, ref_sim_list, min_sim, pair_list)
+
+    sim_array = batch_funct(val_list1, val_list2, min_sim=min_sim)
+    _check_bounded_sims(sim_array.tolist(), ref_sim_list, min_sim, pair_list)
+
+# -----------------------------------------------------------------------------
+
+# End of program.
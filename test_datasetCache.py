@@ -0,0 +1,174 @@
+""" Tests of the datasetCache module, run with:
+
+      python -m pytest test_datasetCache.py
+
+    They check when a cache file is used and when it is rebuilt because its
+    source file has changed.
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import os
+
+import pytest
+
+import datasetCache
+import loadDataset
+
+DATA_SET_LINE_LIST = ['rec_id,first_name,last_name\n',
+                      'r1,Peter,Christen\n',
+                      'r2,Anna,Smith\n',
+                      'r3,Tom,Jones\n']
+
+# -----------------------------------------------------------------------------
+
+@pytest.fixture
+def data_set(tmp_path, monkeypatch):
+  """Write a small data set into a temporary directory, and return a tuple
+     with the name of its file, the cache directory, and a list that counts
+     the number of times the data set file is parsed.
+  """
+
+  file_name = str(tmp_path / 'data.csv')
+  with open(file_name, 'w') as out_f:
+    out_f.writelines(DATA_SET_LINE_LIST)
+
+  parse_list = []  # One element for each parsing of the data file
+
+  load_column_store = loadDataset.load_column_store
+
+  def counting_load_column_store(*args, **kwargs):
+    parse_list.append(args[0])
+    return load_column_store(*args, **kwargs)
+
+  monkeypatch.setattr(loadDataset, 'load_column_store',
+                      counting_load_column_store)
+
+  return file_name, str(tmp_path / 'cache'), parse_list
+
+def _load(file_name, cache_dir, check_content=False):
+  """Load the test data set with the cache, as a dictionary of records.
+  """
+
+  return datasetCache.load_data_set_cached(file_name, 0, [1, 2], True,
+                                           cache_dir, check_content).to_dict()
+
+def _overwrite_keep_stat(file_name, line_list):
+  """Write the given lines into the file (of the same size as before), and
+     set its modification time back to what it was.
+  """
+
+  file_stat = os.stat(file_name)
+
+  with open(file_name, 'w') as out_f:
+    out_f.writelines(line_list)
+
+  assert os.stat(file_name).st_size == file_stat.st_size
+
+  os.utime(file_name, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+# -----------------------------------------------------------------------------
+
+def test_cache_hit(data_set):
+  (file_name, cache_dir, parse_list) = data_set
+
+  rec_dict = _load(file_name, cache_dir)
+  assert rec_dict == loadDataset.load_data_set(file_name, 0, [1, 2], True)
+  assert len(parse_list) == 1
+
+  assert _load(file_name, cache_dir) == rec_dict
+  assert len(parse_list) == 1  # Loaded from the cache file
+
+def test_cache_miss_after_mtime_change(data_set):
+  (file_name, cache_dir, parse_list) = data_set
+
+  rec_dict = _load(file_name, cache_dir)
+
+  file_stat = os.stat(file_name)
+  os.utime(file_name, ns=(file_stat.st_atime_ns,
+                          file_stat.st_mtime_ns + 10**9))
+
+  assert _load(file_name, cache_dir) == rec_dict
+  assert len(parse_list) == 2
+
+  assert _load(file_name, cache_dir) == rec_dict  # Rebuilt cache is used
+  assert len(parse_list) == 2
+
+def test_cache_miss_after_size_change(data_set):
+  (file_name, cache_dir, parse_list) = data_set
+
+  _load(file_name, cache_dir)
+
+  file_stat = os.stat(file_name)
+  with open(file_name, 'a') as out_f:
+    out_f.write('r4,Mary,Brown\n')
+  os.utime(file_name, ns=(file_stat.st_atime_ns, file_stat.st_mtime_ns))
+
+  rec_dict = _load(file_name, cache_dir)
+  assert len(parse_list) == 2
+  assert rec_dict['r4'] == ['', 'mary', 'brown']
+
+def test_cache_content_change(data_set):
+  (file_name, cache_dir, parse_list) = data_set
+
+  _load(file_name, cache_dir)
+
+  # Same size and modification time, but a different first name
+  #
+  _overwrite_keep_stat(file_name, [line.replace('Anna', 'Anne') for line in \
+                                   DATA_SET_LINE_LIST])
+
+  # Without checking the content the (outdated) cache file is used
+  #
+  assert _load(file_name, cache_dir)['r2'][1] == 'anna'
+  assert len(parse_list) == 1
+
+  rec_dict = _load(file_name, cache_dir, check_content=True)
+  assert rec_dict['r2'][1] == 'anne'
+  assert len(parse_list) == 2
+
+  assert _load(file_name, cache_dir, check_content=True)['r2'][1] == 'anne'
+  assert len(parse_list) == 2
+
+def test_cached_row_index_built_on_lookup(data_set):
+  (file_name, cache_dir, parse_list) = data_set
+
+  _load(file_name, cache_dir)
+
+  rec_store = datasetCache.load_data_set_cached(file_name, 0, [1, 2], True,
+                                                cache_dir)
+  assert len(parse_list) == 1
+
+  assert rec_store._row_index is None  # Not built when loading
+  assert len(rec_store) == 3
+  assert list(rec_store) == ['r1', 'r2', 'r3']
+
+  assert list(rec_store['r3']) == ['', 'tom', 'jones']
+  assert 'r4' not in rec_store
+  assert rec_store._row_index == {'r1': 0, 'r2': 1, 'r3': 2}
+
+def test_truth_data_cache(tmp_path):
+  file_name = str(tmp_path / 'truth.csv')
+  cache_dir = str(tmp_path / 'cache')
+
+  with open(file_name, 'w') as out_f:
+    out_f.write('rec_id1,rec_id2\nr1,s1\nr2,s2\n')
+
+  truth_set = datasetCache.load_truth_data_cached(file_name, cache_dir)
+  assert truth_set == loadDataset.load_truth_data(file_name)
+
+  assert datasetCache.load_truth_data_cached(file_name, cache_dir) == \
+         truth_set
+
+  _overwrite_keep_stat(file_name, ['rec_id1,rec_id2\nr1,s1\nr2,s3\n'])
+
+  assert datasetCache.load_truth_data_cached(file_name, cache_dir) == \
+         truth_set
+  assert datasetCache.load_truth_data_cached(file_name, cache_dir,
+                                             check_content=True) == \
+         loadDataset.load_truth_data(file_name)
+
+# -----------------------------------------------------------------------------
+
+# End of program.
@@ -0,0 +1,59 @@
+""" Tests of the loadDataset module, run with:
+
+      python -m pytest test_loadDataset.py
+
+    They check that the records of a column store behave like the value
+    lists of the records returned by load_data_set().
+"""
+
+# =============================================================================
+# Import necessary modules
+
+import pytest
+
+import loadDataset
+
+# -----------------------------------------------------------------------------
+
+@pytest.fixture
+def rec_pair(tmp_path):
+  """Return a record of a column store and the same record as a list, as
+     loaded by load_data_set().
+  """
+
+  file_name = str(tmp_path / 'data.csv')
+  with open(file_name, 'w') as out_f:
+    out_f.write('rec_id,first_name,last_name,city\n' + \
+                'r1,Peter,Christen,Canberra\n')
+
+  rec_store = loadDataset.load_column_store(file_name, 0, [1, 3], True)
+  rec_dict =  loadDataset.load_data_set(file_name, 0, [1, 3], True)
+
+  return rec_store['r1'], rec_dict['r1']
+
+def test_record_view_index(rec_pair):
+  (rec_view, rec_list) = rec_pair
+
+  assert len(rec_view) == len(rec_list) == 4
+
+  for attr_num in range(-len(rec_list), len(rec_list)):
+    assert rec_view[attr_num] == rec_list[attr_num], attr_num
+
+  for attr_num in [4, 10, -5, -10]:
+    with pytest.raises(IndexError):
+      rec_view[attr_num]
+
+def test_record_view_slice(rec_pair):
+  (rec_view, rec_list) = rec_pair
+
+  for attr_slice in [slice(None), slice(1, 3), slice(-2, None),
+                     slice(None, -1), slice(None, None, 2),
+                     slice(None, None, -1), slice(3, 10), slice(5, 8)]:
+    assert rec_view[attr_slice] == rec_list[attr_slice], attr_slice
+
+  assert list(rec_view) == rec_list
+  assert rec_view.index('canberra') == 3
+
+# -----------------------------------------------------------------------------
+
+# End of program.